@@ -0,0 +1,163 @@
+# admin_server.py - Локальный административный интерфейс (текстовые команды по TCP)
+import asyncio
+import logging
+import shlex
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+import config
+from loop_monitor import loop_monitor
+from profiler import cpu_profiler, memory_profiler
+
+logger = logging.getLogger(__name__)
+
+CommandHandler = Callable[[List[str]], Awaitable[str]]
+
+class AdminServer:
+    """
+    Простейший построчный протокол поверх TCP, слушает только localhost:
+        $ nc 127.0.0.1 8765
+        profile start 30
+        mem snapshot
+    На каждую команду возвращается текстовый ответ, завершённый пустой строкой.
+    """
+
+    def __init__(self, host: str, port: int, token: Optional[str] = None):
+        self.host = host
+        self.port = port
+        self.token = token
+        self.server: Optional[asyncio.AbstractServer] = None
+        self.commands: Dict[str, Tuple[CommandHandler, str]] = {}
+        self._register_builtin_commands()
+
+    def register(self, name: str, handler: CommandHandler, help_text: str = ""):
+        """Регистрирует команду (другие модули добавляют свои)"""
+        self.commands[name] = (handler, help_text)
+
+    async def start(self):
+        if self.server:
+            return
+        self.server = await asyncio.start_server(self._handle_client, self.host, self.port)
+        logger.info(f"🛠️ Админ-интерфейс слушает {self.host}:{self.port}")
+
+    async def close(self):
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+
+    async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        peer = writer.get_extra_info('peername')
+        authorized = not self.token
+        logger.info(f"🛠️ Админ подключился: {peer}")
+
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+
+                try:
+                    args = shlex.split(line.decode('utf-8').strip())
+                except ValueError as e:
+                    await self._reply(writer, f"ошибка разбора: {e}")
+                    continue
+
+                if not args:
+                    continue
+
+                if not authorized:
+                    if args[0] == 'auth' and len(args) == 2 and args[1] == self.token:
+                        authorized = True
+                        await self._reply(writer, "ok")
+                    else:
+                        await self._reply(writer, "нужна авторизация: auth <token>")
+                    continue
+
+                if args[0] in ('quit', 'exit'):
+                    break
+
+                await self._reply(writer, await self.execute(args))
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+            logger.info(f"🛠️ Админ отключился: {peer}")
+
+    async def execute(self, args: List[str]) -> str:
+        """Выполняет команду и возвращает текстовый ответ"""
+        name = args[0]
+        if name not in self.commands:
+            return f"неизвестная команда: {name} (см. help)"
+
+        handler, _ = self.commands[name]
+        try:
+            return await handler(args[1:])
+        except Exception as e:
+            logger.error(f"Ошибка админ-команды {' '.join(args)}: {e}")
+            return f"ошибка: {e}"
+
+    async def _reply(self, writer: asyncio.StreamWriter, text: str):
+        writer.write((text.rstrip('\n') + "\n\n").encode('utf-8'))
+        await writer.drain()
+
+    def _register_builtin_commands(self):
+        self.register('help', self._cmd_help, "список команд")
+        self.register('profile', self._cmd_profile,
+                      "profile start [сек] | profile stop | profile status - CPU профайлер")
+        self.register('mem', self._cmd_mem,
+                      "mem start | mem snapshot | mem top [N] | mem diff [N] | mem flame | mem stop - tracemalloc")
+        self.register('loop', self._cmd_loop, "задержка цикла событий и блокировки")
+
+    async def _cmd_help(self, args: List[str]) -> str:
+        return "\n".join(f"{name} - {help_text}" for name, (_, help_text) in sorted(self.commands.items()))
+
+    async def _cmd_profile(self, args: List[str]) -> str:
+        action = args[0] if args else 'status'
+
+        if action == 'start':
+            duration = float(args[1]) if len(args) > 1 else config.PROFILER_DEFAULT_DURATION
+            cpu_profiler.start(duration)
+            return f"профайлер запущен на {duration:g}с"
+        elif action == 'stop':
+            path = cpu_profiler.stop()
+            return f"профиль: {path}" if path else "профайлер не запускался"
+        elif action == 'status':
+            return cpu_profiler.status()
+
+        return "использование: profile start [сек] | profile stop | profile status"
+
+    async def _cmd_mem(self, args: List[str]) -> str:
+        # Снимки и их сравнение идут секундами - в потоке, чтобы не держать IRC и планировщик
+        action = args[0] if args else 'top'
+        limit = int(args[1]) if len(args) > 1 else 15
+
+        if action == 'start':
+            memory_profiler.start()
+            return "tracemalloc запущен"
+        elif action == 'stop':
+            memory_profiler.stop()
+            return "tracemalloc остановлен"
+        elif action == 'snapshot':
+            return f"снимок: {await asyncio.to_thread(memory_profiler.take_snapshot)}"
+        elif action == 'top':
+            return "\n".join(await asyncio.to_thread(memory_profiler.top, limit))
+        elif action == 'diff':
+            return "\n".join(await asyncio.to_thread(memory_profiler.diff, limit))
+        elif action == 'flame':
+            return f"рост памяти: {await asyncio.to_thread(memory_profiler.diff_folded)}"
+
+        return "использование: mem start | snapshot | top [N] | diff [N] | flame | stop"
+
+    async def _cmd_loop(self, args: List[str]) -> str:
+        stats = loop_monitor.get_stats()
+        lines = [f"{key}: {value}" for key, value in stats.items() if key != 'top_stages']
+        for stage, count in stats['top_stages']:
+            lines.append(f"  {stage}: {count}")
+        return "\n".join(lines)
+
+# Глобальный экземпляр админ-интерфейса
+admin_server = AdminServer(
+    host=config.ADMIN_HOST,
+    port=config.ADMIN_PORT,
+    token=config.ADMIN_TOKEN
+)
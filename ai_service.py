@@ -4,12 +4,13 @@ import logging
 import asyncio
 import aiohttp
 import json
-import random
 from typing import Dict, List, Optional, Tuple
 from datetime import datetime
 import config
+from clock import clock
 from context_analyzer import context_analyzer, ContextAnalysis
 from emote_manager import emote_manager
+from lemmatizer import lemmatizer
 
 logger = logging.getLogger(__name__)
 
@@ -87,11 +88,11 @@ class HumanResponseGenerator:
         await self.initialize()
         
         # НОВОЕ: Иногда отвечаем только коротко
-        if not is_mentioned and random.random() < config.SHORT_REACTION_PROBABILITY:
+        if not is_mentioned and clock.rng.random() < config.SHORT_REACTION_PROBABILITY:
             return self._generate_short_reaction(context_analysis, energy_level, available_emotes)
         
         # НОВОЕ: Иногда отвечаем только смайликом
-        if not is_mentioned and random.random() < config.EMOJI_ONLY_RESPONSE and available_emotes:
+        if not is_mentioned and clock.rng.random() < config.EMOJI_ONLY_RESPONSE and available_emotes:
             emote = emote_manager.get_random_emote(channel)
             if emote:
                 return (emote, [emote])
@@ -114,7 +115,7 @@ class HumanResponseGenerator:
             raw_response = self._generate_fallback_response(context_analysis, current_message)
         
         # НОВОЕ: Применяем сленг
-        if config.USE_SLANG and random.random() < config.SLANG_PROBABILITY:
+        if config.USE_SLANG and clock.rng.random() < config.SLANG_PROBABILITY:
             raw_response = self._apply_slang(raw_response)
         
         processed_response, used_emotes = self._humanize_response(
@@ -150,12 +151,12 @@ class HumanResponseGenerator:
         elif analysis.emotional_tone in ['sad', 'angry']:
             reactions.extend(['эх', 'жаль', 'грустно', 'печаль'])
         
-        reaction = random.choice(reactions)
+        reaction = clock.rng.choice(reactions)
         
         # Иногда добавляем смайлик
         used_emotes = []
-        if random.random() < 0.4 and emotes:
-            emote = random.choice(emotes[:20])
+        if clock.rng.random() < 0.4 and emotes:
+            emote = clock.rng.choice(emotes[:20])
             reaction = f"{reaction} {emote}"
             used_emotes = [emote]
         
@@ -167,10 +168,12 @@ class HumanResponseGenerator:
         words = text.split()
         for i, word in enumerate(words):
             word_clean = word.lower().rstrip('.,!?')
+            if word_clean and word_clean not in config.INTERNET_SLANG:
+                word_clean = lemmatizer.normal_form(word_clean)  # Другие формы слова из словаря сленга
             
             if word_clean in config.INTERNET_SLANG:
-                if random.random() < 0.6:  # 60% заменяем
-                    slang = random.choice(config.INTERNET_SLANG[word_clean])
+                if clock.rng.random() < 0.6:  # 60% заменяем
+                    slang = clock.rng.choice(config.INTERNET_SLANG[word_clean])
                     # Сохраняем регистр и пунктуацию
                     if word[0].isupper():
                         slang = slang.capitalize()
@@ -190,13 +193,37 @@ class HumanResponseGenerator:
             'author': author,
             'message': message,
             'bot_response': response,
-            'timestamp': datetime.now()
+            'timestamp': clock.now()
         })
         
         # Ограничиваем размер памяти
         if len(self.conversation_memory[channel]) > 20:
             self.conversation_memory[channel] = self.conversation_memory[channel][-20:]
     
+    def export_channel(self, channel: str) -> Dict:
+        """Память диалогов канала для снимка (см. snapshot.py)"""
+        return {
+            'memory': [
+                {**entry, 'timestamp': entry['timestamp'].isoformat()}
+                for entry in self.conversation_memory.get(channel, [])
+            ],
+            'last_response': self.last_responses.get(channel),
+        }
+    
+    def import_channel(self, channel: str, data: Dict):
+        """Восстанавливает память диалогов канала из снимка"""
+        self.conversation_memory[channel] = [
+            {**entry, 'timestamp': datetime.fromisoformat(entry['timestamp'])}
+            for entry in data.get('memory', [])
+        ]
+        if data.get('last_response'):
+            self.last_responses[channel] = data['last_response']
+    
+    def forget_channel(self, channel: str):
+        """Освобождает память канала (канал отключён)"""
+        self.conversation_memory.pop(channel, None)
+        self.last_responses.pop(channel, None)
+    
     def _determine_response_style(
         self,
         analysis: ContextAnalysis,
@@ -389,7 +416,7 @@ class HumanResponseGenerator:
         else:
             responses = ['ага', 'ясн', 'пон', 'хз', 'мб']
         
-        return random.choice(responses)
+        return clock.rng.choice(responses)
     
     def _humanize_response(
         self,
@@ -410,10 +437,10 @@ class HumanResponseGenerator:
         
         # 1. Смайлики
         emote_chance = response_style['emote_frequency']
-        if random.random() < emote_chance and available_emotes:
+        if clock.rng.random() < emote_chance and available_emotes:
             emote = emote_manager.get_random_emote(channel)
             if emote:
-                if random.random() < 0.7:
+                if clock.rng.random() < 0.7:
                     text = f"{text} {emote}"
                 else:
                     text = f"{emote} {text}"
@@ -422,7 +449,7 @@ class HumanResponseGenerator:
         
         # 2. НОВОЕ: Капслок при эмоциях
         caps_chance = response_style.get('caps_chance', 0.02)
-        if random.random() < caps_chance and len(text) > 5:
+        if clock.rng.random() < caps_chance and len(text) > 5:
             # Делаем всё в капслоке
             text = text.upper()
         
@@ -431,16 +458,16 @@ class HumanResponseGenerator:
         if is_mentioned:
             typo_chance *= 0.6
         
-        if random.random() < typo_chance and len(text) > 10:
+        if clock.rng.random() < typo_chance and len(text) > 10:
             text = self._add_realistic_typo(text)
         
         # 4. Запинки
-        if energy_level < 40 and random.random() < config.STUTTER_PROBABILITY:
+        if energy_level < 40 and clock.rng.random() < config.STUTTER_PROBABILITY:
             stutters = ['типа', 'ну', 'это', 'как бы', 'в общем', 'короче', 'вот']
             words = text.split()
             if len(words) > 2:
-                insert_pos = random.randint(0, min(2, len(words)-1))
-                words.insert(insert_pos, random.choice(stutters))
+                insert_pos = clock.rng.randint(0, min(2, len(words)-1))
+                words.insert(insert_pos, clock.rng.choice(stutters))
                 text = ' '.join(words)
         
         # 5. Корректируем регистр
@@ -479,8 +506,8 @@ class HumanResponseGenerator:
             word_clean = word.lower().rstrip('.,!?')
             
             # Проверяем типичные опечатки
-            if word_clean in common_typos and random.random() < 0.4:
-                typo = random.choice(common_typos[word_clean])
+            if word_clean in common_typos and clock.rng.random() < 0.4:
+                typo = clock.rng.choice(common_typos[word_clean])
                 if word[0].isupper():
                     typo = typo.capitalize()
                 if word[-1] in '.,!?':
@@ -492,10 +519,10 @@ class HumanResponseGenerator:
         if words == text.split() and len(words) > 0:
             # Пропускаем букву
             long_words_idx = [i for i, w in enumerate(words) if len(w) > 4]
-            if long_words_idx and random.random() < 0.5:
-                idx = random.choice(long_words_idx)
+            if long_words_idx and clock.rng.random() < 0.5:
+                idx = clock.rng.choice(long_words_idx)
                 word = words[idx]
-                pos = random.randint(1, len(word)-2)
+                pos = clock.rng.randint(1, len(word)-2)
                 words[idx] = word[:pos] + word[pos+1:]
         
         return ' '.join(words)
@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+# analytics.py - Пакетная аналитика чата на NumPy: популярные слова, смайлики, авторы, активность по часам
+"""
+Отчёт по сохранённым чатам:
+
+    python analytics.py data/*.db --since 2024-01-01 --top 20
+    python analytics.py data/channel.db --json
+
+Сообщения читаются из БД пачками. Токены каждой пачки выделяются одной
+регуляркой по склеенному тексту, переводятся в целые id через словарь,
+а частоты считаются np.bincount - без Counter и цикла по сообщениям.
+Те же счётчики (TokenCounter) использует живой агрегатор трендов в database.py.
+"""
+import argparse
+import glob
+import json
+import os
+import sqlite3
+import sys
+from dataclasses import dataclass, field, asdict
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from features import EMOTE_PATTERN, STOP_WORDS, URL_PATTERN, WORD_PATTERN
+from lemmatizer import lemmatizer
+
+class Vocabulary:
+    """Токен <-> целый id (id выдаются по порядку первого появления)"""
+
+    def __init__(self):
+        self.index: Dict[str, int] = {}
+        self.tokens: List[str] = []
+
+    def __len__(self) -> int:
+        return len(self.tokens)
+
+    def add(self, token: str) -> int:
+        token_id = self.index.get(token)
+        if token_id is None:
+            token_id = self.index[token] = len(self.tokens)
+            self.tokens.append(token)
+        return token_id
+
+    def encode(self, tokens: Sequence[str]) -> np.ndarray:
+        for token in dict.fromkeys(tokens):  # Новые токены - по одному разу
+            if token not in self.index:
+                self.add(token)
+        return np.fromiter(map(self.index.__getitem__, tokens), dtype=np.int32, count=len(tokens))
+
+class TokenCounter:
+    """Частоты токенов: словарь и массив счётчиков, индексированный id"""
+
+    def __init__(self):
+        self.vocab = Vocabulary()
+        self.counts = np.zeros(64, dtype=np.int64)
+
+    def __len__(self) -> int:
+        return int(np.count_nonzero(self.counts))
+
+    @property
+    def total(self) -> int:
+        return int(self.counts.sum())
+
+    def update(self, tokens: Sequence[str]):
+        if tokens:
+            self.add_ids(self.vocab.encode(tokens))
+
+    def add_ids(self, ids: np.ndarray, weights: Optional[np.ndarray] = None):
+        """Прибавляет вхождения id (словарь уже должен их знать)"""
+        if ids.size == 0:
+            return
+        if len(self.vocab) > self.counts.size:
+            grown = np.zeros(max(len(self.vocab), self.counts.size * 2), dtype=np.int64)
+            grown[:self.counts.size] = self.counts
+            self.counts = grown
+
+        if ids.size * 8 < self.counts.size:
+            # Пара токенов одного сообщения - bincount по всему словарю был бы дороже
+            np.add.at(self.counts, ids, 1 if weights is None else weights)
+        else:
+            self.counts += np.bincount(ids, weights=weights, minlength=self.counts.size).astype(np.int64)
+
+    def most_common(self, k: int) -> List[Tuple[str, int]]:
+        """Топ k по частоте; при равенстве раньше идёт токен, встреченный первым (как у Counter)"""
+        counts = self.counts[:len(self.vocab)]
+        if k <= 0 or counts.size == 0:
+            return []
+        if k < counts.size:
+            threshold = max(np.partition(counts, counts.size - k)[counts.size - k], 1)
+        else:
+            threshold = 1
+        candidates = np.flatnonzero(counts >= threshold)
+        order = candidates[np.lexsort((candidates, -counts[candidates]))][:k]
+        return [(self.vocab.tokens[i], int(counts[i])) for i in order]
+
+    def items(self) -> List[Tuple[str, int]]:
+        counts = self.counts[:len(self.vocab)]
+        return [(self.vocab.tokens[i], int(counts[i])) for i in np.flatnonzero(counts)]
+
+class WordEncoder:
+    """
+    Слова пачки сообщений -> id нормальных форм.
+    Лемматизируется и фильтруется (стоп-слова, короткие, числа) только каждая
+    новая словоформа; дальше словоформа переводится в id леммы индексированием массива.
+    """
+
+    def __init__(self, lemmas: Vocabulary):
+        self.lemmas = lemmas
+        self.surface = Vocabulary()
+        self._lemma_of_surface = np.zeros(0, dtype=np.int32)  # -1 - незначимое слово
+
+    def encode(self, tokens: Sequence[str]) -> np.ndarray:
+        surface_ids = self.surface.encode(tokens)
+        known = self._lemma_of_surface.size
+        if len(self.surface) > known:
+            new_ids = []
+            for token in self.surface.tokens[known:]:
+                lemma = lemmatizer.normal_form(token)
+                significant = len(lemma) > 2 and lemma not in STOP_WORDS and not lemma.isdigit()
+                new_ids.append(self.lemmas.add(lemma) if significant else -1)
+            self._lemma_of_surface = np.concatenate(
+                [self._lemma_of_surface, np.array(new_ids, dtype=np.int32)]
+            )
+        lemma_ids = self._lemma_of_surface[surface_ids]
+        return lemma_ids[lemma_ids >= 0]
+
+def tokenize_batch(texts: Sequence[str]) -> Tuple[List[str], List[str]]:
+    """Слова (нижний регистр, без ссылок) и смайлики всей пачки - по одному проходу регулярок"""
+    joined = "\n".join(texts)
+    emotes = EMOTE_PATTERN.findall(joined)
+    words = WORD_PATTERN.findall(URL_PATTERN.sub(" ", joined.lower()))
+    return words, emotes
+
+@dataclass
+class ChatReport:
+    message_count: int = 0
+    unique_users: int = 0
+    top_words: List[Tuple[str, int]] = field(default_factory=list)
+    top_emotes: List[Tuple[str, int]] = field(default_factory=list)
+    hourly: List[Tuple[str, int]] = field(default_factory=list)  # ('YYYY-MM-DD HH', сообщений)
+    hour_of_day: List[int] = field(default_factory=lambda: [0] * 24)
+
+class BatchAnalyzer:
+    """Накопитель по пачкам сообщений одного чата (или нескольких - словари общие)"""
+
+    def __init__(self):
+        self.words = TokenCounter()
+        self.emotes = TokenCounter()
+        self.authors = TokenCounter()
+        self.hours = TokenCounter()
+        self.word_encoder = WordEncoder(self.words.vocab)
+        self.message_count = 0
+
+    def add_batch(self, texts: Sequence[str], authors: Optional[Sequence[str]] = None,
+                  timestamps: Optional[Sequence[str]] = None):
+        """Пачка сообщений; timestamps - строки SQLite ('YYYY-MM-DD HH:MM:SS...')"""
+        if not texts:
+            return
+        self.message_count += len(texts)
+
+        words, emotes = tokenize_batch(texts)
+        self.words.add_ids(self.word_encoder.encode(words))
+        self.emotes.update(emotes)
+
+        if authors is not None:
+            self.authors.update(list(authors))
+        if timestamps is not None:
+            # Час - первые 13 символов: срез делает NumPy для всей пачки
+            hours = np.array(timestamps, dtype='U13')
+            unique_hours, counts = np.unique(hours, return_counts=True)
+            self.hours.add_ids(self.hours.vocab.encode(unique_hours.tolist()), weights=counts)
+
+    def report(self, top_n: int = 10) -> ChatReport:
+        hourly = sorted(self.hours.items())
+        hour_of_day = np.zeros(24, dtype=np.int64)
+        if hourly:
+            hour_index = np.array([int(key[11:13]) for key, _ in hourly])
+            np.add.at(hour_of_day, hour_index, np.array([count for _, count in hourly]))
+
+        return ChatReport(
+            message_count=self.message_count,
+            unique_users=len(self.authors),
+            top_words=self.words.most_common(top_n),
+            top_emotes=self.emotes.most_common(top_n),
+            hourly=hourly,
+            hour_of_day=hour_of_day.tolist(),
+        )
+
+def top_words(texts: Sequence[str], top_n: int = 10) -> List[str]:
+    """Популярные нормальные формы слов в сообщениях"""
+    analyzer = BatchAnalyzer()
+    analyzer.add_batch(texts)
+    return [word for word, _ in analyzer.words.most_common(top_n)]
+
+def read_messages(db_path: str, since: Optional[str] = None, until: Optional[str] = None,
+                  chunk_size: int = 50000) -> Iterable[Tuple[List[str], List[str], List[str]]]:
+    """Сообщения зрителей из БД канала пачками (авторы, тексты, время)"""
+    query = "SELECT author, content, timestamp FROM messages WHERE is_bot = 0"
+    params = []
+    if since:
+        query += " AND timestamp >= ?"
+        params.append(since)
+    if until:
+        query += " AND timestamp < ?"
+        params.append(until)
+
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        cursor = conn.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            authors, texts, timestamps = zip(*rows)
+            yield list(authors), list(texts), [str(ts) for ts in timestamps]
+    finally:
+        conn.close()
+
+def analyze_database(db_path: str, since: Optional[str] = None, until: Optional[str] = None,
+                     top_n: int = 10) -> ChatReport:
+    analyzer = BatchAnalyzer()
+    for authors, texts, timestamps in read_messages(db_path, since, until):
+        analyzer.add_batch(texts, authors, timestamps)
+    return analyzer.report(top_n)
+
+def _has_messages_table(db_path: str) -> bool:
+    try:
+        conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+        try:
+            return conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'messages'"
+            ).fetchone() is not None
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        return False
+
+def _print_report(channel: str, report: ChatReport):
+    print("=" * 60)
+    print(f"{channel}: {report.message_count} сообщений, {report.unique_users} авторов")
+    print("=" * 60)
+    print("Слова: " + ", ".join(f"{word} ({count})" for word, count in report.top_words))
+    print("Смайлики: " + ", ".join(f"{emote} ({count})" for emote, count in report.top_emotes))
+    if report.hourly:
+        busiest = max(report.hourly, key=lambda item: item[1])
+        print(f"Часов с сообщениями: {len(report.hourly)}, пик: {busiest[0]}:00 ({busiest[1]})")
+    peak = max(report.hour_of_day) or 1
+    for hour, count in enumerate(report.hour_of_day):
+        if count:
+            print(f"  {hour:02d}:00 {'#' * max(1, round(count / peak * 40))} {count}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Пакетная аналитика сохранённых чатов")
+    parser.add_argument('databases', nargs='+', help="БД каналов (data/*.db)")
+    parser.add_argument('--since', help="С даты/времени (YYYY-MM-DD[ HH:MM])")
+    parser.add_argument('--until', help="До даты/времени (не включая)")
+    parser.add_argument('--top', type=int, default=10)
+    parser.add_argument('--json', action='store_true', help="Вывести отчёт в JSON")
+    args = parser.parse_args()
+
+    lemmatizer.load()  # Скрипт, а не бот: ждём словари, чтобы все слова были в нормальной форме
+    paths = [path for pattern in args.databases for path in sorted(glob.glob(pattern))]
+    reports = {}
+    for path in paths:
+        channel = os.path.splitext(os.path.basename(path))[0]
+        if channel.startswith('_') or not _has_messages_table(path):
+            continue  # snapshots.db, _global.db (общие смайлики) и прочие служебные базы
+        reports[channel] = analyze_database(path, args.since, args.until, args.top)
+
+    if not reports:
+        print("Нет баз каналов с сообщениями", file=sys.stderr)
+        sys.exit(1)
+
+    if args.json:
+        print(json.dumps({channel: asdict(report) for channel, report in reports.items()},
+                         ensure_ascii=False, indent=2))
+        return
+
+    for channel, report in reports.items():
+        _print_report(channel, report)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,493 @@
+#!/usr/bin/env python3
+# bench.py - Микробенчмарки узких мест бота
+"""
+Замеры без Twitch и без сети:
+
+    python bench.py startup --channels 100 --latency 0.05
+    python bench.py lemmatize --source data/channel.db
+    python bench.py lexicon --source data/channel.db
+    python bench.py features --source data/channel.db
+    python bench.py analytics --messages 1000000
+    python bench.py emotes --emotes 5000
+    python bench.py events --channels 200
+"""
+import argparse
+import asyncio
+import glob
+import logging
+import os
+import re
+import sqlite3
+import tempfile
+import time
+
+import config
+import database
+
+def _print_header(title: str):
+    print("=" * 60)
+    print(title)
+    print("=" * 60)
+
+async def _run_startup(channels: int, latency: float, concurrency: int) -> dict:
+    """Старт бота, затем первое сообщение в каждом канале; ждём, пока у всех загрузятся смайлики"""
+    from bot import HumanTwitchBot
+    from emote_manager import emote_manager
+    from profiler import deep_sizeof
+    from scheduler import scheduler
+
+    # HTTP заменён задержкой сети; в каналах есть и общие популярные, и свои смайлики
+    requests = []
+
+    async def fake_get_json(url: str, cached=None):
+        requests.append(url)
+        await asyncio.sleep(latency)
+        validators = {'etag': f'"{url}"', 'last_modified': None}
+        if cached and cached.get('etag') == validators['etag']:
+            return 304, None, validators
+        channel = url.rstrip('/').rsplit('/', 1)[-1]
+        names = [f"Popular{i}" for i in range(30)] + [f"{channel}Emote{i}" for i in range(20)]
+        if 'emotes/global' in url:
+            return 200, [{'code': f"Global{i}"} for i in range(60)], validators
+        if '7tv.io' in url:
+            return 200, {'emote_set': {'emotes': [{'name': name} for name in names]}}, validators
+        if 'betterttv' in url:
+            return 200, {'channelEmotes': [{'code': name} for name in names]}, validators
+        return 200, {'sets': {'1': {'emoticons': [{'name': name} for name in names]}}}, validators
+
+    emote_manager._get_json = fake_get_json
+    emote_manager._global_task = None
+    emote_manager._global_loaded_at = None
+    emote_manager.load_limit = asyncio.Semaphore(concurrency)
+
+    names = [f"channel{i}" for i in range(channels)]
+    config.TWITCH_CHANNELS = names
+
+    emote_manager.cache_stats.clear()
+    started = time.perf_counter()
+    bot = HumanTwitchBot(channels=names)
+    await bot.initialize_services()
+    scheduler.start()
+    services_ready = time.perf_counter() - started
+
+    for name in names:
+        bot._get_channel_state(name)
+    first_reply_possible = time.perf_counter() - started
+
+    while any(state.emote_load_time is None for state in bot.channel_states.values()):
+        await asyncio.sleep(0.005)
+    all_emotes = time.perf_counter() - started
+    memory = deep_sizeof([emote_manager.channel_emotes, emote_manager.emote_sources])
+
+    await bot.close_services()
+    return {
+        'services': services_ready,
+        'channels_ready': first_reply_possible,
+        'all_emotes': all_emotes,
+        'requests': len(requests),
+        'memory': memory,
+        'cache': dict(emote_manager.cache_stats),
+    }
+
+def bench_startup(args):
+    config.TWITCH_TOKEN = config.TWITCH_TOKEN or "oauth:benchmark"
+    config.SNAPSHOT_ENABLED = False
+    config.LOOP_MONITOR_ENABLED = False
+    config.ADMIN_ENABLED = False
+
+    _print_header(f"Старт: {args.channels} каналов, задержка провайдера {args.latency * 1000:.0f}мс")
+    parallel = config.EMOTE_LOAD_CONCURRENCY
+    with tempfile.TemporaryDirectory(prefix="twitch-bench-") as data_dir:
+        # Каждый холодный старт - с пустыми БД; затем перезапуск с кешем смайликов, свежим и устаревшим
+        runs = (("по одному каналу", 1, "serial", False),
+                (f"параллельно ({parallel})", parallel, "parallel", False),
+                ("перезапуск, кеш свежий", parallel, "parallel", False),
+                ("перезапуск, кеш устарел (304)", parallel, "parallel", True))
+        for label, concurrency, subdir, expire_cache in runs:
+            config.DATA_DIR = os.path.join(data_dir, subdir)
+            if expire_cache:
+                for path in glob.glob(os.path.join(config.DATA_DIR, "*.db")):
+                    with sqlite3.connect(path) as conn:
+                        conn.execute("UPDATE emote_cache SET fetched_at = 0")
+                    conn.close()
+            result = asyncio.run(_run_startup(args.channels, args.latency, concurrency))
+            database.close_all()
+            print(f"{label}: сервисы {result['services'] * 1000:.0f}мс, "
+                  f"каналы готовы {result['channels_ready'] * 1000:.0f}мс, "
+                  f"все смайлики {result['all_emotes']:.2f}с, запросов {result['requests']}, "
+                  f"память смайликов {result['memory'] / 1024:.0f} КБ, "
+                  f"кеш {result['cache']}")
+    print(f"Последовательно, как раньше (оценка): {args.channels * 3 * args.latency:.2f}с, "
+          f"запросов {args.channels * 5}")
+
+SAMPLE_CHAT = [
+    "привет всем, как стрим сегодня?",
+    "люблю такие стримы, очень смешно было",
+    "ну это просто ужасно, скучно смотреть",
+    "кто знает когда следующая игра будет",
+    "спасибо за стрим, было круто",
+    "злые комментаторы опять пришли",
+    "стример играет лучше чем вчера",
+    "почему никто не отвечает на вопросы в чате",
+]
+
+def _load_texts(source: str, limit: int):
+    if source:
+        from simulate import load_messages
+        texts = [m['content'] for m in load_messages(source)]
+    else:
+        texts = SAMPLE_CHAT
+    return (texts * (limit // len(texts) + 1))[:limit]
+
+def _load_words(source: str, limit: int):
+    return [word for text in _load_texts(source, limit) for word in re.findall(r'\w+', text.lower())]
+
+def bench_lemmatize(args):
+    from lemmatizer import Lemmatizer
+
+    words = _load_words(args.source, args.limit)
+    _print_header(f"Лемматизация: {len(words)} слов, уникальных {len(set(words))}")
+
+    started = time.perf_counter()
+    lemmatizer = Lemmatizer(cache_size=config.LEMMA_CACHE_SIZE)
+    lemmatizer.load()
+    print(f"Холодный старт (словари pymorphy2): {time.perf_counter() - started:.2f}с")
+    if not lemmatizer.is_loaded:
+        print("pymorphy2 недоступен - лемматизация сводится к lower()")
+
+    uncached = Lemmatizer(cache_size=0)
+    uncached._morph = lemmatizer._morph
+    for label, instance in (("без кеша", uncached), ("первый проход с кешем", lemmatizer),
+                            ("повторный проход с кешем", lemmatizer)):
+        started = time.perf_counter()
+        instance.lemmatize(words)
+        elapsed = time.perf_counter() - started
+        print(f"{label}: {len(words) / elapsed:,.0f} слов/с")
+    print(f"Кеш: {lemmatizer.get_stats()}")
+
+def _scan_by_lists(text: str) -> tuple:
+    """Прежний способ: отдельный проход по каждому списку слов"""
+    from lexicon import POSITIVE_WORDS, NEGATIVE_WORDS, QUESTION_WORDS
+
+    text_lower = text.lower()
+    words = text_lower.split()
+    score = sum(word in text_lower for word in POSITIVE_WORDS) - sum(word in text_lower for word in NEGATIVE_WORDS)
+    is_question = bool(words) and words[0] in QUESTION_WORDS or text_lower.strip().endswith('?')
+    forbidden = [word for word in config.FORBIDDEN_WORDS if word in words]
+    return score, is_question, forbidden
+
+def bench_lexicon(args):
+    from lemmatizer import lemmatizer
+    from lexicon import lexicon
+
+    texts = _load_texts(args.source, args.limit)
+    _print_header(f"Словарь: {len(texts)} сообщений")
+
+    started = time.perf_counter()
+    lemmatizer.load()
+    lexicon.scan("старт")
+    print(f"Сборка автомата (со словарями pymorphy2): {time.perf_counter() - started:.2f}с")
+
+    for label, scan in (("списки слов", _scan_by_lists), ("Ахо-Корасик со словоформами", lexicon.scan)):
+        started = time.perf_counter()
+        for text in texts:
+            scan(text)
+        elapsed = time.perf_counter() - started
+        print(f"{label}: {len(texts) / elapsed:,.0f} сообщ/с")
+
+def _legacy_features(text: str, mention_pattern) -> None:
+    """Прежний разбор: каждый потребитель сам делал lower/split/регулярки/лемматизацию"""
+    from lemmatizer import lemmatizer
+    from lexicon import lexicon
+
+    for _ in range(3):  # event_message, гейт ответа, генерация ответа
+        mention_pattern.search(text)
+    lexicon.scan(text)  # Эмоциональная окраска
+    lexicon.scan(text)  # Вопрос ли это
+    lemmatizer.lemmatize(re.findall(r'\w{3,}', text.lower()))  # Дрейф темы
+    clean = re.sub(r'https?://\S+|www\.\S+|[^\w\s]', ' ', text.lower())  # Тренды: слова
+    lemmatizer.lemmatize(clean.split())
+    for pattern in (r'\b[A-Z][a-z]+[A-Z][a-z]+\b', r'\b[A-Z]{3,}\b'):  # Тренды: смайлики
+        re.findall(pattern, text)
+
+def bench_features(args):
+    from features import extract_features
+    from lemmatizer import lemmatizer
+
+    texts = _load_texts(args.source, args.limit)
+    _print_header(f"Признаки сообщения: {len(texts)} сообщений")
+
+    mention_pattern = re.compile(rf'@{re.escape(config.TWITCH_NICK)}\b', re.IGNORECASE)
+    lemmatizer.load()
+    lemmatizer.lemmatize(word for text in texts for word in re.findall(r'\w+', text.lower()))  # Прогрев кеша
+
+    for label, parse in (("каждый этап сам", _legacy_features), ("MessageFeatures один раз", extract_features)):
+        started = time.process_time()
+        for text in texts:
+            parse(text, mention_pattern)
+        elapsed = time.process_time() - started
+        print(f"{label}: {elapsed / len(texts) * 1e6:.1f} мкс CPU на сообщение")
+
+def bench_analytics(args):
+    from collections import Counter
+    from analytics import BatchAnalyzer
+    from features import EMOTE_PATTERN, extract_features
+    from lemmatizer import lemmatizer
+
+    texts = _load_texts(args.source, args.messages)
+    authors = [f"user{i % 5000}" for i in range(len(texts))]
+    _print_header(f"Аналитика: {len(texts)} сообщений")
+    lemmatizer.load()
+    extract_features("прогрев")
+
+    started = time.perf_counter()
+    words, emotes = Counter(), Counter()
+    for text in texts:
+        words.update(extract_features(text).content_words)
+        emotes.update(EMOTE_PATTERN.findall(text))
+    len(set(authors))
+    words.most_common(10), emotes.most_common(10)
+    per_message = time.perf_counter() - started
+    print(f"по сообщению (Counter): {per_message:.2f}с")
+
+    started = time.perf_counter()
+    analyzer = BatchAnalyzer()
+    for offset in range(0, len(texts), args.chunk):
+        analyzer.add_batch(texts[offset:offset + args.chunk], authors[offset:offset + args.chunk])
+    analyzer.report(10)
+    batch = time.perf_counter() - started
+    print(f"пачками по {args.chunk} (NumPy): {batch:.2f}с, x{per_message / batch:.1f}")
+
+def _legacy_available_emotes(all_emotes, sources, usage, recent, cooldown) -> list:
+    """Прежний get_available_emotes: вес каждого смайлика с поиском по спискам источников"""
+    available = []
+    for emote in all_emotes:
+        if emote in cooldown:
+            continue
+        weight = max(0.1, 1.0 / (usage.get(emote, 0) + 1)) * (0.3 if emote in recent else 1.0)
+        for source, emotes in sources.items():
+            if emote in emotes:
+                weight *= {'7tv': 1.5, 'bttv': 1.3, 'ffz': 1.2}.get(source, 1.0)
+                break
+        if len(emote) <= 6:
+            weight *= 1.2
+        available.append((emote, weight))
+    available.sort(key=lambda x: x[1], reverse=True)
+    return [e for e, _ in available[:50]]
+
+def bench_emotes(args):
+    import random
+    from collections import deque
+    from emote_manager import emote_manager
+
+    rng = random.Random(0)
+    names = [f"emote{i}{'x' * rng.randint(0, 6)}" for i in range(args.emotes)]
+    quarter = len(names) // 4
+    sources = {'7tv': names[:2 * quarter], 'bttv': names[2 * quarter:3 * quarter],
+               'ffz': names[3 * quarter:], 'twitch': emote_manager._get_twitch_emotes()}
+    all_emotes = list(dict.fromkeys(e for emotes in sources.values() for e in emotes))
+    _print_header(f"Смайлики: {len(all_emotes)} в канале, {args.responses} ответов")
+
+    usage, recent = {}, []
+    started = time.perf_counter()
+    for _ in range(args.responses):
+        available = _legacy_available_emotes(all_emotes, sources, usage, recent, {})
+        emote = rng.choice(available[:10])
+        usage[emote] = usage.get(emote, 0) + 1
+        recent = (recent + [emote])[-20:]
+    legacy = (time.perf_counter() - started) / args.responses
+    print(f"пересчёт всех весов: {legacy * 1000:.2f}мс на ответ")
+
+    emote_manager.channel_emotes['bench'] = all_emotes
+    emote_manager.emote_sources['bench'] = sources
+    emote_manager.recent_emotes['bench'] = deque(maxlen=20)
+    emote_manager.emote_cooldown['bench'] = {}
+    started = time.perf_counter()
+    emote_manager._build_index('bench')
+    print(f"построение индекса: {(time.perf_counter() - started) * 1000:.2f}мс")
+
+    started = time.perf_counter()
+    for _ in range(args.responses):
+        emote_manager.get_available_emotes('bench')
+        emote = emote_manager.get_random_emote('bench')
+        emote_manager.mark_emote_used('bench', emote)
+    indexed = (time.perf_counter() - started) / args.responses
+    print(f"индекс (Фенвик): {indexed * 1000:.3f}мс на ответ, x{legacy / indexed:.0f}")
+
+    # Чат: каждое сообщение сверяется с набором канала, окно популярности скользит по времени
+    words = ["ахаха", "ну", "да", "это", "стрим", "лол", "что", "происходит"]
+    messages = [" ".join(rng.choice(words) if rng.random() < 0.7 else rng.choice(all_emotes[:200])
+                         for _ in range(rng.randint(1, 12))) for _ in range(args.responses)]
+    started = time.perf_counter()
+    for text in messages:
+        emote_manager.observe_chat_message('bench', text)
+    tracked = (time.perf_counter() - started) / len(messages)
+    tokens = sum(len(text.split()) for text in messages) / len(messages)
+    print(f"популярность в чате: {tracked * 1000000:.1f}мкс на сообщение (~{tokens:.1f} токенов), "
+          f"в окне {len(emote_manager.chat_usage['bench'])} смайликов")
+    started = time.perf_counter()
+    for _ in range(100):
+        available = emote_manager.get_available_emotes('bench')
+    print(f"доступные смайлики с учётом чата: {(time.perf_counter() - started) * 10:.3f}мс, "
+          f"первые: {', '.join(available[:5])}")
+
+async def _run_emote_events(channels: int, changes: int) -> dict:
+    """Локальная заглушка EventAPI 7TV: приветствие, подписки, изменения наборов и один обрыв"""
+    from aiohttp import WSMsgType, web
+    from emote_events import EmoteEventSubscriber, OP_DISPATCH, OP_HELLO, OP_SUBSCRIBE, EMOTE_SET_UPDATE
+    from emote_manager import emote_manager
+
+    names = [f"channel{i}" for i in range(channels)]
+    for name in names:
+        emote_manager.emote_sources[name] = {'7tv': [f"{name}Emote{i}" for i in range(50)],
+                                             'twitch': emote_manager._get_twitch_emotes()}
+        emote_manager.channel_emotes[name] = list(dict.fromkeys(
+            e for emotes in emote_manager.emote_sources[name].values() for e in emotes))
+        emote_manager.emote_set_ids[name] = {'7tv': f"set-{name}"}
+        emote_manager._build_index(name)
+
+    subscribed = asyncio.Event()
+    connections = []
+
+    async def handler(request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        connections.append(ws)
+        await ws.send_json({'op': OP_HELLO, 'd': {'heartbeat_interval': 25000, 'session_id': 'bench',
+                                                   'subscription_limit': -1}})
+        seen = 0
+        async for message in ws:
+            if message.type == WSMsgType.TEXT and message.json()['op'] == OP_SUBSCRIBE:
+                seen += 1
+                if seen == channels:
+                    subscribed.set()
+        return ws
+
+    app = web.Application()
+    app.router.add_get('/v3', handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+
+    latencies = []  # Применение одного изменения (индекс, списки, запись изменённых строк в БД)
+    rounds = []  # От первой отправки до последнего применённого изменения раунда
+
+    def on_change(channel, source, added, removed, renamed):
+        started = time.perf_counter()
+        applied = emote_manager.apply_emote_changes(channel, source, added, removed, renamed)
+        latencies.append(time.perf_counter() - started)
+        return applied
+
+    subscriber = EmoteEventSubscriber(f"http://127.0.0.1:{port}/v3", on_change)
+    subscriber.start()
+    for name in names:
+        subscriber.subscribe(name, emote_manager.emote_set_ids[name]['7tv'])
+
+    async def push(round_number: int):
+        ws = connections[-1]
+        started = time.perf_counter()
+        for name in names:
+            body = {'id': f"set-{name}",
+                    'pushed': [{'key': 'emotes', 'value': {'name': f"{name}New{round_number}"}}],
+                    'pulled': [{'key': 'emotes', 'old_value': {'name': f"{name}Emote{round_number}"}}],
+                    'updated': [{'key': 'emotes', 'old_value': {'name': f"{name}Emote{round_number + 25}"},
+                                 'value': {'name': f"{name}Alias{round_number}"}}]}
+            await ws.send_json({'op': OP_DISPATCH, 'd': {'type': EMOTE_SET_UPDATE, 'body': body}})
+        while len(latencies) < (round_number + 1) * channels:
+            await asyncio.sleep(0.001)
+        rounds.append(time.perf_counter() - started)
+
+    await asyncio.wait_for(subscribed.wait(), 10)
+    for name in names:
+        database.init_db(name)  # У работающего бота БД каналов уже открыты
+    for round_number in range(changes):
+        if round_number == changes // 2:
+            # Обрыв соединения: подписчик переподключается и подписывается заново
+            subscribed.clear()
+            await connections[-1].close()
+            await asyncio.wait_for(subscribed.wait(), 10)
+        await push(round_number)
+
+    sample = names[0]
+    index = emote_manager.emote_index[sample]
+    consistent = all(
+        f"{sample}New{r}" in index and f"{sample}Emote{r}" not in index and f"{sample}Alias{r}" in index
+        for r in range(changes)
+    ) and len(index) == len(emote_manager.channel_emotes[sample])
+
+    stats = subscriber.get_stats()
+    await subscriber.stop()
+    await runner.cleanup()
+    latencies.sort()
+    return {
+        'applied': len(latencies),
+        'p50': latencies[len(latencies) // 2],
+        'p99': latencies[int(len(latencies) * 0.99)],
+        'round': sum(rounds) / len(rounds),
+        'connects': stats['connects'],
+        'consistent': consistent,
+    }
+
+def bench_events(args):
+    _print_header(f"События 7TV: {args.channels} каналов, {args.changes} изменений на канал")
+    with tempfile.TemporaryDirectory(prefix="twitch-bench-") as data_dir:
+        config.DATA_DIR = data_dir
+        result = asyncio.run(_run_emote_events(args.channels, args.changes))
+        database.close_all()
+    print(f"применено изменений: {result['applied']}, на одно p50 {result['p50'] * 1000:.2f}мс, "
+          f"p99 {result['p99'] * 1000:.2f}мс, раунд по всем каналам {result['round'] * 1000:.0f}мс")
+    print(f"соединений {result['connects']} (один обрыв), "
+          f"индекс совпадает с набором: {'да' if result['consistent'] else 'НЕТ'}")
+    hourly = args.channels * 3 * 24
+    consistency = args.channels * 3 * 24 * 3600 // config.EMOTE_CONSISTENCY_INTERVAL
+    print(f"полные перезагрузки в сутки: {hourly} запросов раз в час -> {consistency} при сверке, "
+          f"новый смайлик виден сразу, а не до часа спустя")
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарки бота")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    startup = subparsers.add_parser('startup', help="время старта и загрузки смайликов")
+    startup.add_argument('--channels', type=int, default=100)
+    startup.add_argument('--latency', type=float, default=0.05, help="задержка одного запроса к API (сек)")
+    startup.set_defaults(func=bench_startup)
+
+    lemmatize = subparsers.add_parser('lemmatize', help="холодный старт и скорость лемматизации")
+    lemmatize.add_argument('--source', help="БД канала или JSONL (по умолчанию - встроенный пример чата)")
+    lemmatize.add_argument('--limit', type=int, default=20000, help="сообщений")
+    lemmatize.set_defaults(func=bench_lemmatize)
+
+    lexicon = subparsers.add_parser('lexicon', help="тональность, вопросы и запрещённые слова")
+    lexicon.add_argument('--source', help="БД канала или JSONL (по умолчанию - встроенный пример чата)")
+    lexicon.add_argument('--limit', type=int, default=20000, help="сообщений")
+    lexicon.set_defaults(func=bench_lexicon)
+
+    features = subparsers.add_parser('features', help="CPU на разбор одного сообщения")
+    features.add_argument('--source', help="БД канала или JSONL (по умолчанию - встроенный пример чата)")
+    features.add_argument('--limit', type=int, default=20000, help="сообщений")
+    features.set_defaults(func=bench_features)
+
+    analytics = subparsers.add_parser('analytics', help="популярные слова и смайлики по истории чата")
+    analytics.add_argument('--source', help="БД канала или JSONL (по умолчанию - встроенный пример чата)")
+    analytics.add_argument('--messages', type=int, default=1000000)
+    analytics.add_argument('--chunk', type=int, default=50000, help="сообщений в пачке")
+    analytics.set_defaults(func=bench_analytics)
+
+    emotes = subparsers.add_parser('emotes', help="выбор смайлика в канале с большим набором")
+    emotes.add_argument('--emotes', type=int, default=5000)
+    emotes.add_argument('--responses', type=int, default=200)
+    emotes.set_defaults(func=bench_emotes)
+
+    events = subparsers.add_parser('events', help="изменения наборов 7TV через локальную заглушку EventAPI")
+    events.add_argument('--channels', type=int, default=200)
+    events.add_argument('--changes', type=int, default=6, help="изменений на канал")
+    events.set_defaults(func=bench_events)
+
+    args = parser.parse_args()
+    logging.disable(logging.INFO)  # bot.py настраивает логирование при импорте
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
@@ -2,20 +2,34 @@
 
 import asyncio
 import datetime
+import json
 import logging
+import os
 import re
-import random
+import time
 from collections import deque, Counter
-import httpx
+from dataclasses import asdict
+from typing import Dict, List, Optional, Tuple
 from twitchio.ext import commands
 from twitchio.message import Message
-import pymorphy2
 
 import config
 import database
-from context_analyzer import context_analyzer
+from clock import clock
+from context_analyzer import context_analyzer, ContextAnalysis
 from emote_manager import emote_manager
+from emote_events import emote_events
 from ai_service import response_generator
+from loop_monitor import loop_monitor
+from admin_server import admin_server
+from work_queue import WorkItem, create_work_queue
+from scheduler import scheduler
+from coordination import create_coordinator
+from send_queue import send_queue, PRIORITY_MENTION, PRIORITY_REPLY, PRIORITY_EXTRA
+from snapshot import snapshot_store
+from profiler import deep_sizeof
+from lemmatizer import lemmatizer
+from features import MessageFeatures, extract_features
 
 logging.basicConfig(
     level=getattr(logging, config.LOG_LEVEL),
@@ -24,14 +38,32 @@ logging.basicConfig(
 )
 
 logger = logging.getLogger(__name__)
-morph = pymorphy2.MorphAnalyzer()
+
+# Максимальный множитель от классификатора: вопрос x1.5, личное x1.3, срочность 5 -> x1.8
+MAX_CLASSIFIER_BOOST = 1.5 * 1.3 * 1.8
+
+def local_message_analysis(features: MessageFeatures) -> dict:
+    """Дешёвый анализ без LLM по признакам сообщения (для сообщений, отсеянных до классификатора)"""
+    if features.sentiment > 0:
+        emotion = 'happy'
+    elif features.sentiment < 0:
+        emotion = 'sad'
+    else:
+        emotion = 'neutral'
+    
+    return {
+        "emotion": emotion,
+        "contains_question": features.is_question,
+        "is_personal": False,
+        "urgency": 1
+    }
 
 class ChannelState:
     """Состояние канала с улучшениями"""
     
     def __init__(self, channel_name: str):
         self.name = channel_name
-        self.last_message_time = datetime.datetime.now()
+        self.last_message_time = clock.now()
         self.last_response_time = datetime.datetime.min
         self.last_analysis_time = datetime.datetime.min
         
@@ -52,6 +84,7 @@ class ChannelState:
         
         # Контекст
         self.last_context_analysis = None
+        self.messages_since_analysis = 0  # Новые сообщения с прошлого анализа
         self.chat_phrases = []
         
         # НОВОЕ: АФК состояние
@@ -61,6 +94,7 @@ class ChannelState:
         
         # НОВОЕ: Счетчик для двойных сообщений
         self.pending_double_message = None
+        self.announce_return = False  # Вернулись из АФК, можно сказать об этом
         
         # Время суток
         self.time_of_day = self._get_time_of_day()
@@ -69,10 +103,16 @@ class ChannelState:
         self.loaded_emotes = []
         self.emote_load_time = None
         
+        self.messages_received = 0  # Всего сообщений из чата (нагрузка для супервизора)
+        
+        # Очередь кандидатов на ответ и её воркер
+        self.work_queue = create_work_queue(channel_name, on_discard=self._on_discarded)
+        self.worker_task = None
+        
         logger.info(f"[{channel_name}] Состояние инициализировано")
     
     def _get_time_of_day(self) -> str:
-        hour = datetime.datetime.now().hour
+        hour = clock.now().hour
         if 0 <= hour < 6:
             return 'night'
         elif 6 <= hour < 12:
@@ -84,7 +124,7 @@ class ChannelState:
     
     def update_energy(self):
         """Обновляет энергию"""
-        hour = datetime.datetime.now().hour
+        hour = clock.now().hour
         
         # Базовая энергия
         if 0 <= hour < 6:
@@ -100,11 +140,11 @@ class ChannelState:
         fatigue = min(30, self.messages_sent_today * 0.5)
         
         # Восстановление
-        time_since_last = (datetime.datetime.now() - self.last_response_time).total_seconds()
+        time_since_last = (clock.now() - self.last_response_time).total_seconds()
         recovery = min(20, time_since_last / 60)
         
         # НОВОЕ: Случайная вариация
-        random_factor = random.uniform(-5, 5)
+        random_factor = clock.rng.uniform(-5, 5)
         
         self.energy = max(15, min(100, base_energy - fatigue + recovery + random_factor))
         
@@ -139,25 +179,34 @@ class ChannelState:
             change += 3
         
         # НОВОЕ: Случайные сдвиги настроения
-        if random.random() < config.RANDOM_MOOD_SHIFT:
-            change += random.randint(-config.MOOD_SHIFT_MAGNITUDE, config.MOOD_SHIFT_MAGNITUDE)
+        if clock.rng.random() < config.RANDOM_MOOD_SHIFT:
+            change += clock.rng.randint(-config.MOOD_SHIFT_MAGNITUDE, config.MOOD_SHIFT_MAGNITUDE)
         
         self.mood = max(config.MOOD_MIN, min(config.MOOD_MAX, self.mood + change))
         
         logger.debug(f"[{self.name}] Настроение: {self.mood} ({emotion}, изменение: {change})")
     
+    def _on_discarded(self, item: WorkItem):
+        """
+        Кандидат выброшен очередью, не дойдя до воркера: настроение всё равно
+        сдвигается - по локальному анализу, без классификатора. Энергия
+        пересчитывается с нуля при следующем обработанном сообщении и по
+        расписанию, копить её за выброшенные сообщения нечего.
+        """
+        self.update_mood(local_message_analysis(item.features), False)
+    
     def go_afk(self):
         """НОВОЕ: Уходит в АФК"""
-        duration = random.randint(config.AFK_DURATION_MIN, config.AFK_DURATION_MAX)
+        duration = clock.rng.randint(config.AFK_DURATION_MIN, config.AFK_DURATION_MAX)
         self.is_afk = True
-        self.afk_until = datetime.datetime.now() + datetime.timedelta(seconds=duration)
+        self.afk_until = clock.now() + datetime.timedelta(seconds=duration)
         reasons = ['отошла', 'сек', 'бреб', 'афк']
-        self.afk_reason = random.choice(reasons)
+        self.afk_reason = clock.rng.choice(reasons)
         logger.info(f"[{self.name}] 🚶 Ушел в АФК на {duration}с")
     
     def check_afk_return(self) -> bool:
         """НОВОЕ: Проверяет возврат из АФК"""
-        if self.is_afk and self.afk_until and datetime.datetime.now() >= self.afk_until:
+        if self.is_afk and self.afk_until and clock.now() >= self.afk_until:
             self.is_afk = False
             self.afk_until = None
             logger.info(f"[{self.name}] 👋 Вернулся из АФК")
@@ -166,78 +215,425 @@ class ChannelState:
     
     def is_busy_time(self) -> bool:
         """Проверяет, не спит ли бот"""
-        hour = datetime.datetime.now().hour
+        hour = clock.now().hour
         
         if 4 <= hour < 8:
-            return random.random() > 0.2
+            return clock.rng.random() > 0.2
         
         return False
+    
+    def to_snapshot(self) -> Dict:
+        """Переживающая перезапуск часть состояния (см. snapshot.py)"""
+        return {
+            'last_message_time': self.last_message_time.isoformat(),
+            'last_response_time': self.last_response_time.isoformat(),
+            'last_analysis_time': self.last_analysis_time.isoformat(),
+            'message_count_since_response': self.message_count_since_response,
+            'messages_sent_today': self.messages_sent_today,
+            'consecutive_responses': self.consecutive_responses,
+            'mood': self.mood,
+            'energy': self.energy,
+            'current_emotion': self.current_emotion,
+            'recent_responses': list(self.recent_responses),
+            'recent_emotes_used': list(self.recent_emotes_used),
+            'current_topics': list(self.current_topics),
+            'last_context_analysis': asdict(self.last_context_analysis) if self.last_context_analysis else None,
+            'chat_phrases': self.chat_phrases,
+            'is_afk': self.is_afk,
+            'afk_until': self.afk_until.isoformat() if self.afk_until else None,
+            'afk_reason': self.afk_reason,
+            'emote_load_time': self.emote_load_time.isoformat() if self.emote_load_time else None,
+        }
+    
+    def restore_snapshot(self, data: Dict):
+        """Восстанавливает состояние из снимка"""
+        parse = datetime.datetime.fromisoformat
+        
+        self.last_message_time = parse(data['last_message_time'])
+        self.last_response_time = parse(data['last_response_time'])
+        self.last_analysis_time = parse(data['last_analysis_time'])
+        self.message_count_since_response = data['message_count_since_response']
+        self.messages_sent_today = data['messages_sent_today']
+        self.consecutive_responses = data['consecutive_responses']
+        self.mood = data['mood']
+        self.energy = data['energy']
+        self.current_emotion = data['current_emotion']
+        self.recent_responses.extend(data['recent_responses'])
+        self.recent_emotes_used.extend(data['recent_emotes_used'])
+        self.current_topics.extend(data['current_topics'])
+        if data.get('last_context_analysis'):
+            self.last_context_analysis = ContextAnalysis(**data['last_context_analysis'])
+        self.chat_phrases = data['chat_phrases']
+        self.is_afk = data['is_afk']
+        self.afk_until = parse(data['afk_until']) if data['afk_until'] else None
+        self.afk_reason = data['afk_reason']
+        self.emote_load_time = parse(data['emote_load_time']) if data['emote_load_time'] else None
 
 
 class HumanTwitchBot(commands.Bot):
     """Максимально человечный Твитч бот"""
     
-    def __init__(self):
+    def __init__(self, channels: Optional[List[str]] = None, worker_id: Optional[int] = None,
+                 metrics_queue=None):
+        channels = list(channels if channels is not None else config.TWITCH_CHANNELS)
+        
+        # С координацией каналы берутся в аренду после подключения (см. coordination.py)
+        self.coordinator = None
+        if config.COORDINATION_ENABLED:
+            self.coordinator = create_coordinator(channels, self.add_channel, self.remove_channel)
+        initial_channels = [] if self.coordinator else channels
+        
         super().__init__(
             token=config.TWITCH_TOKEN,
             nick=config.TWITCH_NICK,
             prefix='!',
-            initial_channels=config.TWITCH_CHANNELS
+            initial_channels=initial_channels
         )
         
+        # Каналы, в которых сидим; состояние, БД и смайлики канала создаются
+        # при первом сообщении (см. _get_channel_state)
+        self.channel_names = set(initial_channels)
         self.channel_states = {}
-        for channel in config.TWITCH_CHANNELS:
-            self.channel_states[channel] = ChannelState(channel)
+        
+        # Режим воркера супервизора (см. supervisor.py)
+        self.worker_id = worker_id
+        self.metrics_queue = metrics_queue
         
         self.total_messages_processed = 0
-        self.start_time = datetime.datetime.now()
+        self.gate_stats = Counter()  # На какой ступени отсеялись сообщения
+        self.blocked_responses = 0  # Сгенерированные ответы с запрещёнными словами
+        self.analysis_cycle_stats = {}
+        self.start_time = clock.now()
+        self.services_ready = False  # Сессии API готовы, можно загружать смайлики
+        self.hibernated_channels = set()  # Каналы, выгруженные из памяти до следующего сообщения
+        self.hibernation_stats = Counter()
+        self.snapshot_writes: Dict[str, Tuple[asyncio.Task, Dict]] = {}  # Снимки, которые ещё пишутся в фоне
         
-        self.url_pattern = re.compile(r'https?://\S+|www\.\S+')
         self.mention_pattern = re.compile(rf'@{re.escape(config.TWITCH_NICK)}\b', re.IGNORECASE)
         
-        for channel in config.TWITCH_CHANNELS:
-            database.init_db(channel)
-        
         logger.info("=" * 80)
         logger.info(f"🤖 ИНИЦИАЛИЗАЦИЯ ЧЕЛОВЕЧНОГО БОТА")
         logger.info(f"📝 Имя: {config.TWITCH_NICK}")
-        logger.info(f"🎯 Каналы: {', '.join(config.TWITCH_CHANNELS)}")
+        logger.info(f"🎯 Каналы: {', '.join(channels)}")
+        if self.coordinator:
+            logger.info(f"🔗 Узел: {self.coordinator.node_id} (каналы по аренде)")
         logger.info("=" * 80)
     
     async def initialize_services(self):
         logger.info("🔄 Инициализация сервисов...")
-        await context_analyzer.initialize()
-        await emote_manager.initialize()
-        await response_generator.initialize()
+        await asyncio.gather(
+            context_analyzer.initialize(),
+            emote_manager.initialize(),
+            response_generator.initialize()
+        )
+        
+        self.services_ready = True
         
-        for channel in config.TWITCH_CHANNELS:
-            logger.info(f"📥 Загрузка смайликов для {channel}...")
-            emotes = await emote_manager.load_channel_emotes(channel)
-            self.channel_states[channel].loaded_emotes = emotes
-            self.channel_states[channel].emote_load_time = datetime.datetime.now()
+        # Каналы, ожившие до готовности сервисов, получают смайлики сейчас
+        for state in self.channel_states.values():
+            if state.emote_load_time is None:
+                self._schedule_emote_refresh(state, 0)
         
         logger.info("✅ Все сервисы готовы")
     
+    async def _load_channel_emotes(self, state: ChannelState):
+        logger.info(f"📥 Загрузка смайликов для {state.name}...")
+        state.loaded_emotes = await emote_manager.load_channel_emotes(state.name)
+        state.emote_load_time = clock.now()
+        self._subscribe_emote_events(state)
+    
+    def _get_channel_state(self, channel_name: str) -> Optional[ChannelState]:
+        """Состояние канала; при первом сообщении канал разворачивается"""
+        state = self.channel_states.get(channel_name)
+        if state is None and channel_name in self.channel_names:
+            state = self._activate_channel(channel_name)
+        return state
+    
+    def _activate_channel(self, channel_name: str) -> ChannelState:
+        """
+        Создаёт ресурсы канала: состояние (из снимка, если есть), воркер очереди
+        и события. Соединение с БД откроется при первой записи, смайлики
+        загружаются в фоне - до этого используются базовые смайлики Twitch.
+        """
+        state = ChannelState(channel_name)
+        self.channel_states[channel_name] = state
+        
+        emotes_restored = False
+        if config.SNAPSHOT_ENABLED:
+            pending = self.snapshot_writes.get(channel_name)
+            if pending is not None:
+                # Канал проснулся раньше, чем снимок дописался: берём копию, как после чтения из хранилища
+                snapshot = json.loads(json.dumps(pending[1]))
+            else:
+                snapshot = snapshot_store.load(channel_name, config.SNAPSHOT_MAX_AGE)
+            if snapshot:
+                emotes_restored = self._apply_snapshot(state, snapshot)
+        
+        if emotes_restored:
+            self._schedule_emote_refresh(state, self._emote_refresh_delay(state))
+        else:
+            # Пока наборы канала грузятся, работаем с базовыми смайликами Twitch
+            state.loaded_emotes = emote_manager.get_available_emotes(channel_name)
+            if self.services_ready:
+                self._schedule_emote_refresh(state, 0)
+        
+        if self.services_ready:
+            self._start_channel_worker(state)
+        
+        if channel_name in self.hibernated_channels:
+            self.hibernated_channels.discard(channel_name)
+            self.hibernation_stats['rehydrated'] += 1
+            logger.info(f"[{channel_name}] ☀️ Канал проснулся")
+        
+        if config.HIBERNATION_ENABLED and config.SNAPSHOT_ENABLED:
+            scheduler.schedule(
+                (channel_name, 'hibernate'),
+                config.HIBERNATE_AFTER,
+                lambda: self._maybe_hibernate(state)
+            )
+        return state
+    
+    def _maybe_hibernate(self, state: ChannelState):
+        """Канал молчит HIBERNATE_AFTER секунд - выгружаем его до следующего сообщения"""
+        if self.channel_states.get(state.name) is not state:
+            return
+        
+        idle_for = (clock.now() - state.last_message_time).total_seconds()
+        if idle_for < config.HIBERNATE_AFTER or state.work_queue.busy or len(state.work_queue):
+            scheduler.schedule(
+                (state.name, 'hibernate'),
+                max(60.0, config.HIBERNATE_AFTER - idle_for),
+                lambda: self._maybe_hibernate(state)
+            )
+            return
+        
+        freed = self._channel_memory(state.name)
+        self._teardown_channel(state.name, hibernated=True)
+        self.hibernated_channels.add(state.name)
+        self.hibernation_stats['hibernated'] += 1
+        self.hibernation_stats['bytes_freed'] += freed
+        logger.info(f"[{state.name}] 💤 Канал уснул после {idle_for / 60:.0f} мин тишины, "
+                   f"освобождено ~{freed / 1024:.0f} КБ")
+    
+    def _channel_memory(self, channel_name: str) -> int:
+        """Оценка памяти, которую занимает канал (состояние, смайлики, память, кеши)"""
+        state = self.channel_states.get(channel_name)
+        prefix = f"{channel_name}:"
+        parts = [
+            emote_manager.channel_emotes.get(channel_name),
+            emote_manager.emote_sources.get(channel_name),
+            emote_manager.emote_usage.get(channel_name),
+            emote_manager.emote_cooldown.get(channel_name),
+            emote_manager.cooldown_heap.get(channel_name),
+            emote_manager.recent_emotes.get(channel_name),
+            vars(emote_manager.chat_usage[channel_name]) if channel_name in emote_manager.chat_usage else None,
+            vars(emote_manager.emote_index[channel_name]) if channel_name in emote_manager.emote_index else None,
+            response_generator.conversation_memory.get(channel_name),
+            [v for k, v in context_analyzer.cache.items() if k.startswith(prefix)],
+            [v for k, v in database._relationship_cache.items() if k[0] == channel_name],
+        ]
+        if state is not None:
+            # Очередь, задача воркера и объекты twitchio в оценку не входят
+            parts.append({
+                k: v for k, v in vars(state).items()
+                if k not in ('work_queue', 'worker_task', 'pending_double_message')
+            })
+        velocity = context_analyzer.velocity.get(channel_name)
+        if velocity is not None:
+            parts.extend([velocity.words_before, velocity.words_since])
+        
+        return deep_sizeof(parts)
+    
+    def _snapshot_channel(self, state: ChannelState) -> Dict:
+        return {
+            'state': state.to_snapshot(),
+            'emotes': emote_manager.export_channel(state.name),
+            'responder': response_generator.export_channel(state.name),
+            'analyzer': context_analyzer.export_channel(state.name),
+        }
+    
+    def _apply_snapshot(self, state: ChannelState, snapshot: Dict) -> bool:
+        """
+        Восстанавливает канал из снимка. Возвращает True, если смайлики
+        восстановлены и ещё свежие - тогда загружать их из API не нужно.
+        """
+        try:
+            state.restore_snapshot(snapshot['state'])
+            response_generator.import_channel(state.name, snapshot.get('responder', {}))
+            context_analyzer.import_channel(state.name, snapshot.get('analyzer', {}))
+            
+            if state.is_afk and state.afk_until:
+                scheduler.schedule(
+                    (state.name, 'afk_return'),
+                    (state.afk_until - clock.now()).total_seconds(),
+                    lambda: self._on_afk_return(state)
+                )
+            
+            logger.info(f"[{state.name}] ♻️ Состояние восстановлено: настроение {state.mood:.0f}, "
+                       f"энергия {state.energy:.0f}")
+            
+            emotes = snapshot.get('emotes')
+            if not emotes or not state.emote_load_time:
+                return False
+            state.loaded_emotes = emote_manager.import_channel(state.name, emotes)
+            self._subscribe_emote_events(state)
+            return self._emote_refresh_delay(state) > 0
+        except (KeyError, TypeError, ValueError) as e:
+            logger.error(f"[{state.name}] Не удалось восстановить снимок: {e}")
+            return False
+    
+    async def _save_snapshots(self):
+        """Периодическое сохранение снимков всех каналов"""
+        try:
+            snapshots = {name: self._snapshot_channel(state) for name, state in self.channel_states.items()}
+            started = time.perf_counter()
+            await self._wait_snapshot_writes()  # Фоновая запись не должна перетереть более новый снимок
+            await asyncio.to_thread(snapshot_store.save_many, snapshots)
+            logger.debug(f"💾 Снимки сохранены: {len(snapshots)} каналов за "
+                        f"{(time.perf_counter() - started) * 1000:.0f}мс")
+        except Exception as e:
+            logger.error(f"Ошибка сохранения снимков: {e}")
+        finally:
+            scheduler.schedule('snapshot', config.SNAPSHOT_INTERVAL, self._save_snapshots)
+    
+    async def add_channel(self, channel_name: str):
+        """Заходит в канал на ходу; ресурсы канала появятся с первым сообщением"""
+        channel_name = channel_name.lower()
+        if channel_name in self.channel_names:
+            return
+        
+        self.channel_names.add(channel_name)
+        await self.join_channels([channel_name])
+        logger.info(f"[{channel_name}] ➕ Канал подключен")
+    
+    async def remove_channel(self, channel_name: str):
+        """Выходит из канала и освобождает всё, что с ним связано"""
+        channel_name = channel_name.lower()
+        if channel_name not in self.channel_names:
+            return
+        
+        self.channel_names.discard(channel_name)
+        self.hibernated_channels.discard(channel_name)
+        try:
+            await self.part_channels([channel_name])
+        except Exception as e:
+            logger.debug(f"[{channel_name}] Ошибка выхода из канала: {e}")
+        
+        write = self._teardown_channel(channel_name)
+        if write is not None:
+            await write  # Новый владелец канала должен прочитать уже этот снимок
+        logger.info(f"[{channel_name}] ➖ Канал отключен")
+    
+    def _teardown_channel(self, channel_name: str, hibernated: bool = False) -> Optional[asyncio.Task]:
+        """
+        Сохраняет снимок и убирает состояние, воркер, события, кеши и соединение канала.
+        Снимок уснувшего канала (hibernated) восстанавливается при пробуждении любого возраста.
+        Возвращает задачу фоновой записи снимка (None - снимка нет).
+        """
+        write = None
+        state = self.channel_states.pop(channel_name, None)
+        if state is not None:
+            if config.SNAPSHOT_ENABLED:
+                # Следующая активация (или новый владелец канала) продолжит с этого состояния
+                write = self._write_snapshot(channel_name, self._snapshot_channel(state), hibernated)
+            if state.worker_task is not None:
+                state.worker_task.cancel()
+        
+        scheduler.cancel_where(lambda key: isinstance(key, tuple) and key[0] == channel_name)
+        emote_events.unsubscribe(channel_name)
+        emote_manager.forget_channel(channel_name)
+        response_generator.forget_channel(channel_name)
+        context_analyzer.forget_channel(channel_name)
+        database.close_channel(channel_name)
+        return write
+    
+    def _write_snapshot(self, channel_name: str, snapshot: Dict, hibernated: bool) -> asyncio.Task:
+        """
+        Пишет снимок канала в потоке, как и периодическое сохранение: SQLite и
+        JSON не держат цикл событий, даже когда засыпает много каналов сразу.
+        Записи одного канала идут по порядку.
+        """
+        pending = self.snapshot_writes.get(channel_name)
+        previous = pending[0] if pending is not None else None
+        
+        async def write():
+            try:
+                if previous is not None:
+                    await asyncio.wait([previous])
+                await asyncio.to_thread(snapshot_store.save, channel_name, snapshot, hibernated)
+            except Exception as e:
+                logger.error(f"[{channel_name}] Ошибка сохранения снимка: {e}")
+            finally:
+                if self.snapshot_writes.get(channel_name, (None,))[0] is task:
+                    del self.snapshot_writes[channel_name]
+        
+        task = self.loop.create_task(write())
+        self.snapshot_writes[channel_name] = (task, snapshot)
+        return task
+    
+    async def _wait_snapshot_writes(self):
+        pending = [task for task, _ in self.snapshot_writes.values()]
+        if pending:
+            await asyncio.wait(pending)
+    
     async def close_services(self):
+        if config.SNAPSHOT_ENABLED and self.services_ready:
+            await self._wait_snapshot_writes()  # Снимки уснувших каналов должны успеть на диск
+            try:
+                snapshot_store.save_many({
+                    name: self._snapshot_channel(state) for name, state in self.channel_states.items()
+                })
+                logger.info(f"💾 Снимки состояния сохранены: {len(self.channel_states)} каналов")
+            except Exception as e:
+                logger.error(f"Ошибка сохранения снимков: {e}")
+        if self.coordinator:
+            await self.coordinator.stop()
+        scheduler.stop()
+        send_queue.stop()
+        loop_monitor.stop()
+        await admin_server.close()
         await context_analyzer.close()
+        await emote_events.stop()
         await emote_manager.close()
         await response_generator.close()
-    
-    def is_mentioned(self, message: str) -> bool:
-        return bool(self.mention_pattern.search(message))
+        database.close_all()
     
     async def event_ready(self):
         logger.info("=" * 80)
         logger.info("✅ БОТ ПОДКЛЮЧЕН К TWITCH")
         logger.info("=" * 80)
         
+        if config.LOOP_MONITOR_ENABLED:
+            loop_monitor.start()
+        
+        if config.LEMMATIZER_PRELOAD:
+            lemmatizer.preload()
+        
+        if config.ADMIN_ENABLED:
+            admin_server.register('stats', self._cmd_stats, "статистика бота по каналам")
+            admin_server.register('join', self._cmd_join, "join <канал> - зайти в канал")
+            admin_server.register('part', self._cmd_part, "part <канал> - выйти из канала")
+            admin_server.register('channels', self._cmd_channels, "каналы и их активность")
+            try:
+                await admin_server.start()
+            except OSError as e:
+                logger.error(f"Не удалось запустить админ-интерфейс: {e}")
+        
         await self.initialize_services()
         
-        self.loop.create_task(self._background_analyzer())
-        self.loop.create_task(self._energy_updater())
-        self.loop.create_task(self._emote_refresher())
-        self.loop.create_task(self._double_message_sender())  # НОВОЕ
-        self.loop.create_task(self._afk_manager())  # НОВОЕ
+        for state in self.channel_states.values():
+            self._start_channel_worker(state)
+        
+        self.start_background_events()
+        scheduler.start()
+        send_queue.start()
+        
+        if config.EMOTE_EVENTS_ENABLED:
+            emote_events.on_resync = self._resync_emotes
+            emote_events.start()
+        
+        if self.coordinator:
+            await self.coordinator.start()
         
         logger.info("🚀 Бот начал работу...")
     
@@ -248,113 +644,184 @@ class HumanTwitchBot(commands.Bot):
         author = message.author.name if message.author else "Unknown"
         channel_name = message.channel.name
         
-        if author.lower() == self.nick.lower():
+        if author.lower() == config.TWITCH_NICK:
             return
         
         self.total_messages_processed += 1
-        state = self.channel_states.get(channel_name)
+        state = self._get_channel_state(channel_name)
         
         if not state:
             logger.warning(f"Канал {channel_name} не найден")
             return
         
         # НОВОЕ: Проверяем АФК
-        if state.check_afk_return():
+        if state.check_afk_return() or state.announce_return:
+            state.announce_return = False
             # Иногда пишем что вернулись
-            if random.random() < 0.3:
-                await message.channel.send(random.choice(['вернулся', 'бек', 'я тут']))
+            if clock.rng.random() < 0.3:
+                await send_queue.send(
+                    message.channel, channel_name,
+                    clock.rng.choice(['вернулся', 'бек', 'я тут']),
+                    priority=PRIORITY_EXTRA, wait=False
+                )
         
-        state.last_message_time = datetime.datetime.now()
+        state.last_message_time = clock.now()
         state.message_count_since_response += 1
+        state.messages_since_analysis += 1
+        state.messages_received += 1
+        features = extract_features(message.content, self.mention_pattern)
+        context_analyzer.observe_message(channel_name, features)
+        chat_emotes = emote_manager.observe_chat_message(channel_name, message.content)
+        if chat_emotes is not None:
+            features.emote_tokens = chat_emotes  # Смайлики набора канала, а не догадка по регистру букв
+        
+        # Канал ожил - энергия снова обновляется по расписанию
+        if not scheduler.is_scheduled((channel_name, 'energy')):
+            self._on_energy_update(state)
+        
+        with loop_monitor.stage(channel_name, 'save_message'):
+            database.save_message(channel_name, author, message.content, is_bot=False, features=features)
+        
+        # Дальше работает воркер канала, приём сообщений здесь заканчивается
+        state.work_queue.put(WorkItem(
+            message=message,
+            author=author,
+            content=message.content,
+            features=features
+        ))
         
-        database.save_message(channel_name, author, message.content, is_bot=False)
+        if self.total_messages_processed % 50 == 0:
+            self._log_statistics()
+    
+    def _start_channel_worker(self, state: ChannelState):
+        """Запускает воркер очереди канала"""
+        if state.worker_task is None or state.worker_task.done():
+            state.worker_task = self.loop.create_task(self._channel_worker(state))
+    
+    async def _channel_worker(self, state: ChannelState):
+        """Обрабатывает кандидатов канала по одному"""
+        queue = state.work_queue
         
-        message_analysis = await context_analyzer.analyze_user_message(message.content, author)
+        while True:
+            item = await queue.get()
+            await self._run_work_item(state, item)
+    
+    async def drain_queue(self, channel_name: str):
+        """Обрабатывает всё, что накопилось в очереди канала (для симуляции)"""
+        state = self.channel_states[channel_name]
         
-        should_respond = await self._should_respond_to_message(
-            message=message,
-            state=state,
-            message_analysis=message_analysis
-        )
+        while True:
+            item = state.work_queue.get_nowait()
+            if item is None:
+                break
+            await self._run_work_item(state, item)
+    
+    async def _run_work_item(self, state: ChannelState, item: WorkItem):
+        state.work_queue.busy = True
+        try:
+            await self._process_message(state, item)
+        except Exception as e:
+            logger.error(f"[{state.name}] Ошибка обработки сообщения: {e}")
+        finally:
+            state.work_queue.busy = False
+            state.work_queue.processed += 1
+    
+    async def _process_message(self, state: ChannelState, item: WorkItem):
+        """Решает, отвечать ли на сообщение, и отвечает"""
+        message = item.message
+        author = item.author
+        channel_name = state.name
+        
+        with loop_monitor.stage(channel_name, 'gate'):
+            should_respond, message_analysis = await self._should_respond_to_message(state, item)
         
         if should_respond:
-            context_messages = database.get_last_messages(channel_name, config.CONTEXT_WINDOW_SIZE)
+            with loop_monitor.stage(channel_name, 'load_context'):
+                context_messages = database.get_last_messages(channel_name, config.CONTEXT_WINDOW_SIZE)
             
             # НОВОЕ: Иногда "забываем" контекст
-            if random.random() < config.MEMORY_FADE_PROBABILITY:
+            if clock.rng.random() < config.MEMORY_FADE_PROBABILITY:
                 context_messages = context_messages[-5:]  # Берем только последние 5
                 logger.debug(f"[{channel_name}] 🧠 Забыл контекст")
             
-            analysis = await context_analyzer.analyze_context(
-                channel=channel_name,
-                messages=context_messages,
-                current_message=message.content,
-                author=author,
-                channel_emotes=state.loaded_emotes
-            )
+            pending_messages = state.messages_since_analysis
+            
+            with loop_monitor.stage(channel_name, 'analyze_context'):
+                analysis = await context_analyzer.analyze_context(
+                    channel=channel_name,
+                    messages=context_messages,
+                    current_message=message.content,
+                    author=author,
+                    channel_emotes=emote_manager.get_popular_emotes(channel_name)
+                )
             
             state.last_context_analysis = analysis
+            state.messages_since_analysis = max(0, state.messages_since_analysis - pending_messages)
             
             if analysis.should_respond:
                 await self._generate_and_send_response(
                     message=message,
+                    features=item.features,
                     state=state,
                     analysis=analysis,
                     message_analysis=message_analysis,
                     author=author
                 )
         
-        state.update_mood(message_analysis, should_respond)
-        state.update_energy()
-        
-        if self.total_messages_processed % 50 == 0:
-            self._log_statistics()
+        with loop_monitor.stage(channel_name, 'update_state'):
+            state.update_mood(message_analysis, should_respond)
+            state.update_energy()
     
     async def _should_respond_to_message(
         self,
-        message: Message,
         state: ChannelState,
-        message_analysis: dict
-    ) -> bool:
-        """Определяет нужно ли отвечать"""
-        
-        # НОВОЕ: Если в АФК
+        item: WorkItem
+    ) -> Tuple[bool, dict]:
+        """
+        Определяет нужно ли отвечать. Ступени идут по возрастанию стоимости:
+        1) O(1) проверки состояния канала,
+        2) вероятность без классификатора (энергия, настроение) - бросок кубика
+           сравнивается с её верхней оценкой при самом выгодном ответе классификатора,
+        3) отношения с автором из кеша - оценка уточняется,
+        4) только потом LLM-классификация сообщения и точная вероятность.
+        Бросок один на все ступени, поэтому ранний выход не меняет итоговое распределение.
+        Возвращает (отвечать ли, анализ сообщения).
+        """
+        
+        # 0. Запрещённые слова - не поддерживаем такие разговоры даже при упоминании
+        features = item.features
+        if features.forbidden:
+            logger.debug(f"[{state.name}] 🚫 Запрещённые слова от {item.author}: {', '.join(features.forbidden)}")
+            return self._gate_exit('forbidden', features)
+        
+        # 1. Состояние канала
+        if item.is_mentioned:
+            if not state.is_afk:
+                logger.info(f"[{state.name}] 📢 Упоминание от {item.author}")
+            self.gate_stats['mention'] += 1
+            return True, await self._classify_message(state, item)
+        
+        # НОВОЕ: В АФК отвечаем только на упоминания
         if state.is_afk:
-            # Отвечаем только на упоминания
-            if self.is_mentioned(message.content):
-                return True
-            return False
-        
-        if self.is_mentioned(message.content):
-            logger.info(f"[{state.name}] 📢 Упоминание от {message.author.name}")
-            return True
+            return self._gate_exit('afk', features)
         
         if state.is_busy_time():
             logger.debug(f"[{state.name}] 😴 Спит")
-            return False
+            return self._gate_exit('busy_time', features)
         
-        time_since_response = (datetime.datetime.now() - state.last_response_time).total_seconds()
+        time_since_response = (clock.now() - state.last_response_time).total_seconds()
         
         if time_since_response < config.RESPONSE_COOLDOWN_MIN:
             logger.debug(f"[{state.name}] ⏱️ Кулдаун: {time_since_response:.0f}с")
-            return False
+            return self._gate_exit('cooldown', features)
         
         if state.message_count_since_response < config.MIN_MESSAGES_BEFORE_RESPONSE:
             logger.debug(f"[{state.name}] 📊 Мало сообщений: {state.message_count_since_response}")
-            return False
+            return self._gate_exit('min_messages', features)
         
+        # 2. Вероятность без классификатора
         base_probability = config.RESPONSE_PROBABILITY_BASE
         
-        # Модификаторы
-        if message_analysis.get('contains_question', False):
-            base_probability *= 1.5
-        
-        if message_analysis.get('is_personal', False):
-            base_probability *= 1.3
-        
-        urgency = message_analysis.get('urgency', 1)
-        base_probability *= (1 + (urgency - 1) * 0.2)
-        
         if state.energy > 80:
             base_probability *= 1.2
         elif state.energy < 30:
@@ -365,23 +832,71 @@ class HumanTwitchBot(commands.Bot):
         elif state.mood < 30:
             base_probability *= 0.75
         
-        relationship = database.get_user_relationship(state.name, message.author.name)
+        roll = clock.rng.random()
+        
+        best_bonus = max(level['response_bonus'] for level in config.RELATIONSHIP_LEVELS.values())
+        if roll >= self._clamp_probability(base_probability * MAX_CLASSIFIER_BOOST + best_bonus):
+            return self._gate_exit('probability_bound', features)
+        
+        # 3. Отношения с автором (из кеша)
+        relationship = database.get_user_relationship(state.name, item.author)
         rel_level = relationship.get('level', 'stranger')
         rel_bonus = config.RELATIONSHIP_LEVELS.get(rel_level, {}).get('response_bonus', 0.0)
-        base_probability += rel_bonus
         
-        final_probability = max(0.05, min(0.85, base_probability))
+        if roll >= self._clamp_probability(base_probability * MAX_CLASSIFIER_BOOST + rel_bonus):
+            return self._gate_exit('relationship_bound', features)
+        
+        # 4. Классификатор
+        message_analysis = await self._classify_message(state, item)
+        
+        final_probability = self._clamp_probability(
+            base_probability * self._classifier_boost(message_analysis) + rel_bonus
+        )
         
-        should_respond = random.random() < final_probability
+        should_respond = roll < final_probability
+        self.gate_stats['passed' if should_respond else 'probability'] += 1
         
         logger.debug(f"[{state.name}] 🎲 Вероятность: {final_probability:.2%} "
                     f"(энергия: {state.energy}, настроение: {state.mood})")
         
-        return should_respond
+        return should_respond, message_analysis
+    
+    def _gate_exit(self, stage: str, features: MessageFeatures) -> Tuple[bool, dict]:
+        """Ранний выход: считаем ступень и анализируем сообщение локально"""
+        self.gate_stats[stage] += 1
+        return False, local_message_analysis(features)
+    
+    async def _classify_message(self, state: ChannelState, item: WorkItem) -> dict:
+        with loop_monitor.stage(state.name, 'classify'):
+            return await context_analyzer.analyze_user_message(item.content, item.author)
+    
+    @staticmethod
+    def _classifier_boost(message_analysis: dict) -> float:
+        """Множитель вероятности по ответу классификатора (не больше MAX_CLASSIFIER_BOOST)"""
+        boost = 1.0
+        
+        if message_analysis.get('contains_question', False):
+            boost *= 1.5
+        
+        if message_analysis.get('is_personal', False):
+            boost *= 1.3
+        
+        try:
+            urgency = max(1, min(5, int(message_analysis.get('urgency', 1))))
+        except (TypeError, ValueError):
+            urgency = 1
+        boost *= (1 + (urgency - 1) * 0.2)
+        
+        return boost
+    
+    @staticmethod
+    def _clamp_probability(probability: float) -> float:
+        return max(0.05, min(0.85, probability))
     
     async def _generate_and_send_response(
         self,
         message: Message,
+        features: MessageFeatures,
         state: ChannelState,
         analysis: any,
         message_analysis: dict,
@@ -392,7 +907,7 @@ class HumanTwitchBot(commands.Bot):
         logger.info(f"[{state.name}] 🧠 Генерация для {author}...")
         
         # НОВОЕ: Случайное уменьшение времени думания
-        thinking_time = random.uniform(
+        thinking_time = clock.rng.uniform(
             config.THINKING_TIME_MIN * 0.7,  # Иногда быстрее
             config.THINKING_TIME_MAX
         )
@@ -400,34 +915,54 @@ class HumanTwitchBot(commands.Bot):
         if message_analysis.get('contains_question', False):
             thinking_time *= 1.5
         
-        if self.is_mentioned(message.content):
+        if features.is_mentioned:
             thinking_time *= 1.2
         
-        await asyncio.sleep(thinking_time)
-        
-        available_emotes = emote_manager.get_available_emotes(state.name)
+        await clock.sleep(thinking_time)
         
-        response_text, used_emotes = await response_generator.generate_human_response(
-            channel=state.name,
-            context_analysis=analysis,
-            current_message=message.content,
-            author=author,
-            bot_nick=self.nick,
-            is_mentioned=self.is_mentioned(message.content),
-            energy_level=int(state.energy),
-            available_emotes=available_emotes
-        )
+        with loop_monitor.stage(state.name, 'generate'):
+            available_emotes = emote_manager.get_available_emotes(state.name)
+            
+            response_text, used_emotes = await response_generator.generate_human_response(
+                channel=state.name,
+                context_analysis=analysis,
+                current_message=message.content,
+                author=author,
+                bot_nick=config.TWITCH_NICK,
+                is_mentioned=features.is_mentioned,
+                energy_level=int(state.energy),
+                available_emotes=available_emotes
+            )
         
         if not response_text:
             logger.warning(f"[{state.name}] ⚠️ Не удалось сгенерировать")
             return
         
+        response_features = extract_features(response_text)
+        if response_features.forbidden:
+            self.blocked_responses += 1
+            logger.warning(f"[{state.name}] 🚫 Ответ не отправлен (запрещённые слова: "
+                           f"{', '.join(response_features.forbidden)}): {response_text}")
+            return
+        
         await self._simulate_typing(response_text, state.energy)
         
+        if features.is_mentioned:
+            priority = PRIORITY_MENTION
+        elif used_emotes and set(response_text.split()) <= set(used_emotes):
+            priority = PRIORITY_EXTRA  # Одни смайлики
+        else:
+            priority = PRIORITY_REPLY
+        
         try:
-            await message.channel.send(response_text)
+            with loop_monitor.stage(state.name, 'send'):
+                sent = await send_queue.send(message.channel, state.name, response_text, priority=priority)
+            
+            if not sent:
+                logger.info(f"[{state.name}] ⌛ Ответ не отправлен (устарел в очереди): {response_text}")
+                return
             
-            state.last_response_time = datetime.datetime.now()
+            state.last_response_time = clock.now()
             state.message_count_since_response = 0
             state.messages_sent_today += 1
             state.consecutive_responses += 1
@@ -436,22 +971,34 @@ class HumanTwitchBot(commands.Bot):
             for emote in used_emotes:
                 state.recent_emotes_used.append(emote)
             
-            database.save_message(state.name, self.nick, response_text, is_bot=True)
-            database.update_user_relationship(state.name, author, is_positive=True)
+            with loop_monitor.stage(state.name, 'save_response'):
+                database.save_message(state.name, config.TWITCH_NICK, response_text, is_bot=True,
+                                      features=response_features)
+                database.update_user_relationship(state.name, author, is_positive=True)
             
             logger.info(f"[{state.name}] 📨 Отправлено: {response_text}")
             
-            # НОВОЕ: Иногда добавляем второе сообщение
-            if random.random() < config.DOUBLE_MESSAGE_PROBABILITY:
+            # НОВОЕ: Иногда добавляем второе сообщение (через 2-5 секунд)
+            if clock.rng.random() < config.DOUBLE_MESSAGE_PROBABILITY:
                 state.pending_double_message = {
                     'channel': message.channel,
                     'original': response_text,
-                    'time': datetime.datetime.now()
+                    'time': clock.now()
                 }
+                scheduler.schedule(
+                    (state.name, 'double_message'),
+                    clock.rng.uniform(2, 5),
+                    lambda: self._send_double_message(state)
+                )
             
             # НОВОЕ: Иногда уходим в АФК после ответа
-            if random.random() < config.AFK_PROBABILITY:
+            if clock.rng.random() < config.AFK_PROBABILITY:
                 state.go_afk()
+                scheduler.schedule(
+                    (state.name, 'afk_return'),
+                    (state.afk_until - clock.now()).total_seconds(),
+                    lambda: self._on_afk_return(state)
+                )
             
         except Exception as e:
             logger.error(f"[{state.name}] ❌ Ошибка отправки: {e}")
@@ -468,130 +1015,308 @@ class HumanTwitchBot(commands.Bot):
             wpm = 140
         
         typing_time = (words / wpm) * 60
-        typing_time *= random.uniform(0.7, 1.3)  # НОВОЕ: больше разброс
+        typing_time *= clock.rng.uniform(0.7, 1.3)  # НОВОЕ: больше разброс
         typing_time = max(0.8, typing_time)
         
-        await asyncio.sleep(typing_time)
+        await clock.sleep(typing_time)
         logger.debug(f"[Печать] {words} слов, {typing_time:.1f}с")
     
-    async def _double_message_sender(self):
-        """НОВОЕ: Отправляет дополнительные сообщения"""
-        await self.wait_for_ready()
-        logger.info("🔄 Обработчик двойных сообщений запущен")
+    def start_background_events(self):
+        """Регистрирует фоновые события в планировщике"""
+        scheduler.schedule('analysis_cycle', config.ANALYZER_MIN_INTERVAL, self._run_analysis_cycle)
         
-        while True:
-            await asyncio.sleep(2)
-            
-            for channel_name, state in self.channel_states.items():
-                if state.pending_double_message:
-                    pending = state.pending_double_message
-                    time_since = (datetime.datetime.now() - pending['time']).total_seconds()
-                    
-                    # Отправляем через 2-5 секунд
-                    if 2 <= time_since <= 5:
-                        additions = [
-                            '*', 'ну типа', 'в общем', 'короче',
-                            'так-то', 'имхо', 'хз', 'мб'
-                        ]
-                        
-                        try:
-                            addition = random.choice(additions)
-                            await pending['channel'].send(addition)
-                            logger.debug(f"[{channel_name}] 📨 Двойное сообщение: {addition}")
-                        except:
-                            pass
-                        
-                        state.pending_double_message = None
-    
-    async def _afk_manager(self):
-        """НОВОЕ: Управление АФК"""
-        await self.wait_for_ready()
-        logger.info("🔄 Менеджер АФК запущен")
+        for state in self.channel_states.values():
+            self._schedule_emote_refresh(state, self._emote_refresh_delay(state))
         
-        while True:
-            await asyncio.sleep(30)
-            
-            for channel_name, state in self.channel_states.items():
-                if not state.is_afk:
-                    state.check_afk_return()
+        if config.SNAPSHOT_ENABLED:
+            scheduler.schedule('snapshot', config.SNAPSHOT_INTERVAL, self._save_snapshots)
+        
+        if self.metrics_queue is not None:
+            scheduler.schedule('metrics_report', config.SUPERVISOR_REPORT_INTERVAL, self._report_metrics)
+    
+    def _report_metrics(self):
+        """Отправляет супервизору накопленные счётчики воркера"""
+        try:
+            self.metrics_queue.put_nowait({
+                'worker_id': self.worker_id,
+                'pid': os.getpid(),
+                'cpu_time': time.process_time(),
+                'messages_processed': self.total_messages_processed,
+                'channels': {name: state.messages_received for name, state in self.channel_states.items()},
+                'queue_depth': sum(len(state.work_queue) for state in self.channel_states.values()),
+                'loop_lag_ms': loop_monitor.get_stats()['lag_avg_ms'],
+            })
+        except Exception as e:
+            logger.debug(f"Не удалось отправить метрики супервизору: {e}")
+        finally:
+            scheduler.schedule('metrics_report', config.SUPERVISOR_REPORT_INTERVAL, self._report_metrics)
     
-    async def _background_analyzer(self):
-        """Фоновый анализ"""
-        await self.wait_for_ready()
-        logger.info("🔄 Фоновый анализатор запущен")
+    async def _send_double_message(self, state: ChannelState):
+        """НОВОЕ: Отправляет дополнительное сообщение"""
+        pending = state.pending_double_message
+        state.pending_double_message = None
         
-        while True:
-            await asyncio.sleep(config.ANALYZER_UPDATE_INTERVAL)
-            
-            for channel_name, state in self.channel_states.items():
-                try:
-                    messages = database.get_last_messages(channel_name, config.ANALYZER_CONTEXT_SIZE)
-                    
-                    if len(messages) >= 5:
-                        analysis = await context_analyzer.analyze_context(
-                            channel=channel_name,
-                            messages=messages,
-                            current_message="[фоновая проверка]",
-                            author="system",
-                            channel_emotes=state.loaded_emotes
-                        )
-                        
-                        state.last_context_analysis = analysis
-                        
-                        if analysis.main_topics:
-                            for topic in analysis.main_topics:
-                                if topic not in state.current_topics:
-                                    state.current_topics.append(topic)
-                        
-                        logger.debug(f"[{channel_name}] 🔍 Фоновый анализ: {analysis.emotional_tone}")
-                
-                except Exception as e:
-                    logger.error(f"[{channel_name}] Ошибка фонового анализа: {e}")
+        if not pending:
+            return
+        
+        additions = [
+            '*', 'ну типа', 'в общем', 'короче',
+            'так-то', 'имхо', 'хз', 'мб'
+        ]
+        
+        try:
+            addition = clock.rng.choice(additions)
+            await send_queue.send(pending['channel'], state.name, addition, priority=PRIORITY_EXTRA, wait=False)
+            logger.debug(f"[{state.name}] 📨 Двойное сообщение: {addition}")
+        except Exception as e:
+            logger.debug(f"[{state.name}] Не удалось отправить двойное сообщение: {e}")
+    
+    def _on_afk_return(self, state: ChannelState):
+        """НОВОЕ: Возврат из АФК точно по времени"""
+        if state.check_afk_return():
+            state.announce_return = True
     
-    async def _energy_updater(self):
-        """Обновление энергии"""
-        await self.wait_for_ready()
-        logger.info("🔄 Обновление энергии запущено")
+    def _on_energy_update(self, state: ChannelState):
+        """Обновление энергии; пока канал молчит, событие не перерегистрируется"""
+        state.update_energy()
         
-        while True:
-            await asyncio.sleep(60)
+        idle_for = (clock.now() - state.last_message_time).total_seconds()
+        if idle_for < config.SILENCE_THRESHOLD:
+            scheduler.schedule(
+                (state.name, 'energy'),
+                config.ENERGY_UPDATE_INTERVAL,
+                lambda: self._on_energy_update(state)
+            )
+    
+    def _emote_refresh_interval(self) -> float:
+        """
+        Как часто перезагружать наборы целиком. Пока подписка на события 7TV
+        жива, изменения приходят сразу и полная загрузка - лишь редкая сверка.
+        """
+        if emote_events.is_connected:
+            return config.EMOTE_CONSISTENCY_INTERVAL
+        return config.EMOTE_REFRESH_INTERVAL
+    
+    def _emote_refresh_delay(self, state: ChannelState) -> float:
+        """Сколько ещё смайлики канала считаются свежими"""
+        if state.emote_load_time is None:
+            return self._emote_refresh_interval()
+        age = (clock.now() - state.emote_load_time).total_seconds()
+        return self._emote_refresh_interval() - age
+    
+    def _schedule_emote_refresh(self, state: ChannelState, delay: Optional[float] = None,
+                                revalidate: bool = False):
+        scheduler.schedule(
+            (state.name, 'emote_refresh'),
+            self._emote_refresh_interval() if delay is None else delay,
+            lambda: self._refresh_emotes(state, revalidate)
+        )
+    
+    def _resync_emotes(self, channels: List[str]):
+        """
+        Подписка 7TV переподключилась после обрыва: изменения за обрыв сервер не
+        повторяет, поэтому наборы 7TV каналов сверяются сейчас, а не через
+        EMOTE_CONSISTENCY_INTERVAL.
+        """
+        for channel_name in channels:
+            state = self.channel_states.get(channel_name)
+            if state is not None and state.emote_load_time is not None:
+                self._schedule_emote_refresh(state, 0, revalidate=True)
+    
+    def _subscribe_emote_events(self, state: ChannelState):
+        """Подписка на изменения набора 7TV канала (id набора известен после загрузки)"""
+        emote_events.subscribe(state.name, emote_manager.emote_set_ids.get(state.name, {}).get('7tv'))
+    
+    async def _refresh_emotes(self, state: ChannelState, revalidate: bool = False):
+        """Обновление смайликов канала (при живой подписке 7TV - сверка)"""
+        try:
+            emotes = await emote_manager.load_channel_emotes(state.name, revalidate)
+            state.loaded_emotes = emotes
+            state.emote_load_time = clock.now()
+            self._subscribe_emote_events(state)
+            logger.info(f"[{state.name}] 🔄 Смайлики обновлены: {len(emotes)}")
+        except Exception as e:
+            logger.error(f"[{state.name}] Ошибка обновления смайликов: {e}")
+        finally:
+            self._schedule_emote_refresh(state)
+    
+    async def _run_analysis_cycle(self):
+        """
+        Фоновый анализ: только каналы, где с прошлого анализа были новые сообщения
+        и подошёл их адаптивный интервал (зависит от скорости чата), самые активные
+        первыми, параллельно под семафором. Цикл тикает с ANALYZER_MIN_INTERVAL.
+        """
+        started = clock.monotonic()
+        try:
+            states = list(self.channel_states.values())
+            dirty = [
+                state for state in states
+                if state.messages_since_analysis > 0 and context_analyzer.is_analysis_due(state.name)
+            ]
+            dirty.sort(key=lambda state: state.messages_since_analysis, reverse=True)
             
-            for channel_name, state in self.channel_states.items():
-                state.update_energy()
+            if dirty:
+                semaphore = asyncio.Semaphore(config.ANALYZER_CONCURRENCY)
+                
+                async def analyze(state: ChannelState):
+                    async with semaphore:
+                        await self._background_analysis(state.name, state)
+                
+                await asyncio.gather(*(analyze(state) for state in dirty))
+            
+            self.analysis_cycle_stats = {
+                'analyzed': len(dirty),
+                'skipped': len(states) - len(dirty),
+                'tokens_last_minute': context_analyzer.tokens_last_minute(),
+                'classifier_tokens_last_minute': context_analyzer.tokens_last_minute(classifier=True),
+                'duration': round(clock.monotonic() - started, 2),
+            }
+            logger.debug(f"🔍 Цикл анализа: {len(dirty)} каналов за {clock.monotonic() - started:.1f}с, "
+                        f"пропущено: {len(states) - len(dirty)}")
+        finally:
+            scheduler.schedule('analysis_cycle', config.ANALYZER_MIN_INTERVAL, self._run_analysis_cycle)
     
-    async def _emote_refresher(self):
-        """Обновление смайликов"""
-        await self.wait_for_ready()
-        logger.info("🔄 Обновление смайликов запущено")
-        
-        while True:
-            await asyncio.sleep(3600)  # Каждый час
+    async def _background_analysis(self, channel_name: str, state: ChannelState):
+        """Фоновый анализ одного канала"""
+        pending_messages = state.messages_since_analysis
+        try:
+            with loop_monitor.stage(channel_name, 'background_analysis'):
+                messages = database.get_last_messages(channel_name, config.ANALYZER_CONTEXT_SIZE)
             
-            for channel_name, state in self.channel_states.items():
-                try:
-                    emotes = await emote_manager.load_channel_emotes(channel_name)
-                    state.loaded_emotes = emotes
-                    logger.info(f"[{channel_name}] 🔄 Смайлики обновлены: {len(emotes)}")
-                except Exception as e:
-                    logger.error(f"[{channel_name}] Ошибка обновления смайликов: {e}")
+            if len(messages) >= 5:
+                with loop_monitor.stage(channel_name, 'background_analysis'):
+                    analysis = await context_analyzer.analyze_context(
+                        channel=channel_name,
+                        messages=messages,
+                        current_message="[фоновая проверка]",
+                        author="system",
+                        channel_emotes=emote_manager.get_popular_emotes(channel_name)
+                    )
+                
+                state.last_context_analysis = analysis
+                state.messages_since_analysis = max(0, state.messages_since_analysis - pending_messages)
+                
+                if analysis.main_topics:
+                    for topic in analysis.main_topics:
+                        if topic not in state.current_topics:
+                            state.current_topics.append(topic)
+                
+                logger.debug(f"[{channel_name}] 🔍 Фоновый анализ: {analysis.emotional_tone}")
+        
+        except Exception as e:
+            logger.error(f"[{channel_name}] Ошибка фонового анализа: {e}")
+    
+    async def _cmd_stats(self, args: list) -> str:
+        """Админ-команда: статистика"""
+        uptime = clock.now() - self.start_time
+        lines = [
+            f"Обработано сообщений: {self.total_messages_processed}",
+            f"Время работы: {uptime}",
+            "Отсев по ступеням: " + ", ".join(f"{k}={v}" for k, v in self.gate_stats.most_common()),
+            "Планировщик: " + ", ".join(f"{k}={v}" for k, v in scheduler.get_stats().items()),
+            "Отправка: " + ", ".join(f"{k}={v}" for k, v in send_queue.get_stats().items()),
+            "Цикл анализа: " + ", ".join(f"{k}={v}" for k, v in self.analysis_cycle_stats.items()),
+        ]
+        if self.coordinator:
+            lines.append("Координация: " + ", ".join(f"{k}={v}" for k, v in self.coordinator.get_stats().items()))
+        for channel, state in self.channel_states.items():
+            lines.append(f"[{channel}] Энергия: {state.energy:.0f}, "
+                         f"Настроение: {state.mood:.0f}, "
+                         f"Сообщений сегодня: {state.messages_sent_today}")
+            queue_stats = state.work_queue.get_stats()
+            lines.append(f"[{channel}] Очередь: " + ", ".join(f"{k}={v}" for k, v in queue_stats.items()))
+        return "\n".join(lines)
+    
+    async def _cmd_join(self, args: list) -> str:
+        """Админ-команда: зайти в канал"""
+        if len(args) != 1:
+            return "использование: join <канал>"
+        if self.coordinator:
+            return "каналы распределяет координатор, join недоступен"
+        channel_name = args[0].lower().lstrip('#')
+        if channel_name in self.channel_names:
+            return f"уже в канале {channel_name}"
+        await self.add_channel(channel_name)
+        return f"зашли в {channel_name}"
+    
+    async def _cmd_part(self, args: list) -> str:
+        """Админ-команда: выйти из канала"""
+        if len(args) != 1:
+            return "использование: part <канал>"
+        if self.coordinator:
+            return "каналы распределяет координатор, part недоступен"
+        channel_name = args[0].lower().lstrip('#')
+        if channel_name not in self.channel_names:
+            return f"не в канале {channel_name}"
+        await self.remove_channel(channel_name)
+        return f"вышли из {channel_name}"
+    
+    async def _cmd_channels(self, args: list) -> str:
+        """Админ-команда: список каналов"""
+        lines = [f"Каналов: {len(self.channel_names)}, активных: {len(self.channel_states)}"]
+        for channel_name in sorted(self.channel_names):
+            state = self.channel_states.get(channel_name)
+            if state is None:
+                status = "спит" if channel_name in self.hibernated_channels else "ждёт первого сообщения"
+                lines.append(f"{channel_name}: {status}")
+            else:
+                lines.append(f"{channel_name}: сообщений {state.messages_received}, "
+                             f"смайликов {len(state.loaded_emotes)}, очередь {len(state.work_queue)}, "
+                             f"память ~{self._channel_memory(channel_name) / 1024:.0f} КБ")
+        if self.hibernation_stats:
+            lines.append("Сон: " + ", ".join(f"{k}={v}" for k, v in self.hibernation_stats.items()))
+        return "\n".join(lines)
     
     def _log_statistics(self):
         """Статистика"""
-        uptime = datetime.datetime.now() - self.start_time
+        uptime = clock.now() - self.start_time
         logger.info("=" * 60)
         logger.info(f"📊 СТАТИСТИКА")
         logger.info(f"Обработано сообщений: {self.total_messages_processed}")
         logger.info(f"Время работы: {uptime}")
+        logger.info(f"Каналов: {len(self.channel_names)}, активных: {len(self.channel_states)}, "
+                   f"спят: {len(self.hibernated_channels)}")
+        if self.hibernation_stats:
+            hibernated = self.hibernation_stats['hibernated']
+            logger.info(f"Сон: уснули {hibernated}, проснулись {self.hibernation_stats['rehydrated']}, "
+                       f"в среднем ~{self.hibernation_stats['bytes_freed'] / max(1, hibernated) / 1024:.0f} КБ на канал")
+        if loop_monitor.is_running:
+            loop_stats = loop_monitor.get_stats()
+            logger.info(f"Задержка цикла: {loop_stats['lag_avg_ms']}мс (макс {loop_stats['lag_max_ms']}мс), "
+                       f"блокировок: {loop_stats['blocks_detected']}")
+        send_stats = send_queue.get_stats()
+        logger.info(f"Отправка: {send_stats['sent']}, в очереди: {send_stats['depth']}, "
+                   f"устарело: {send_stats['expired']}, задержка: {send_stats['avg_delay_ms']}мс "
+                   f"(макс {send_stats['max_delay_ms']}мс)")
+        if self.gate_stats:
+            logger.info("Отсев по ступеням: " + ", ".join(f"{k}={v}" for k, v in self.gate_stats.most_common()))
+        if self.blocked_responses:
+            logger.info(f"Ответов заблокировано фильтром: {self.blocked_responses}")
+        if emote_manager.active_cooldowns:
+            logger.info(f"Смайликов в \"помойке\": {emote_manager.active_cooldowns}")
+        if emote_events.is_running:
+            events_stats = emote_events.get_stats()
+            logger.info(f"События 7TV: {'подключено' if events_stats['connected'] else 'нет соединения'}, "
+                       f"каналов {events_stats['channels']}, изменений {events_stats['dispatches']}, "
+                       f"переподключений {events_stats['reconnects']}")
+        if emote_manager.cache_stats:
+            logger.info("Наборы смайликов: " + ", ".join(f"{k}={v}" for k, v in emote_manager.cache_stats.most_common()))
         for channel, state in self.channel_states.items():
             logger.info(f"[{channel}] Энергия: {state.energy:.0f}, "
                        f"Настроение: {state.mood:.0f}, "
                        f"Сообщений сегодня: {state.messages_sent_today}")
+            queue_stats = state.work_queue.get_stats()
+            logger.info(f"[{channel}] Очередь: {queue_stats['depth']} "
+                       f"(макс {queue_stats['max_depth']}), "
+                       f"сброшено: {queue_stats['dropped']}, "
+                       f"схлопнуто: {queue_stats['coalesced']}, "
+                       f"устарело: {queue_stats['expired']}")
         logger.info("=" * 60)
 
 
-async def main():
+async def main(channels: Optional[List[str]] = None, worker_id: Optional[int] = None, metrics_queue=None):
     """Запуск бота"""
-    bot = HumanTwitchBot()
+    bot = HumanTwitchBot(channels=channels, worker_id=worker_id, metrics_queue=metrics_queue)
     try:
         await bot.start()
     except KeyboardInterrupt:
@@ -0,0 +1,61 @@
+# chat_emotes.py - Какие смайлики канала чат пишет сейчас (скользящее окно)
+import heapq
+from collections import Counter, deque
+from operator import itemgetter
+from typing import Container, Deque, List, Tuple
+
+from clock import clock
+
+class ChatEmoteUsage:
+    """
+    Популярность смайликов в чате одного канала за последние window секунд.
+    Сообщение режется по пробелам, и каждый токен ищется в наборе канала
+    (поиск в словаре), поэтому сообщение стоит O(токенов). Окно - кольцо
+    корзин по bucket секунд: корзина, вышедшая из окна, вычитается из итога
+    целиком, так что каждое вхождение добавляется и убирается по одному разу.
+    """
+
+    def __init__(self, window: float, bucket: float):
+        self.bucket_size = bucket
+        self.bucket_count = max(1, round(window / bucket))
+        self.buckets: Deque[Tuple[int, Counter]] = deque()  # (номер корзины, смайлики)
+        self.totals: Counter = Counter()
+
+    def __len__(self) -> int:
+        return len(self.totals)
+
+    def observe(self, text: str, emote_set: Container[str], now: float = None) -> List[str]:
+        """Учитывает сообщение; возвращает найденные в нём смайлики набора"""
+        matched = [token for token in text.split() if token in emote_set]
+        if matched:
+            slot = self._expire(clock.monotonic() if now is None else now)
+            if not self.buckets or self.buckets[-1][0] != slot:
+                self.buckets.append((slot, Counter()))
+            self.buckets[-1][1].update(matched)
+            self.totals.update(matched)
+        return matched
+
+    def _expire(self, now: float) -> int:
+        slot = int(now // self.bucket_size)
+        while self.buckets and self.buckets[0][0] <= slot - self.bucket_count:
+            _, expired = self.buckets.popleft()
+            for emote, count in expired.items():
+                left = self.totals[emote] - count
+                if left > 0:
+                    self.totals[emote] = left
+                else:
+                    del self.totals[emote]
+        return slot
+
+    def rename(self, old: str, new: str):
+        """Смайлик переименован (7TV): его счёт в окне переходит к новому имени"""
+        for _, counter in self.buckets:
+            if old in counter:
+                counter[new] += counter.pop(old)
+        if old in self.totals:
+            self.totals[new] += self.totals.pop(old)
+
+    def top(self, n: int, now: float = None) -> List[str]:
+        """n самых частых смайликов окна (при равенстве - кто раньше появился в окне)"""
+        self._expire(clock.monotonic() if now is None else now)
+        return [emote for emote, _ in heapq.nlargest(n, self.totals.items(), key=itemgetter(1))]
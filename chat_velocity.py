@@ -0,0 +1,77 @@
+# chat_velocity.py - Оценка скорости чата и смены темы для частоты анализа
+import math
+from collections import Counter
+from typing import List
+
+import config
+from clock import clock
+
+MAX_TRACKED_WORDS = 2000
+
+class ChatVelocity:
+    """
+    Скорость одного чата: экспоненциально сглаженное число сообщений в секунду
+    (корректно для неравномерных интервалов) и дрейф темы - насколько слова,
+    написанные после последнего анализа, отличаются от слов до него.
+    """
+
+    def __init__(self, half_life: float):
+        self.tau = half_life / math.log(2)
+        self._rate = 0.0
+        self._last_event = None
+        self.words_before = Counter()  # Слова до последнего анализа
+        self.words_since = Counter()  # Слова после последнего анализа
+
+    def observe(self, words: List[str], now: float = None):
+        """Учитывает новое сообщение (нормальные формы его слов, см. MessageFeatures.topic_words)"""
+        now = clock.monotonic() if now is None else now
+
+        if self._last_event is not None:
+            self._rate *= math.exp(-(now - self._last_event) / self.tau)
+        self._rate += 1.0 / self.tau
+        self._last_event = now
+
+        self.words_since.update(words)
+        if len(self.words_since) > MAX_TRACKED_WORDS:
+            self.words_since = Counter(dict(self.words_since.most_common(MAX_TRACKED_WORDS // 2)))
+
+    def rate(self, now: float = None) -> float:
+        """Сообщений в секунду на текущий момент"""
+        if self._last_event is None:
+            return 0.0
+        now = clock.monotonic() if now is None else now
+        return self._rate * math.exp(-max(0.0, now - self._last_event) / self.tau)
+
+    def topic_drift(self) -> float:
+        """0 - говорят о том же, 1 - совсем о другом (1 - косинусная близость)"""
+        if not self.words_before or not self.words_since:
+            return 0.0
+
+        common = self.words_before.keys() & self.words_since.keys()
+        dot = sum(self.words_before[w] * self.words_since[w] for w in common)
+        norm_before = math.sqrt(sum(c * c for c in self.words_before.values()))
+        norm_since = math.sqrt(sum(c * c for c in self.words_since.values()))
+
+        return 1.0 - dot / (norm_before * norm_since)
+
+    def mark_analyzed(self):
+        """Анализ обновлён: новые слова становятся базой для сравнения"""
+        if self.words_since:
+            self.words_before = self.words_since
+            self.words_since = Counter()
+
+    def refresh_interval(self, budget_pressure: float = 1.0) -> float:
+        """
+        Через сколько секунд стоит обновить анализ: примерно каждые
+        ANALYZER_MESSAGES_PER_REFRESH сообщений, быстрее при смене темы,
+        медленнее при перерасходе токенов, в пределах [MIN, MAX].
+        """
+        rate = self.rate()
+        if rate <= 0:
+            return config.ANALYZER_MAX_INTERVAL
+
+        interval = config.ANALYZER_MESSAGES_PER_REFRESH / rate
+        interval *= 1.0 - 0.5 * self.topic_drift()
+        interval *= max(1.0, budget_pressure)
+
+        return max(config.ANALYZER_MIN_INTERVAL, min(config.ANALYZER_MAX_INTERVAL, interval))
@@ -0,0 +1,61 @@
+# clock.py - Единый источник времени, сна и случайности (реальный или виртуальный)
+import asyncio
+import datetime
+import random
+import time
+from typing import Optional
+
+class Clock:
+    """
+    Все модули берут время, sleep и random отсюда, а не напрямую.
+    В обычном режиме это просто datetime.now(), time.monotonic(), asyncio.sleep
+    и системный random. В режиме симуляции время виртуальное: sleep мгновенно
+    двигает часы вперёд, а генератор случайных чисел засеян - повтор одного и того же
+    лога чата даёт побитово одинаковые решения и идёт со скоростью процессора.
+    """
+
+    def __init__(self):
+        self.rng = random.Random()
+        self.is_virtual = False
+        self._virtual_now: Optional[datetime.datetime] = None
+        self._virtual_monotonic = 0.0
+
+    def now(self) -> datetime.datetime:
+        if self.is_virtual:
+            return self._virtual_now
+        return datetime.datetime.now()
+
+    def monotonic(self) -> float:
+        if self.is_virtual:
+            return self._virtual_monotonic
+        return time.monotonic()
+
+    async def sleep(self, seconds: float):
+        if self.is_virtual:
+            self.advance(seconds)
+            # Отдаём управление, чтобы порядок переключения задач не менялся
+            await asyncio.sleep(0)
+            return
+        await asyncio.sleep(seconds)
+
+    def enable_simulation(self, start: datetime.datetime, seed: int):
+        """Переключает на виртуальное время и засеянный random"""
+        self.is_virtual = True
+        self._virtual_now = start
+        self._virtual_monotonic = 0.0
+        self.rng.seed(seed)
+
+    def advance(self, seconds: float):
+        """Двигает виртуальное время вперёд"""
+        if not self.is_virtual or seconds <= 0:
+            return
+        self._virtual_now += datetime.timedelta(seconds=seconds)
+        self._virtual_monotonic += seconds
+
+    def advance_to(self, moment: datetime.datetime):
+        """Двигает виртуальное время до момента (назад не ходит)"""
+        if self.is_virtual and moment > self._virtual_now:
+            self.advance((moment - self._virtual_now).total_seconds())
+
+# Глобальные часы
+clock = Clock()
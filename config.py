@@ -22,7 +22,14 @@ GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 # ====================================================================
 ANALYZER_MODEL = "mistral-medium"
 ANALYZER_CONTEXT_SIZE = 15
-ANALYZER_UPDATE_INTERVAL = 30
+ANALYZER_DEFAULT_INTERVAL = 30  # Интервал анализа канала, пока скорость его чата ещё не оценена
+ANALYZER_CONCURRENCY = 8  # Сколько каналов фоновый анализ обрабатывает одновременно
+# Частота анализа подстраивается под скорость чата (см. chat_velocity.py)
+ANALYZER_MIN_INTERVAL = 10  # Быстрый чат - не чаще
+ANALYZER_MAX_INTERVAL = 300  # Тихий чат - не реже
+ANALYZER_MESSAGES_PER_REFRESH = 20  # Обновлять примерно каждые N новых сообщений
+ANALYZER_VELOCITY_HALF_LIFE = 60  # Период полураспада сглаживания скорости (сек)
+ANALYZER_TOKEN_BUDGET_PER_MINUTE = 20000  # Общий бюджет токенов анализа контекста на все каналы (без классификатора)
 
 RESPONDER_MODEL = "gemma-3-27b-it"
 RESPONDER_TEMPERATURE = 0.92
@@ -59,6 +66,10 @@ INTERNET_SLANG = {
     'конечно': ['кнч', 'разумеется'],
 }
 
+# Лемматизация (см. lemmatizer.py): словари pymorphy2 грузятся в фоне при старте
+LEMMATIZER_PRELOAD = True
+LEMMA_CACHE_SIZE = 50000  # Слов в LRU кеше нормальных форм
+
 # ЗАБЫВЧИВОСТЬ (НОВОЕ)
 MEMORY_FADE_PROBABILITY = 0.15  # Иногда "забывает" контекст
 AFK_PROBABILITY = 0.03  # Вероятность уйти в АФК
@@ -99,7 +110,21 @@ FETCH_7TV_EMOTES = True
 FETCH_BTTV_EMOTES = True
 FETCH_FFZ_EMOTES = True
 
-EMOTE_COOLDOWN_TIME = 300
+EMOTE_REFRESH_INTERVAL = 3600  # Перезагрузка наборов смайликов канала
+EMOTE_LOAD_CONCURRENCY = 8  # Сколько каналов грузят смайлики одновременно
+EMOTE_CACHE_TTL = 3000  # Сколько секунд набор из БД считается свежим без запроса (меньше интервала обновления - плановое обновление перепроверяет)
+EMOTE_GLOBAL_CACHE = "_global"  # БД для глобальных наборов смайликов
+EMOTE_HTTP_TIMEOUT = 10  # Секунд на запрос к API смайликов (дальше - устаревший кеш)
+
+# Изменения наборов 7TV приходят событиями (см. emote_events.py); полная перезагрузка - только сверка
+EMOTE_EVENTS_ENABLED = os.getenv("EMOTE_EVENTS_ENABLED", "1").lower() in ("1", "true", "yes")
+EMOTE_EVENTS_URL = os.getenv("EMOTE_EVENTS_URL", "wss://events.7tv.io/v3")  # Можно указать локальную заглушку
+EMOTE_EVENTS_RECONNECT_MAX = 60  # Предел паузы между переподключениями (сек)
+EMOTE_CONSISTENCY_INTERVAL = 6 * 3600  # Полная перезагрузка наборов при работающей подписке (сек)
+EMOTE_COOLDOWN_TIME = 300  # Сколько секунд смайлик лежит в "помойке"
+EMOTE_COOLDOWN_BY_CHANNEL = {}  # Канал -> своё время "помойки" в секундах
+EMOTE_CHAT_WINDOW = 600  # За сколько секунд считаем, какие смайлики пишет чат (см. chat_emotes.py)
+EMOTE_CHAT_BUCKET = 30  # Шаг скользящего окна (сек)
 EMOTE_REUSE_PENALTY = 0.7
 EMOTE_DIVERSITY_BONUS = 1.3
 MAX_CONSECUTIVE_SAME_EMOTE = 3
@@ -157,6 +182,7 @@ RELATIONSHIP_LEVELS = {
     'favorite': {'response_bonus': 0.4, 'trust': 0.9},
     'toxic': {'response_bonus': -0.3, 'trust': 0.0},
 }
+RELATIONSHIP_CACHE_SIZE = 5000  # Сколько отношений (канал, ник) держим в памяти
 
 # ====================================================================
 # АНТИ-ТИШИНА И АКТИВНОСТЬ
@@ -165,6 +191,7 @@ SILENCE_THRESHOLD = 300
 ACTIVITY_CHECK_INTERVAL = 60
 ENERGY_DECAY_PER_MESSAGE = 0.5
 ENERGY_RESTORE_PER_MINUTE = 1.2
+ENERGY_UPDATE_INTERVAL = 60  # Пока канал активен, энергия пересчитывается раз в N секунд
 
 # ====================================================================
 # БЕЗОПАСНОСТЬ И ФИЛЬТРЫ
@@ -180,3 +207,62 @@ FORBIDDEN_WORDS = [
 RETRY_ATTEMPTS = 2
 RETRY_DELAY = 2
 LOG_LEVEL = "INFO"
+DATA_DIR = os.getenv("BOT_DATA_DIR", "data")  # Базы каналов и служебные файлы
+
+# РЕЖИМ СИМУЛЯЦИИ (повтор логов чата с виртуальным временем, см. simulate.py)
+SIMULATION_SEED = int(os.getenv("SIMULATION_SEED", "42"))
+
+# ====================================================================
+# ДИАГНОСТИКА ПРОИЗВОДИТЕЛЬНОСТИ
+# ====================================================================
+LOOP_MONITOR_ENABLED = True
+LOOP_LAG_CHECK_INTERVAL = 0.5  # Как часто меряем задержку цикла событий (сек)
+LOOP_BLOCK_THRESHOLD = 0.25  # Блокировка дольше этого - снимаем стек (сек)
+LOOP_BLOCK_EXPORT_PATH = os.path.join(DATA_DIR, "blocking_calls.jsonl")  # Куда пишем пойманные блокировки
+
+# Админ-интерфейс (только localhost) и профилирование живого процесса
+ADMIN_ENABLED = True
+ADMIN_HOST = "127.0.0.1"
+ADMIN_PORT = int(os.getenv("ADMIN_PORT", "8765"))
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")  # Если задан - нужна команда auth <token>
+PROFILER_SAMPLE_INTERVAL = 0.005  # 200 сэмплов в секунду
+PROFILER_DEFAULT_DURATION = 30
+PROFILER_OUTPUT_DIR = os.path.join(DATA_DIR, "profiles")
+TRACEMALLOC_FRAMES = 10
+
+# Очереди кандидатов на ответ (приём из IRC отделён от генерации)
+WORK_QUEUE_MAXSIZE = 20  # Максимум ждущих сообщений на канал
+WORK_QUEUE_POLICY = 'coalesce'  # 'coalesce' - пока отвечаем, ждёт только самое свежее; 'drop_oldest'
+WORK_QUEUE_MAX_AGE = 30  # Кандидаты старше (сек) уже неактуальны
+
+# Несколько процессов (см. supervisor.py): каналы делятся между воркерами
+BOT_WORKERS = int(os.getenv("BOT_WORKERS", "1"))  # 1 - обычный запуск в одном процессе
+SUPERVISOR_REPORT_INTERVAL = 30  # Как часто воркеры присылают метрики (сек)
+SUPERVISOR_REBALANCE_INTERVAL = 600  # Как часто проверяем перекос нагрузки (сек)
+SUPERVISOR_IMBALANCE_THRESHOLD = 1.5  # Перебалансировка, если самый загруженный воркер выше среднего в N раз
+SUPERVISOR_LOAD_SMOOTHING = 0.3  # Вес нового замера в сглаженной нагрузке канала
+SUPERVISOR_MAX_RESTART_DELAY = 60  # Предел паузы перед перезапуском упавшего воркера (сек)
+
+# Несколько копий бота на разных машинах (см. coordination.py): каналы берутся в аренду
+COORDINATION_ENABLED = os.getenv("COORDINATION_ENABLED", "").lower() in ("1", "true", "yes")
+COORDINATION_DB_PATH = os.getenv("COORDINATION_DB_PATH", os.path.join(DATA_DIR, "leases.db"))  # Файл на общем диске
+COORDINATION_NODE_ID = os.getenv("COORDINATION_NODE_ID")  # По умолчанию <хост>-<pid>
+COORDINATION_LEASE_TTL = 10  # Аренда без продления истекает через (сек)
+COORDINATION_HEARTBEAT_INTERVAL = 3  # Как часто продлеваем аренды и забираем свободные каналы (сек)
+COORDINATION_MAX_CHANNELS = 0  # Предел каналов на узел, 0 - без предела
+
+# Исходящие сообщения (см. send_queue.py): лимиты аккаунта Twitch
+SEND_RATE_LIMIT = 20  # Сообщений за окно на весь аккаунт (20/30с обычный, 100/30с модератор)
+SEND_RATE_WINDOW = 30  # Окно лимита (сек)
+SEND_CHANNEL_MIN_INTERVAL = 1.1  # Минимум между сообщениями в одном канале (сек)
+SEND_QUEUE_MAXSIZE = 200
+SEND_MESSAGE_TTL = {0: 60, 1: 30, 2: 10}  # Сколько сообщение может ждать: упоминание, ответ, второе/смайлики (сек)
+
+# Тёплый перезапуск (см. snapshot.py): снимки состояния каналов в data/snapshots.db
+SNAPSHOT_ENABLED = True
+SNAPSHOT_INTERVAL = 60  # Как часто сохраняем снимки (сек)
+SNAPSHOT_MAX_AGE = 6 * 3600  # Снимки старше не восстанавливаем - состояние устарело (сек); снимки уснувших каналов - любого возраста
+
+# Сон неактивных каналов: состояние уходит в снимок, кеши и соединение освобождаются
+HIBERNATION_ENABLED = True  # Работает только вместе со SNAPSHOT_ENABLED
+HIBERNATE_AFTER = 30 * 60  # Сколько секунд тишины до сна канала
@@ -3,10 +3,15 @@ import logging
 import asyncio
 import aiohttp
 import json
+import zlib
+from collections import deque
 from typing import Dict, List, Optional, Tuple
 from datetime import datetime, timedelta
-from dataclasses import dataclass
+from dataclasses import asdict, dataclass
 import config
+from clock import clock
+from chat_velocity import ChatVelocity
+from features import MessageFeatures
 
 logger = logging.getLogger(__name__)
 
@@ -29,7 +34,11 @@ class ContextAnalyzer:
         self.api_key = config.MISTRAL_API_KEY
         self.session: Optional[aiohttp.ClientSession] = None
         self.cache = {}  # Кеш анализов по каналам
+        self.last_cache_key: Dict[str, str] = {}  # Ключ последнего анализа канала (уходит в снимок)
         self.last_update = {}
+        self.velocity: Dict[str, ChatVelocity] = {}  # Скорость чата по каналам
+        self.token_usage = deque()  # Анализ контекста: (время, токены) за последнюю минуту
+        self.classifier_token_usage = deque()  # Классификация сообщений гейтом ответа - вне бюджета
         
     async def initialize(self):
         """Инициализация сессии"""
@@ -42,12 +51,49 @@ class ContextAnalyzer:
             await self.session.close()
     
     def _should_update_analysis(self, channel: str) -> bool:
-        """Проверяет, нужно ли обновлять анализ"""
+        """Проверяет, нужно ли обновлять анализ (интервал зависит от скорости чата)"""
         if channel not in self.last_update:
             return True
         
-        time_since = datetime.now() - self.last_update[channel]
-        return time_since.total_seconds() > config.ANALYZER_UPDATE_INTERVAL
+        time_since = clock.now() - self.last_update[channel]
+        return time_since.total_seconds() > self.get_refresh_interval(channel)
+    
+    def is_analysis_due(self, channel: str) -> bool:
+        """Пора ли фоновому анализу обновить канал"""
+        return self._should_update_analysis(channel)
+    
+    def observe_message(self, channel: str, features: MessageFeatures):
+        """Учитывает сообщение в оценке скорости чата"""
+        velocity = self.velocity.get(channel)
+        if velocity is None:
+            velocity = self.velocity[channel] = ChatVelocity(config.ANALYZER_VELOCITY_HALF_LIFE)
+        velocity.observe(features.topic_words)
+    
+    def get_refresh_interval(self, channel: str) -> float:
+        """Интервал обновления анализа канала в секундах (до первого сообщения - интервал по умолчанию)"""
+        velocity = self.velocity.get(channel)
+        if velocity is None:
+            return config.ANALYZER_DEFAULT_INTERVAL
+        return velocity.refresh_interval(self._budget_pressure())
+    
+    def tokens_last_minute(self, classifier: bool = False) -> int:
+        """Сколько токенов за последнюю минуту ушло на анализ контекста (classifier - на классификацию)"""
+        usage = self.classifier_token_usage if classifier else self.token_usage
+        threshold = clock.monotonic() - 60
+        while usage and usage[0][0] < threshold:
+            usage.popleft()
+        return sum(tokens for _, tokens in usage)
+    
+    def _budget_pressure(self) -> float:
+        """
+        Во сколько раз превышен глобальный бюджет токенов (1.0 - в пределах).
+        Считается только анализ контекста: его частоту бюджет и регулирует,
+        а классификация сообщений гейтом ответа от этой частоты не зависит.
+        """
+        budget = config.ANALYZER_TOKEN_BUDGET_PER_MINUTE
+        if not budget:
+            return 1.0
+        return max(1.0, self.tokens_last_minute() / budget)
     
     async def analyze_context(
         self,
@@ -62,7 +108,8 @@ class ContextAnalyzer:
         Использует Mistral для понимания эмоций, тем и отношений.
         """
         # Проверяем кеш
-        cache_key = f"{channel}:{hash(str(messages[-5:]))}"
+        # crc32, а не hash(): ключ из снимка должен совпасть и после перезапуска
+        cache_key = f"{channel}:{zlib.crc32(str(messages[-5:]).encode())}"
         if cache_key in self.cache and not self._should_update_analysis(channel):
             return self.cache[cache_key]
         
@@ -109,7 +156,7 @@ class ContextAnalyzer:
         
         try:
             # Вызываем Mistral API
-            response_text = await self._call_mistral_analysis(system_prompt, user_prompt)
+            response_text = await self._call_mistral_analysis(system_prompt, user_prompt, self.token_usage)
             
             # Парсим JSON ответ
             analysis_data = self._parse_analysis_response(response_text)
@@ -128,7 +175,10 @@ class ContextAnalyzer:
             
             # Кешируем результат
             self.cache[cache_key] = analysis
-            self.last_update[channel] = datetime.now()
+            self.last_cache_key[channel] = cache_key
+            self.last_update[channel] = clock.now()
+            if channel in self.velocity:
+                self.velocity[channel].mark_analyzed()
             
             # Очищаем старые записи из кеша
             self._clean_cache()
@@ -162,7 +212,7 @@ class ContextAnalyzer:
         
         return "\n".join(context_lines)
     
-    async def _call_mistral_analysis(self, system_prompt: str, user_prompt: str) -> str:
+    async def _call_mistral_analysis(self, system_prompt: str, user_prompt: str, usage: deque) -> str:
         """Вызывает Mistral API для анализа"""
         if not self.api_key:
             raise ValueError("Mistral API key not configured")
@@ -188,6 +238,7 @@ class ContextAnalyzer:
         async with self.session.post(url, json=payload, headers=headers) as response:
             if response.status == 200:
                 data = await response.json()
+                usage.append((clock.monotonic(), data.get("usage", {}).get("total_tokens", 0)))
                 return data["choices"][0]["message"]["content"]
             else:
                 error_text = await response.text()
@@ -227,6 +278,38 @@ class ContextAnalyzer:
                 "relevant_emotes": []
             }
     
+    def export_channel(self, channel: str) -> Dict:
+        """Последний анализ канала и его время для снимка (см. snapshot.py)"""
+        last_update = self.last_update.get(channel)
+        key = self.last_cache_key.get(channel)
+        analysis = self.cache.get(key) if key else None
+        return {
+            'last_update': last_update.isoformat() if last_update else None,
+            'cache_key': key if analysis else None,
+            'analysis': asdict(analysis) if analysis else None,
+        }
+    
+    def import_channel(self, channel: str, data: Dict):
+        """
+        После перезапуска свежий анализ не запрашивается заново раньше срока.
+        Время восстанавливается только вместе с самим анализом: иначе канал
+        до конца интервала остался бы без анализа, а кеш всё равно промахнулся бы.
+        """
+        if not (data.get('last_update') and data.get('analysis') and data.get('cache_key')):
+            return
+        self.cache[data['cache_key']] = ContextAnalysis(**data['analysis'])
+        self.last_cache_key[channel] = data['cache_key']
+        self.last_update[channel] = datetime.fromisoformat(data['last_update'])
+    
+    def forget_channel(self, channel: str):
+        """Освобождает кеш анализов и оценку скорости канала (канал отключён)"""
+        prefix = f"{channel}:"
+        for key in [key for key in self.cache if key.startswith(prefix)]:
+            del self.cache[key]
+        self.last_update.pop(channel, None)
+        self.last_cache_key.pop(channel, None)
+        self.velocity.pop(channel, None)
+    
     def _clean_cache(self):
         """Очищает старые записи из кеша"""
         max_cache_size = 50
@@ -252,7 +335,7 @@ class ContextAnalyzer:
 }}"""
         
         try:
-            response = await self._call_mistral_analysis(system_prompt, user_prompt)
+            response = await self._call_mistral_analysis(system_prompt, user_prompt, self.classifier_token_usage)
             return json.loads(response)
         except:
             return {
@@ -0,0 +1,263 @@
+# coordination.py - Распределение каналов между несколькими копиями бота через аренды
+import asyncio
+import logging
+import math
+import os
+import socket
+import sqlite3
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+
+import config
+from scheduler import scheduler
+
+logger = logging.getLogger(__name__)
+
+class LeaseStore:
+    """
+    Общее хранилище аренд в SQLite (файл на общем диске). Канал принадлежит узлу,
+    пока тот продлевает аренду; просроченную аренду может забрать любой узел.
+    Время - настенное (time.time), т.к. файл читают разные машины.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS leases (
+                    channel TEXT PRIMARY KEY,
+                    node_id TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS nodes (
+                    node_id TEXT PRIMARY KEY,
+                    expires_at REAL NOT NULL
+                )
+            """)
+
+    def _connect(self) -> sqlite3.Connection:
+        # Автокоммит: транзакции открываем сами через BEGIN IMMEDIATE
+        return sqlite3.connect(self.path, timeout=5, isolation_level=None)
+
+    def heartbeat(self, node_id: str, ttl: float) -> int:
+        """Отмечает узел живым, возвращает число живых узлов"""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("""
+                INSERT INTO nodes (node_id, expires_at) VALUES (?, ?)
+                ON CONFLICT(node_id) DO UPDATE SET expires_at = excluded.expires_at
+            """, (node_id, now + ttl))
+            conn.execute("DELETE FROM nodes WHERE expires_at < ?", (now,))
+            return conn.execute("SELECT COUNT(*) FROM nodes").fetchone()[0]
+
+    def claim(self, node_id: str, channels: List[str], ttl: float, limit: Optional[int] = None) -> List[str]:
+        """
+        Берёт или продлевает аренды: свободные, просроченные и свои (не больше limit новых).
+        Возвращает каналы из списка, которые после вызова принадлежат узлу.
+        """
+        if not channels:
+            return []
+
+        now = time.time()
+        placeholders = ",".join("?" * len(channels))
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+
+            if limit is not None:
+                taken = {row[0] for row in conn.execute(
+                    f"SELECT channel FROM leases WHERE expires_at >= ? AND node_id != ? "
+                    f"AND channel IN ({placeholders})",
+                    (now, node_id, *channels)
+                )}
+                channels = [channel for channel in channels if channel not in taken][:limit]
+
+            conn.executemany("""
+                INSERT INTO leases (channel, node_id, expires_at) VALUES (?, ?, ?)
+                ON CONFLICT(channel) DO UPDATE SET
+                    node_id = excluded.node_id,
+                    expires_at = excluded.expires_at
+                WHERE leases.node_id = excluded.node_id OR leases.expires_at < ?
+            """, [(channel, node_id, now + ttl, now) for channel in channels])
+
+            held = {row[0] for row in conn.execute(
+                "SELECT channel FROM leases WHERE node_id = ?", (node_id,)
+            )}
+            conn.execute("COMMIT")
+            return [channel for channel in channels if channel in held]
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def release(self, node_id: str, channels: List[str]):
+        """Отдаёт аренды, чтобы другие узлы забрали каналы сразу, не дожидаясь истечения"""
+        if not channels:
+            return
+        with self._connect() as conn:
+            conn.executemany(
+                "DELETE FROM leases WHERE channel = ? AND node_id = ?",
+                [(channel, node_id) for channel in channels]
+            )
+
+    def release_node(self, node_id: str):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM leases WHERE node_id = ?", (node_id,))
+            conn.execute("DELETE FROM nodes WHERE node_id = ?", (node_id,))
+
+    def get_owners(self) -> Dict[str, str]:
+        """Канал -> узел по действующим арендам"""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT channel, node_id FROM leases WHERE expires_at >= ?", (time.time(),)
+            ).fetchall()
+        return dict(rows)
+
+class ChannelCoordinator:
+    """
+    Узел держит свою долю каналов: на каждом пульсе продлевает аренды,
+    добирает свободные (в том числе оставшиеся от упавших узлов) до справедливой
+    доли ceil(каналов / живых узлов) и отдаёт лишние, когда узлов стало больше.
+    Потерянная аренда (например, после долгой паузы процесса) означает выход из канала.
+    """
+
+    def __init__(
+        self,
+        store: LeaseStore,
+        node_id: str,
+        channels: List[str],
+        on_acquire: Callable[[str], Awaitable[None]],
+        on_release: Callable[[str], Awaitable[None]],
+        lease_ttl: float,
+        heartbeat_interval: float,
+        max_channels: int = 0
+    ):
+        self.store = store
+        self.node_id = node_id
+        self.channels = sorted(channels)
+        self.on_acquire = on_acquire
+        self.on_release = on_release
+        self.lease_ttl = lease_ttl
+        self.heartbeat_interval = heartbeat_interval
+        self.max_channels = max_channels
+        self.held: Set[str] = set()
+        self.alive_nodes = 1
+
+        # Метрики
+        self.heartbeats = 0
+        self.acquired = 0
+        self.lost = 0
+        self.handed_off = 0
+
+    def _target_share(self) -> int:
+        share = math.ceil(len(self.channels) / max(1, self.alive_nodes))
+        if self.max_channels:
+            share = min(share, self.max_channels)
+        return share
+
+    async def start(self):
+        logger.info(f"🔗 Узел {self.node_id}: претендуем на {len(self.channels)} каналов")
+        await self.heartbeat()
+
+    async def heartbeat(self):
+        """Продление, добор и отдача аренд; перерегистрируется в планировщике"""
+        try:
+            await self._heartbeat()
+        except Exception as e:
+            logger.error(f"Ошибка координации каналов: {e}")
+        finally:
+            scheduler.schedule('coordination', self.heartbeat_interval, self.heartbeat)
+
+    async def _heartbeat(self):
+        self.heartbeats += 1
+        self.alive_nodes = await asyncio.to_thread(
+            self.store.heartbeat, self.node_id, self.lease_ttl
+        )
+
+        # Продлеваем свои аренды
+        renewed = set(await asyncio.to_thread(
+            self.store.claim, self.node_id, sorted(self.held), self.lease_ttl
+        ))
+        for channel in sorted(self.held - renewed):
+            self.held.discard(channel)
+            self.lost += 1
+            logger.warning(f"[{channel}] ⚠️ Аренда потеряна, канал у другого узла")
+            await self._safe_callback(self.on_release, channel)
+
+        target = self._target_share()
+
+        # Узлов стало больше - отдаём лишнее, новые узлы заберут на своём пульсе
+        if len(self.held) > target:
+            excess = sorted(self.held)[target:]
+            await asyncio.to_thread(self.store.release, self.node_id, excess)
+            for channel in excess:
+                self.held.discard(channel)
+                self.handed_off += 1
+                logger.info(f"[{channel}] 🤝 Канал отдан другому узлу")
+                await self._safe_callback(self.on_release, channel)
+
+        # Добираем свободные каналы до своей доли
+        free_slots = target - len(self.held)
+        if free_slots > 0:
+            candidates = [channel for channel in self.channels if channel not in self.held]
+            claimed = await asyncio.to_thread(
+                self.store.claim, self.node_id, candidates, self.lease_ttl, free_slots
+            )
+            for channel in claimed:
+                self.held.add(channel)
+                self.acquired += 1
+                logger.info(f"[{channel}] 🔗 Канал взят в аренду")
+                await self._safe_callback(self.on_acquire, channel)
+
+    async def _safe_callback(self, callback: Callable[[str], Awaitable[None]], channel: str):
+        try:
+            await callback(channel)
+        except Exception as e:
+            logger.error(f"[{channel}] Ошибка смены владельца канала: {e}")
+
+    async def stop(self):
+        """Отдаёт все аренды при штатной остановке"""
+        scheduler.cancel('coordination')
+        try:
+            await asyncio.to_thread(self.store.release_node, self.node_id)
+        except Exception as e:
+            logger.error(f"Не удалось освободить аренды: {e}")
+        self.held.clear()
+
+    def get_stats(self) -> Dict:
+        return {
+            'node_id': self.node_id,
+            'held': len(self.held),
+            'target': self._target_share(),
+            'alive_nodes': self.alive_nodes,
+            'heartbeats': self.heartbeats,
+            'acquired': self.acquired,
+            'lost': self.lost,
+            'handed_off': self.handed_off,
+        }
+
+def default_node_id() -> str:
+    return config.COORDINATION_NODE_ID or f"{socket.gethostname()}-{os.getpid()}"
+
+def create_coordinator(
+    channels: List[str],
+    on_acquire: Callable[[str], Awaitable[None]],
+    on_release: Callable[[str], Awaitable[None]]
+) -> ChannelCoordinator:
+    return ChannelCoordinator(
+        store=LeaseStore(config.COORDINATION_DB_PATH),
+        node_id=default_node_id(),
+        channels=channels,
+        on_acquire=on_acquire,
+        on_release=on_release,
+        lease_ttl=config.COORDINATION_LEASE_TTL,
+        heartbeat_interval=config.COORDINATION_HEARTBEAT_INTERVAL,
+        max_channels=config.COORDINATION_MAX_CHANNELS
+    )
@@ -1,146 +1,369 @@
 # database.py - Хранение данных и статистики
 
+import os
 import sqlite3
 import datetime
 import re
 import json
+import time
 import logging  # ← ЭТО БЫЛО ПРОПУЩЕНО!
-from collections import Counter
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
 from typing import List, Dict, Optional
 
 import config
+from clock import clock
+from features import MessageFeatures, extract_features
+from analytics import BatchAnalyzer, TokenCounter
 
 logger = logging.getLogger(__name__)
 
+# Открытые соединения по каналам (см. _connect)
+_connections: Dict[str, sqlite3.Connection] = {}
+
+# LRU кеш отношений: (канал, ник) -> данные, чтобы гейт ответа не ходил в SQLite
+_relationship_cache: "OrderedDict[tuple, Dict]" = OrderedDict()
+
+# Тренды текущего часа по каналам: копятся из признаков сообщений (см. _update_chat_trends)
+TREND_FLUSH_EVERY = 20  # Строка chat_trends перезаписывается раз в N сообщений
+
+@dataclass
+class TrendBucket:
+    date: datetime.date
+    hour: int
+    message_count: int = 0
+    authors: set = field(default_factory=set)
+    words: TokenCounter = field(default_factory=TokenCounter)
+    emotes: TokenCounter = field(default_factory=TokenCounter)
+    unsaved: int = 0
+
+_trend_buckets: Dict[str, TrendBucket] = {}
+
 def get_db_name(channel_name: str) -> str:
     """Генерирует имя файла БД для канала"""
     safe_name = re.sub(r'[^\w\-]', '_', channel_name.lower())
-    return f"data/{safe_name}.db"
+    return os.path.join(config.DATA_DIR, f"{safe_name}.db")
+
+def _connect(channel_name: str) -> sqlite3.Connection:
+    """Соединение с БД канала: открывается при первом обращении и переиспользуется"""
+    conn = _connections.get(channel_name)
+    if conn is None:
+        os.makedirs(config.DATA_DIR, exist_ok=True)
+        db_name = get_db_name(channel_name)
+        conn = sqlite3.connect(db_name)
+        _create_schema(conn)
+        _connections[channel_name] = conn
+        logger.info(f"[{channel_name}] База данных инициализирована: {db_name}")
+    return conn
+
+_schema_ready = set()  # Файлы БД, где схема уже создана (для соединений из потоков)
+
+@contextmanager
+def _thread_connect(channel_name: str):
+    """
+    Отдельное короткое соединение для вызовов через asyncio.to_thread: общие
+    соединения _connect привязаны к потоку цикла событий. Фиксирует транзакцию
+    и закрывается на выходе.
+    """
+    db_name = get_db_name(channel_name)
+    fresh = db_name not in _schema_ready or not os.path.exists(db_name)
+    if fresh:
+        os.makedirs(config.DATA_DIR, exist_ok=True)
+    conn = sqlite3.connect(db_name)
+    try:
+        if fresh:
+            _create_schema(conn)
+            _schema_ready.add(db_name)
+        with conn:
+            yield conn
+    finally:
+        conn.close()
 
 def init_db(channel_name: str):
     """Инициализация базы данных для канала"""
-    import os
-    os.makedirs("data", exist_ok=True)
-    
-    db_name = get_db_name(channel_name)
-    
-    with sqlite3.connect(db_name) as conn:
-        cursor = conn.cursor()
-        
-        # Таблица сообщений
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS messages (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                author TEXT NOT NULL,
-                content TEXT NOT NULL,
-                timestamp DATETIME NOT NULL,
-                is_bot BOOLEAN DEFAULT 0,
-                emotion_score INTEGER DEFAULT 0,
-                is_question BOOLEAN DEFAULT 0
-            )
-        """)
-        
-        # Индексы для быстрого поиска
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_timestamp ON messages(timestamp)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_author ON messages(author)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_is_bot ON messages(is_bot)")
-        
-        # Таблица отношений с пользователями
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS user_relationships (
-                username TEXT NOT NULL,
-                channel TEXT NOT NULL,
-                positive_interactions INTEGER DEFAULT 0,
-                negative_interactions INTEGER DEFAULT 0,
-                total_interactions INTEGER DEFAULT 0,
-                last_interaction DATETIME,
-                relationship_level TEXT DEFAULT 'stranger',
-                trust_score REAL DEFAULT 0.5,
-                PRIMARY KEY (username, channel)
-            )
-        """)
-        
-        # Таблица фактов о пользователях
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS user_facts (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT NOT NULL,
-                channel TEXT NOT NULL,
-                fact TEXT NOT NULL,
-                category TEXT,
-                confidence REAL DEFAULT 1.0,
-                timestamp DATETIME NOT NULL,
-                last_used DATETIME,
-                usage_count INTEGER DEFAULT 0
-            )
-        """)
-        
-        # Таблица трендов и статистики
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS chat_trends (
-                channel TEXT NOT NULL,
-                date DATE NOT NULL,
-                hour INTEGER NOT NULL,
-                message_count INTEGER DEFAULT 0,
-                active_users INTEGER DEFAULT 0,
-                popular_words TEXT,
-                popular_emotes TEXT,
-                PRIMARY KEY (channel, date, hour)
-            )
-        """)
-        
-        # Таблица смайликов канала
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS channel_emotes (
-                channel TEXT NOT NULL,
-                emote_name TEXT NOT NULL,
-                source TEXT NOT NULL,  -- 7tv, bttv, ffz, twitch
-                added_date DATETIME,
-                usage_count INTEGER DEFAULT 0,
-                last_used DATETIME,
-                is_enabled BOOLEAN DEFAULT 1,
-                PRIMARY KEY (channel, emote_name, source)
-            )
-        """)
-        
-        conn.commit()
-    
-    logger.info(f"[{channel_name}] База данных инициализирована: {db_name}")
+    _connect(channel_name)
 
-def save_message(channel_name: str, author: str, content: str, is_bot: bool = False):
-    """Сохраняет сообщение в БД"""
-    db_name = get_db_name(channel_name)
+def close_channel(channel_name: str):
+    """Закрывает соединение канала и чистит его кеши (канал отключён)"""
+    conn = _connections.pop(channel_name, None)
+    bucket = _trend_buckets.pop(channel_name, None)
+    if conn is not None:
+        if bucket is not None and bucket.unsaved:
+            try:
+                _flush_chat_trends(channel_name, bucket, conn)
+                conn.commit()
+            except sqlite3.Error as e:
+                logger.error(f"[{channel_name}] Ошибка сохранения трендов: {e}")
+        conn.close()
+    for key in [key for key in _relationship_cache if key[0] == channel_name]:
+        del _relationship_cache[key]
+
+def close_all():
+    for channel_name in list(_connections):
+        close_channel(channel_name)
+
+def _create_schema(conn: sqlite3.Connection):
+    """Создаёт таблицы и индексы БД канала"""
+    cursor = conn.cursor()
     
+    # Таблица сообщений
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            author TEXT NOT NULL,
+            content TEXT NOT NULL,
+            timestamp DATETIME NOT NULL,
+            is_bot BOOLEAN DEFAULT 0,
+            emotion_score INTEGER DEFAULT 0,
+            is_question BOOLEAN DEFAULT 0
+        )
+    """)
+    
+    # Индексы для быстрого поиска
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_timestamp ON messages(timestamp)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_author ON messages(author)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_is_bot ON messages(is_bot)")
+    
+    # Таблица отношений с пользователями
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS user_relationships (
+            username TEXT NOT NULL,
+            channel TEXT NOT NULL,
+            positive_interactions INTEGER DEFAULT 0,
+            negative_interactions INTEGER DEFAULT 0,
+            total_interactions INTEGER DEFAULT 0,
+            last_interaction DATETIME,
+            relationship_level TEXT DEFAULT 'stranger',
+            trust_score REAL DEFAULT 0.5,
+            PRIMARY KEY (username, channel)
+        )
+    """)
+    
+    # Таблица фактов о пользователях
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS user_facts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT NOT NULL,
+            channel TEXT NOT NULL,
+            fact TEXT NOT NULL,
+            category TEXT,
+            confidence REAL DEFAULT 1.0,
+            timestamp DATETIME NOT NULL,
+            last_used DATETIME,
+            usage_count INTEGER DEFAULT 0
+        )
+    """)
+    
+    # Таблица трендов и статистики
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS chat_trends (
+            channel TEXT NOT NULL,
+            date DATE NOT NULL,
+            hour INTEGER NOT NULL,
+            message_count INTEGER DEFAULT 0,
+            active_users INTEGER DEFAULT 0,
+            popular_words TEXT,
+            popular_emotes TEXT,
+            PRIMARY KEY (channel, date, hour)
+        )
+    """)
+    
+    # Таблица смайликов канала
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS channel_emotes (
+            channel TEXT NOT NULL,
+            emote_name TEXT NOT NULL,
+            source TEXT NOT NULL,  -- 7tv, bttv, ffz, twitch
+            added_date DATETIME,
+            usage_count INTEGER DEFAULT 0,
+            last_used DATETIME,
+            is_enabled BOOLEAN DEFAULT 1,
+            PRIMARY KEY (channel, emote_name, source)
+        )
+    """)
+    
+    # Метаданные наборов смайликов для условной перепроверки (см. emote_manager._load_source)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS emote_cache (
+            channel TEXT NOT NULL,
+            source TEXT NOT NULL,
+            set_id TEXT,  -- id набора у сервиса (подписка на изменения 7TV)
+            etag TEXT,
+            last_modified TEXT,
+            fetched_at REAL NOT NULL,  -- time.time() последней загрузки или ответа 304
+            ttl REAL NOT NULL,  -- Сколько секунд набор считается свежим без запроса
+            PRIMARY KEY (channel, source)
+        )
+    """)
+    
+    conn.commit()
+
+def save_message(channel_name: str, author: str, content: str, is_bot: bool = False,
+                 features: Optional[MessageFeatures] = None):
+    """Сохраняет сообщение в БД (признаки берутся готовые, если бот уже разобрал сообщение)"""
     try:
-        with sqlite3.connect(db_name) as conn:
+        with _connect(channel_name) as conn:
             cursor = conn.cursor()
             
-            # Анализируем сообщение
-            emotion_score = _analyze_emotion(content)
-            is_question = _is_question(content)
+            if features is None:
+                features = extract_features(content)
             
             cursor.execute("""
                 INSERT INTO messages (author, content, timestamp, is_bot, emotion_score, is_question)
                 VALUES (?, ?, ?, ?, ?, ?)
-            """, (author, content, datetime.datetime.now(), is_bot, emotion_score, is_question))
+            """, (author, content, clock.now(), is_bot, features.sentiment, features.is_question))
             
             # Обновляем статистику пользователя
             _update_user_stats(channel_name, author, is_bot, conn)
             
             # Обновляем тренды чата
-            _update_chat_trends(channel_name, conn)
+            if not is_bot:
+                _update_chat_trends(channel_name, author, features, conn, cursor.lastrowid)
             
             conn.commit()
             
     except sqlite3.Error as e:
         logger.error(f"[{channel_name}] Ошибка сохранения сообщения: {e}")
 
+def load_emote_cache(channel_name: str) -> Dict[str, Dict]:
+    """
+    Сохранённые наборы смайликов канала: источник -> смайлики (в порядке API) и метаданные HTTP.
+    Загрузчики смайликов зовут эту функцию, save_emote_cache и touch_emote_cache
+    через asyncio.to_thread, поэтому здесь своё соединение (_thread_connect).
+    """
+    try:
+        with _thread_connect(channel_name) as conn:
+            cache = {}
+            for source, set_id, etag, last_modified, fetched_at, ttl in conn.execute(
+                "SELECT source, set_id, etag, last_modified, fetched_at, ttl FROM emote_cache WHERE channel = ?",
+                (channel_name,)
+            ):
+                cache[source] = {
+                    'emotes': [],
+                    'set_id': set_id,
+                    'etag': etag,
+                    'last_modified': last_modified,
+                    'fetched_at': fetched_at,
+                    'ttl': ttl
+                }
+            
+            for source, emote_name in conn.execute(
+                "SELECT source, emote_name FROM channel_emotes "
+                "WHERE channel = ? AND is_enabled = 1 ORDER BY rowid",
+                (channel_name,)
+            ):
+                if source in cache:
+                    cache[source]['emotes'].append(emote_name)
+            
+            return cache
+            
+    except sqlite3.Error as e:
+        logger.error(f"[{channel_name}] Ошибка чтения кеша смайликов: {e}")
+        return {}
+
+def save_emote_cache(channel_name: str, source: str, emotes: List[str], set_id: Optional[str] = None,
+                     etag: Optional[str] = None, last_modified: Optional[str] = None,
+                     ttl: Optional[float] = None):
+    """Перезаписывает набор смайликов источника (дата добавления и счётчики сохраняются)"""
+    if ttl is None:
+        ttl = config.EMOTE_CACHE_TTL
+    try:
+        with _thread_connect(channel_name) as conn:
+            cursor = conn.cursor()
+            
+            previous = {
+                row[0]: row[1:] for row in cursor.execute(
+                    "SELECT emote_name, added_date, usage_count, last_used FROM channel_emotes "
+                    "WHERE channel = ? AND source = ?",
+                    (channel_name, source)
+                )
+            }
+            
+            # Удаляем и вставляем заново: порядок rowid = порядок смайликов в ответе API
+            cursor.execute("DELETE FROM channel_emotes WHERE channel = ? AND source = ?", (channel_name, source))
+            now = clock.now()
+            cursor.executemany("""
+                INSERT OR IGNORE INTO channel_emotes (channel, emote_name, source, added_date, usage_count, last_used)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, [(channel_name, emote, source, *previous.get(emote, (now, 0, None))) for emote in emotes])
+            
+            cursor.execute("""
+                INSERT INTO emote_cache (channel, source, set_id, etag, last_modified, fetched_at, ttl)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(channel, source) DO UPDATE SET
+                    set_id = excluded.set_id, etag = excluded.etag, last_modified = excluded.last_modified,
+                    fetched_at = excluded.fetched_at, ttl = excluded.ttl
+            """, (channel_name, source, set_id, etag, last_modified, time.time(), ttl))
+            
+            conn.commit()
+            
+    except sqlite3.Error as e:
+        logger.error(f"[{channel_name}] Ошибка сохранения смайликов {source}: {e}")
+
+def update_emote_cache(channel_name: str, source: str, added: List[str], removed: List[str],
+                       renamed: List[tuple]):
+    """
+    Изменения набора по событиям (см. emote_manager.apply_emote_changes): только
+    затронутые строки. Переименованная строка сохраняет дату добавления и usage_count.
+    ETag сбрасывается - он описывал прежний набор, сверка скачает набор целиком.
+    """
+    try:
+        with _connect(channel_name) as conn:
+            cursor = conn.cursor()
+            
+            cursor.executemany(
+                "DELETE FROM channel_emotes WHERE channel = ? AND source = ? AND emote_name = ?",
+                [(channel_name, source, emote) for emote in removed]
+            )
+            for old, new in renamed:
+                cursor.execute("""
+                    UPDATE OR IGNORE channel_emotes SET emote_name = ?
+                    WHERE channel = ? AND source = ? AND emote_name = ?
+                """, (new, channel_name, source, old))
+                # Новое имя уже было в наборе - остаётся его строка
+                cursor.execute(
+                    "DELETE FROM channel_emotes WHERE channel = ? AND source = ? AND emote_name = ?",
+                    (channel_name, source, old)
+                )
+            now = clock.now()
+            cursor.executemany("""
+                INSERT OR IGNORE INTO channel_emotes (channel, emote_name, source, added_date)
+                VALUES (?, ?, ?, ?)
+            """, [(channel_name, emote, source, now) for emote in added])
+            
+            cursor.execute("""
+                UPDATE emote_cache SET etag = NULL, last_modified = NULL, fetched_at = ?
+                WHERE channel = ? AND source = ?
+            """, (time.time(), channel_name, source))
+            
+            conn.commit()
+            
+    except sqlite3.Error as e:
+        logger.error(f"[{channel_name}] Ошибка обновления смайликов {source}: {e}")
+
+def touch_emote_cache(channel_name: str, source: str, etag: Optional[str] = None,
+                      last_modified: Optional[str] = None, ttl: Optional[float] = None):
+    """Набор не изменился (ответ 304): продлеваем свежесть, смайлики не трогаем"""
+    if ttl is None:
+        ttl = config.EMOTE_CACHE_TTL
+    try:
+        with _thread_connect(channel_name) as conn:
+            conn.execute("""
+                UPDATE emote_cache SET
+                    etag = COALESCE(?, etag), last_modified = COALESCE(?, last_modified),
+                    fetched_at = ?, ttl = ?
+                WHERE channel = ? AND source = ?
+            """, (etag, last_modified, time.time(), ttl, channel_name, source))
+            conn.commit()
+            
+    except sqlite3.Error as e:
+        logger.error(f"[{channel_name}] Ошибка обновления кеша смайликов {source}: {e}")
+
 def get_last_messages(channel_name: str, limit: int = 20) -> List[Dict]:
     """Получает последние сообщения из чата"""
-    db_name = get_db_name(channel_name)
-    
     try:
-        with sqlite3.connect(db_name) as conn:
+        with _connect(channel_name) as conn:
             cursor = conn.cursor()
             cursor.execute("""
                 SELECT author, content, is_bot 
@@ -166,13 +389,11 @@ def get_last_messages(channel_name: str, limit: int = 20) -> List[Dict]:
 
 def get_conversation_context(channel_name: str, minutes: int = 10) -> List[Dict]:
     """Получает контекст диалога за последние N минут"""
-    db_name = get_db_name(channel_name)
-    
     try:
-        with sqlite3.connect(db_name) as conn:
+        with _connect(channel_name) as conn:
             cursor = conn.cursor()
             
-            time_threshold = datetime.datetime.now() - datetime.timedelta(minutes=minutes)
+            time_threshold = clock.now() - datetime.timedelta(minutes=minutes)
             
             cursor.execute("""
                 SELECT author, content, is_bot, timestamp
@@ -198,10 +419,8 @@ def get_conversation_context(channel_name: str, minutes: int = 10) -> List[Dict]
 
 def update_user_relationship(channel_name: str, username: str, is_positive: bool = True):
     """Обновляет отношения с пользователем"""
-    db_name = get_db_name(channel_name)
-    
     try:
-        with sqlite3.connect(db_name) as conn:
+        with _connect(channel_name) as conn:
             cursor = conn.cursor()
             
             # Получаем текущие данные
@@ -213,7 +432,7 @@ def update_user_relationship(channel_name: str, username: str, is_positive: bool
             
             result = cursor.fetchone()
             
-            now = datetime.datetime.now()
+            now = clock.now()
             
             if result:
                 pos, neg, total, trust = result
@@ -259,12 +478,28 @@ def update_user_relationship(channel_name: str, username: str, is_positive: bool
             
     except sqlite3.Error as e:
         logger.error(f"[{channel_name}] Ошибка обновления отношений: {e}")
+    finally:
+        _relationship_cache.pop((channel_name, username.lower()), None)
 
 def get_user_relationship(channel_name: str, username: str) -> Dict:
-    """Получает информацию об отношениях с пользователем"""
-    db_name = get_db_name(channel_name)
-    
-    default_response = {
+    """Получает информацию об отношениях с пользователем (через LRU кеш)"""
+    key = (channel_name, username.lower())
+    cached = _relationship_cache.get(key)
+    if cached is not None:
+        _relationship_cache.move_to_end(key)
+        return dict(cached)
+    
+    relationship = _load_user_relationship(channel_name, username)
+    if relationship is not None:
+        _relationship_cache[key] = relationship
+        if len(_relationship_cache) > config.RELATIONSHIP_CACHE_SIZE:
+            _relationship_cache.popitem(last=False)
+        return dict(relationship)
+    
+    return _default_relationship()
+
+def _default_relationship() -> Dict:
+    return {
         'positive': 0,
         'negative': 0,
         'total': 0,
@@ -272,9 +507,11 @@ def get_user_relationship(channel_name: str, username: str) -> Dict:
         'level': 'stranger',
         'last_interaction': None
     }
-    
+
+def _load_user_relationship(channel_name: str, username: str) -> Optional[Dict]:
+    """Читает отношения из БД (None при ошибке)"""
     try:
-        with sqlite3.connect(db_name) as conn:
+        with _connect(channel_name) as conn:
             cursor = conn.cursor()
             
             cursor.execute("""
@@ -297,21 +534,19 @@ def get_user_relationship(channel_name: str, username: str) -> Dict:
                     'last_interaction': last_interaction
                 }
             else:
-                return default_response
+                return _default_relationship()
             
     except sqlite3.Error as e:
         logger.error(f"[{channel_name}] Ошибка получения отношений: {e}")
-        return default_response
+        return None
 
 def save_user_fact(channel_name: str, username: str, fact: str, category: str = None):
     """Сохраняет факт о пользователе"""
     if not fact or len(fact) < 5:
         return
     
-    db_name = get_db_name(channel_name)
-    
     try:
-        with sqlite3.connect(db_name) as conn:
+        with _connect(channel_name) as conn:
             cursor = conn.cursor()
             
             # Проверяем, нет ли похожего факта
@@ -332,7 +567,7 @@ def save_user_fact(channel_name: str, username: str, fact: str, category: str =
                         SET usage_count = usage_count + 1,
                             last_used = ?
                         WHERE id = ?
-                    """, (datetime.datetime.now(), fact_id))
+                    """, (clock.now(), fact_id))
                     conn.commit()
                     return
             
@@ -342,7 +577,7 @@ def save_user_fact(channel_name: str, username: str, fact: str, category: str =
                 (username, channel, fact, category, confidence, timestamp, last_used, usage_count)
                 VALUES (?, ?, ?, ?, ?, ?, ?, ?)
             """, (username.lower(), channel_name, fact, category, 1.0, 
-                  datetime.datetime.now(), datetime.datetime.now(), 1))
+                  clock.now(), clock.now(), 1))
             
             # Ограничиваем количество фактов на пользователя
             cursor.execute("""
@@ -370,10 +605,8 @@ def save_user_fact(channel_name: str, username: str, fact: str, category: str =
 
 def get_user_facts(channel_name: str, username: str, limit: int = 5) -> List[str]:
     """Получает факты о пользователе"""
-    db_name = get_db_name(channel_name)
-    
     try:
-        with sqlite3.connect(db_name) as conn:
+        with _connect(channel_name) as conn:
             cursor = conn.cursor()
             
             cursor.execute("""
@@ -393,43 +626,28 @@ def get_user_facts(channel_name: str, username: str, limit: int = 5) -> List[str
 
 def get_chat_activity(channel_name: str, minutes: int = 5) -> Dict:
     """Получает активность чата за последние N минут"""
-    db_name = get_db_name(channel_name)
-    
     try:
-        with sqlite3.connect(db_name) as conn:
+        with _connect(channel_name) as conn:
             cursor = conn.cursor()
             
-            time_threshold = datetime.datetime.now() - datetime.timedelta(minutes=minutes)
-            
-            # Количество сообщений
-            cursor.execute("""
-                SELECT COUNT(*) FROM messages 
-                WHERE timestamp > ? AND channel = ? AND is_bot = 0
-            """, (time_threshold, channel_name))
-            
-            message_count = cursor.fetchone()[0]
+            time_threshold = clock.now() - datetime.timedelta(minutes=minutes)
             
-            # Уникальные пользователи
+            # Один запрос, счётчики и популярные слова - пачкой (analytics.py)
             cursor.execute("""
-                SELECT COUNT(DISTINCT author) FROM messages 
-                WHERE timestamp > ? AND channel = ? AND is_bot = 0
-            """, (time_threshold, channel_name))
-            
-            unique_users = cursor.fetchone()[0]
-            
-            # Самые популярные слова
-            cursor.execute("""
-                SELECT content FROM messages 
-                WHERE timestamp > ? AND channel = ? AND is_bot = 0
-            """, (time_threshold, channel_name))
+                SELECT author, content FROM messages 
+                WHERE timestamp > ? AND is_bot = 0
+            """, (time_threshold,))
             
-            messages = [row[0] for row in cursor.fetchall()]
-            popular_words = _extract_popular_words(messages, top_n=5)
+            rows = cursor.fetchall()
+            analyzer = BatchAnalyzer()
+            analyzer.add_batch([row[1] for row in rows], authors=[row[0] for row in rows])
+            report = analyzer.report(top_n=5)
+            message_count = report.message_count
             
             return {
                 'message_count': message_count,
-                'unique_users': unique_users,
-                'popular_words': popular_words,
+                'unique_users': report.unique_users,
+                'popular_words': [word for word, count in report.top_words],
                 'activity_level': 'high' if message_count > 30 else 'medium' if message_count > 10 else 'low'
             }
             
@@ -437,40 +655,6 @@ def get_chat_activity(channel_name: str, minutes: int = 5) -> Dict:
         logger.error(f"[{channel_name}] Ошибка получения активности: {e}")
         return {'message_count': 0, 'unique_users': 0, 'popular_words': [], 'activity_level': 'low'}
 
-def _analyze_emotion(text: str) -> int:
-    """Анализирует эмоциональную окраску текста"""
-    text_lower = text.lower()
-    
-    positive_words = ['хорошо', 'отлично', 'круто', 'класс', 'люблю', 'нравится', 'рад', 'смешно', 'lol', 'lul', 'pog']
-    negative_words = ['плохо', 'ужасно', 'ненавижу', 'скучно', 'грустно', 'злой', 'злюсь', 'sad', 'bad', 'cringe']
-    
-    score = 0
-    for word in positive_words:
-        if word in text_lower:
-            score += 1
-    
-    for word in negative_words:
-        if word in text_lower:
-            score -= 1
-    
-    return max(-5, min(5, score))
-
-def _is_question(text: str) -> bool:
-    """Проверяет, является ли текст вопросом"""
-    question_words = ['кто', 'что', 'где', 'когда', 'почему', 'зачем', 'как', 'сколько', 'чей']
-    text_lower = text.lower().strip()
-    
-    # Проверяем по первому слову
-    first_word = text_lower.split()[0] if text_lower.split() else ""
-    if first_word in question_words:
-        return True
-    
-    # Проверяем по знакам препинания
-    if text_lower.endswith('?'):
-        return True
-    
-    return False
-
 def _calculate_relationship_level(positive: int, negative: int, trust: float) -> str:
     """Рассчитывает уровень отношений"""
     total = positive + negative
@@ -513,29 +697,6 @@ def _are_facts_similar(fact1: str, fact2: str, similarity_threshold: float = 0.7
         common_words = words1.intersection(words2)
         return len(common_words) >= min(len(words1), len(words2)) * 0.5
 
-def _extract_popular_words(messages: List[str], top_n: int = 5) -> List[str]:
-    """Извлекает популярные слова из сообщений"""
-    import re
-    
-    all_words = []
-    stop_words = {'и', 'в', 'не', 'на', 'я', 'с', 'что', 'он', 'по', 'это', 'но', 'как', 'а', 'то', 'ну'}
-    
-    for message in messages:
-        # Убираем ссылки и специальные символы
-        clean_message = re.sub(r'https?://\S+|www\.\S+|[^\w\s]', ' ', message.lower())
-        words = clean_message.split()
-        
-        # Фильтруем стоп-слова и короткие слова
-        for word in words:
-            if len(word) > 2 and word not in stop_words and not word.isdigit():
-                all_words.append(word)
-    
-    # Считаем частоту
-    word_counts = Counter(all_words)
-    
-    # Возвращаем топ N слов
-    return [word for word, count in word_counts.most_common(top_n)]
-
 def _update_user_stats(channel_name: str, username: str, is_bot: bool, conn):
     """Обновляет статистику пользователя"""
     if is_bot:
@@ -549,7 +710,7 @@ def _update_user_stats(channel_name: str, username: str, is_bot: bool, conn):
         SET total_interactions = total_interactions + 1,
             last_interaction = ?
         WHERE username = ? AND channel = ?
-    """, (datetime.datetime.now(), username.lower(), channel_name))
+    """, (clock.now(), username.lower(), channel_name))
     
     # Если пользователя еще нет, создаем запись
     if cursor.rowcount == 0:
@@ -557,61 +718,76 @@ def _update_user_stats(channel_name: str, username: str, is_bot: bool, conn):
             INSERT INTO user_relationships 
             (username, channel, total_interactions, last_interaction)
             VALUES (?, ?, 1, ?)
-        """, (username.lower(), channel_name, datetime.datetime.now()))
-
-def _update_chat_trends(channel_name: str, conn):
-    """Обновляет тренды чата"""
-    cursor = conn.cursor()
-    now = datetime.datetime.now()
-    date = now.date()
-    hour = now.hour
-    
-    # Получаем сообщения за последний час
-    hour_ago = now - datetime.timedelta(hours=1)
-    
-    cursor.execute("""
-        SELECT content FROM messages 
-        WHERE timestamp > ? AND channel = ? AND is_bot = 0
-    """, (hour_ago, channel_name))
-    
-    messages = [row[0] for row in cursor.fetchall()]
-    
-    if messages:
-        # Извлекаем популярные слова и смайлики
-        popular_words = _extract_popular_words(messages, top_n=10)
-        popular_emotes = _extract_emotes(messages, top_n=10)
-        
-        # Сохраняем в формате JSON
-        words_json = json.dumps(popular_words)
-        emotes_json = json.dumps(popular_emotes)
-        
-        cursor.execute("""
-            INSERT OR REPLACE INTO chat_trends 
-            (channel, date, hour, message_count, active_users, popular_words, popular_emotes)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        """, (channel_name, date, hour, len(messages), 
-              len(set([msg[0] for msg in cursor.fetchall()])), 
-              words_json, emotes_json))
-
-def _extract_emotes(messages: List[str], top_n: int = 10) -> List[str]:
-    """Извлекает смайлики из сообщений"""
-    import re
+        """, (username.lower(), channel_name, clock.now()))
     
-    # Паттерны для смайликов (базовые)
-    emote_patterns = [
-        r'\b[A-Z][a-z]+[A-Z][a-z]+\b',  # CamelCase
-        r'\b[A-Z]{3,}\b',  # UPPERCASE
-    ]
-    
-    all_emotes = []
-    
-    for message in messages:
-        for pattern in emote_patterns:
-            emotes = re.findall(pattern, message)
-            all_emotes.extend(emotes)
-    
-    # Считаем частоту
-    emote_counts = Counter(all_emotes)
-    
-    # Возвращаем топ N
-    return [emote for emote, count in emote_counts.most_common(top_n)]
\ No newline at end of file
+    # Уровень отношений от этого не меняется - правим кеш на месте, а не сбрасываем
+    cached = _relationship_cache.get((channel_name, username.lower()))
+    if cached is not None:
+        cached['total'] += 1
+        cached['last_interaction'] = clock.now()
+
+def _update_chat_trends(channel_name: str, author: str, features: MessageFeatures, conn, message_id: int):
+    """
+    Обновляет тренды чата текущего часа. Слова и смайлики копятся из признаков
+    сообщения, а не пересчитываются по сообщениям за час на каждое новое.
+    """
+    now = clock.now()
+    date, hour = now.date(), now.hour
+    
+    bucket = _trend_buckets.get(channel_name)
+    if bucket is None or (bucket.date, bucket.hour) != (date, hour):
+        if bucket is not None and bucket.unsaved:
+            _flush_chat_trends(channel_name, bucket, conn)
+        bucket = _trend_buckets[channel_name] = _load_trend_bucket(channel_name, date, hour, conn, message_id)
+    
+    bucket.message_count += 1
+    bucket.authors.add(author)
+    bucket.words.update(features.content_words)
+    bucket.emotes.update(features.emote_tokens)
+    bucket.unsaved += 1
+    
+    if bucket.unsaved >= TREND_FLUSH_EVERY:
+        _flush_chat_trends(channel_name, bucket, conn)
+
+def _load_trend_bucket(channel_name: str, date: datetime.date, hour: int, conn, before_id: int) -> TrendBucket:
+    """
+    Новая корзина часа. Если строка этого часа уже есть (перезапуск, сон канала,
+    повторный вход), корзина досчитывается по сообщениям часа из БД - иначе
+    INSERT OR REPLACE затёр бы накопленное меньшими числами. Смайлики при этом
+    определяются по регистру букв (набора канала здесь нет).
+    """
+    bucket = TrendBucket(date=date, hour=hour)
+    exists = conn.execute(
+        "SELECT 1 FROM chat_trends WHERE channel = ? AND date = ? AND hour = ?",
+        (channel_name, date.isoformat(), hour)
+    ).fetchone()
+    if exists is None:
+        return bucket
+    
+    start = datetime.datetime.combine(date, datetime.time(hour))
+    rows = conn.execute("""
+        SELECT author, content FROM messages
+        WHERE is_bot = 0 AND timestamp >= ? AND timestamp < ? AND id < ?
+    """, (start, start + datetime.timedelta(hours=1), before_id)).fetchall()
+    if rows:
+        authors, texts = zip(*rows)
+        analyzer = BatchAnalyzer()
+        analyzer.add_batch(texts)
+        bucket.message_count = len(rows)
+        bucket.authors = set(authors)
+        bucket.words = analyzer.words
+        bucket.emotes = analyzer.emotes
+    return bucket
+
+def _flush_chat_trends(channel_name: str, bucket: TrendBucket, conn):
+    """Записывает тренды часа в chat_trends"""
+    popular_words = [word for word, count in bucket.words.most_common(10)]
+    popular_emotes = [emote for emote, count in bucket.emotes.most_common(10)]
+    
+    conn.execute("""
+        INSERT OR REPLACE INTO chat_trends 
+        (channel, date, hour, message_count, active_users, popular_words, popular_emotes)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, (channel_name, bucket.date.isoformat(), bucket.hour, bucket.message_count,
+          len(bucket.authors), json.dumps(popular_words), json.dumps(popular_emotes)))
+    bucket.unsaved = 0
@@ -0,0 +1,250 @@
+# emote_events.py - Подписка на изменения наборов смайликов 7TV (EventAPI v3, websocket)
+import asyncio
+import json
+import logging
+from collections import Counter
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+import aiohttp
+
+import config
+from emote_manager import emote_manager
+
+logger = logging.getLogger(__name__)
+
+# Коды сообщений EventAPI
+OP_DISPATCH = 0
+OP_HELLO = 1
+OP_HEARTBEAT = 2
+OP_RECONNECT = 4
+OP_ACK = 5
+OP_ERROR = 6
+OP_END_OF_STREAM = 7
+OP_SUBSCRIBE = 35
+OP_UNSUBSCRIBE = 36
+
+EMOTE_SET_UPDATE = 'emote_set.update'
+HEARTBEAT_TIMEOUT_FACTOR = 3  # Нет сообщений дольше N интервалов пульса - соединение считаем мёртвым
+
+ChangeHandler = Callable[[str, str, Iterable[str], Iterable[str], Iterable[Tuple[str, str]]], bool]
+
+def parse_emote_set_update(body: Dict) -> Tuple[List[str], List[str], List[Tuple[str, str]]]:
+    """Тело emote_set.update -> (добавлены, удалены, переименованы (старое, новое))"""
+    added = [change['value']['name'] for change in body.get('pushed') or []
+             if change.get('key') == 'emotes' and change.get('value')]
+    removed = [change['old_value']['name'] for change in body.get('pulled') or []
+               if change.get('key') == 'emotes' and change.get('old_value')]
+    renamed = []
+    for change in body.get('updated') or []:
+        old, new = change.get('old_value'), change.get('value')
+        if change.get('key') == 'emotes' and old and new and old['name'] != new['name']:
+            renamed.append((old['name'], new['name']))
+    return added, removed, renamed
+
+class EmoteEventSubscriber:
+    """
+    Одно websocket-соединение с EventAPI на все каналы: подписка на
+    emote_set.update по id набора 7TV каждого канала. Изменения применяются
+    к индексу смайликов сразу (on_change), поэтому новый смайлик виден
+    через секунды, а полная перезагрузка наборов нужна только для сверки
+    (EMOTE_CONSISTENCY_INTERVAL). При обрыве - переподключение с растущей
+    паузой и повторная подписка; изменения за обрыв не повторяются, поэтому
+    после переподключения каналы передаются в on_resync на внеочередную сверку.
+    """
+
+    def __init__(self, url: str, on_change: ChangeHandler,
+                 on_resync: Optional[Callable[[List[str]], None]] = None):
+        self.url = url
+        self.on_change = on_change
+        self.on_resync = on_resync
+        self.set_channels: Dict[str, str] = {}  # id набора -> канал
+        self.channel_sets: Dict[str, str] = {}  # канал -> id набора
+        self.subscription_limit: Optional[int] = None
+
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._ws: Optional[aiohttp.ClientWebSocketResponse] = None
+        self._task: Optional[asyncio.Task] = None
+        self._subscribed: Set[str] = set()  # id наборов, подписанных в текущем соединении
+        self._greeted_before = False  # Было ли уже рабочее соединение (следующее - после обрыва)
+
+        # Статистика
+        self.stats: Counter = Counter()  # connects, dispatches, added, removed, renamed, ...
+
+    @property
+    def is_running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    @property
+    def is_connected(self) -> bool:
+        return self._ws is not None and not self._ws.closed
+
+    def start(self):
+        if self.is_running:
+            return
+        self._task = asyncio.get_running_loop().create_task(self._run())
+        logger.info(f"📡 Подписка на изменения смайликов 7TV: {self.url}")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._session:
+            await self._session.close()
+            self._session = None
+
+    def subscribe(self, channel_name: str, set_id: Optional[str]):
+        """Следить за набором канала (None - у канала нет набора 7TV); смена набора переподписывает"""
+        current = self.channel_sets.get(channel_name)
+        if current == set_id:
+            return
+        if current is not None:
+            self.unsubscribe(channel_name)
+        if set_id is None:
+            return
+        self.channel_sets[channel_name] = set_id
+        self.set_channels[set_id] = channel_name
+        self._send_subscription(OP_SUBSCRIBE, set_id)
+
+    def unsubscribe(self, channel_name: str):
+        set_id = self.channel_sets.pop(channel_name, None)
+        if set_id is not None:
+            self.set_channels.pop(set_id, None)
+            self._send_subscription(OP_UNSUBSCRIBE, set_id)
+
+    def _send_subscription(self, op: int, set_id: str):
+        """Подписка сразу, если соединение есть; иначе её отправит _on_hello"""
+        if not self.is_connected:
+            return
+        if op == OP_SUBSCRIBE:
+            if set_id in self._subscribed:
+                return
+            if self.subscription_limit is not None and len(self._subscribed) >= self.subscription_limit:
+                self.stats['over_limit'] += 1
+                return  # Канал обновится сверкой
+            self._subscribed.add(set_id)
+        else:
+            if set_id not in self._subscribed:
+                return
+            self._subscribed.discard(set_id)
+        message = {'op': op, 'd': {'type': EMOTE_SET_UPDATE, 'condition': {'object_id': set_id}}}
+        asyncio.get_running_loop().create_task(self._send(message))
+
+    async def _send(self, message: Dict):
+        try:
+            await self._ws.send_str(json.dumps(message))
+        except Exception as e:
+            logger.debug(f"Ошибка отправки в EventAPI: {e}")
+
+    async def _run(self):
+        delay = 1.0
+        while True:
+            try:
+                if self._session is None:
+                    self._session = aiohttp.ClientSession()
+                async with self._session.ws_connect(self.url) as ws:
+                    self.stats['connects'] += 1
+                    if await self._read(ws):
+                        delay = 1.0  # Соединение работало - паузы снова растут с секунды
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"⚠️ EventAPI 7TV недоступен: {e}")
+            finally:
+                self._ws = None
+                self._subscribed.clear()
+
+            self.stats['reconnects'] += 1
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, config.EMOTE_EVENTS_RECONNECT_MAX)
+
+    async def _read(self, ws: aiohttp.ClientWebSocketResponse) -> bool:
+        """Читает соединение до обрыва; True - сервер успел поздороваться"""
+        greeted = False
+        timeout = config.EMOTE_HTTP_TIMEOUT  # До приветствия интервал пульса неизвестен
+        while True:
+            try:
+                message = await asyncio.wait_for(ws.receive(), timeout)
+            except asyncio.TimeoutError:
+                logger.warning("⚠️ EventAPI 7TV молчит дольше интервала пульса, переподключаемся")
+                return greeted  # Рабочая сессия всё равно сбрасывает паузу
+            if message.type != aiohttp.WSMsgType.TEXT:
+                return greeted  # Закрыто сервером или ошибка
+
+            payload = json.loads(message.data)
+            op, data = payload.get('op'), payload.get('d') or {}
+            if op == OP_HELLO:
+                greeted = True
+                self._ws = ws  # Подписки отправляются только после приветствия
+                interval = data.get('heartbeat_interval')
+                timeout = interval / 1000 * HEARTBEAT_TIMEOUT_FACTOR if interval else None
+                self._on_hello(data)
+            elif op == OP_DISPATCH:
+                self._on_dispatch(data)
+            elif op in (OP_RECONNECT, OP_END_OF_STREAM):
+                logger.info(f"EventAPI 7TV просит переподключиться (op {op})")
+                return greeted
+            elif op == OP_ERROR:
+                logger.warning(f"⚠️ Ошибка EventAPI 7TV: {data}")
+
+    def _on_hello(self, data: Dict):
+        self.subscription_limit = data.get('subscription_limit')
+        if self.subscription_limit is not None and self.subscription_limit < 0:
+            self.subscription_limit = None  # -1 - без предела
+        for set_id in list(self.set_channels):
+            self._send_subscription(OP_SUBSCRIBE, set_id)
+        logger.info(f"📡 EventAPI 7TV подключен, подписок: {len(self._subscribed)}")
+        
+        if self._greeted_before:
+            self.stats['resyncs'] += 1
+            if self.on_resync is not None:
+                try:
+                    self.on_resync(list(self.channel_sets))
+                except Exception as e:
+                    logger.error(f"Ошибка сверки смайликов после переподключения: {e}")
+        self._greeted_before = True
+
+    def _on_dispatch(self, data: Dict):
+        if data.get('type') != EMOTE_SET_UPDATE:
+            return
+        body = data.get('body') or {}
+        channel_name = self.set_channels.get(body.get('id'))
+        if channel_name is None:
+            return
+        added, removed, renamed = parse_emote_set_update(body)
+        if not (added or removed or renamed):
+            return
+
+        self.stats['dispatches'] += 1
+        self.stats['added'] += len(added)
+        self.stats['removed'] += len(removed)
+        self.stats['renamed'] += len(renamed)
+        try:
+            applied = self.on_change(channel_name, '7tv', added, removed, renamed)
+        except Exception as e:
+            logger.error(f"[{channel_name}] Ошибка применения изменений смайликов: {e}")
+            return
+        if applied:
+            logger.info(f"[{channel_name}] 📡 Смайлики 7TV: +{len(added)} -{len(removed)} "
+                       f"~{len(renamed)}")
+
+    def get_stats(self) -> Dict:
+        return {
+            'connected': self.is_connected,
+            'channels': len(self.channel_sets),
+            'subscribed': len(self._subscribed),
+            'connects': self.stats['connects'],
+            'reconnects': self.stats['reconnects'],
+            'dispatches': self.stats['dispatches'],
+            'added': self.stats['added'],
+            'removed': self.stats['removed'],
+            'renamed': self.stats['renamed'],
+            'over_limit': self.stats['over_limit'],
+            'resyncs': self.stats['resyncs'],
+        }
+
+# Глобальный экземпляр подписки
+emote_events = EmoteEventSubscriber(config.EMOTE_EVENTS_URL, emote_manager.apply_emote_changes)
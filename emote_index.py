@@ -0,0 +1,219 @@
+# emote_index.py - Индекс смайликов канала: веса в дереве Фенвика для выбора за O(log n)
+import heapq
+import itertools
+import random
+from typing import Dict, Iterable, List, Optional
+
+# Бонус за источник (7TV приоритетнее); смайлик берёт источник, где встретился первым
+SOURCE_BONUS = {'7tv': 1.5, 'bttv_global': 1.3, 'bttv': 1.3, 'ffz': 1.2}
+SHORT_EMOTE_LENGTH = 6  # Короткие смайлы чаще используются
+SHORT_EMOTE_BONUS = 1.2
+RECENT_PENALTY = 0.3
+REBUILD_EVERY = 10000  # Дерево пересобирается, чтобы не копилась ошибка округления
+EMPTY_TOTAL = 1e-9  # Сумма весов меньше - считаем, что доступных смайликов нет
+
+class FenwickTree:
+    """Префиксные суммы с точечным обновлением и поиском по сумме за O(log n)"""
+
+    def __init__(self, values: Iterable[float] = ()):
+        self.tree = [0.0] + list(values)
+        self.size = len(self.tree) - 1
+        # Построение за O(n): каждый узел отдаёт сумму родителю
+        for i in range(1, self.size + 1):
+            parent = i + (i & -i)
+            if parent <= self.size:
+                self.tree[parent] += self.tree[i]
+        self._top_bit = 1 << self.size.bit_length() if self.size else 0
+
+    def append(self, value: float):
+        """Новый элемент в конец за O(log n)"""
+        self.size += 1
+        i = self.size
+        # Узел i хранит сумму отрезка (i - lowbit(i), i]: всё, кроме нового значения, уже в дереве
+        self.tree.append(value + self.prefix_sum(i - 1) - self.prefix_sum(i - (i & -i)))
+        self._top_bit = 1 << self.size.bit_length()
+
+    def add(self, index: int, delta: float):
+        i = index + 1
+        while i <= self.size:
+            self.tree[i] += delta
+            i += i & -i
+
+    def prefix_sum(self, count: int) -> float:
+        """Сумма первых count элементов"""
+        total = 0.0
+        i = count
+        while i > 0:
+            total += self.tree[i]
+            i -= i & -i
+        return total
+
+    @property
+    def total(self) -> float:
+        return self.prefix_sum(self.size)
+
+    def find(self, value: float) -> int:
+        """Наименьший индекс, на котором префиксная сумма превышает value"""
+        position = 0
+        step = self._top_bit
+        while step:
+            next_position = position + step
+            if next_position <= self.size and self.tree[next_position] <= value:
+                position = next_position
+                value -= self.tree[next_position]
+            step >>= 1
+        return min(position, self.size - 1)
+
+class EmoteIndex:
+    """
+    Смайлики одного канала, собранные один раз при загрузке: имя -> позиция,
+    базовый множитель (источник, длина) и текущий вес с учётом использования,
+    недавних повторов и "помойки". Вес меняется точечно (O(log n) в дереве Фенвика),
+    поэтому выбор случайного смайлика по весам не пересчитывает весь список.
+    Изменения набора (события 7TV) тоже точечные: новый смайлик дописывается
+    в конец, удалённый остаётся пустой позицией с нулевым весом до пересборки индекса.
+    """
+
+    def __init__(self, sources: Dict[str, List[str]]):
+        self.emotes: List[str] = []
+        self.position: Dict[str, int] = {}
+        self.source_bonus: List[Optional[float]] = []
+
+        for source, emotes in sources.items():
+            for emote in emotes:
+                if emote in self.position:
+                    continue
+                self.position[emote] = len(self.emotes)
+                self.emotes.append(emote)
+                self.source_bonus.append(SOURCE_BONUS.get(source))
+
+        count = len(self.emotes)
+        self.usage = [0] * count
+        self.recent = [0] * count  # Сколько раз смайлик сейчас в списке недавних
+        self.cooled = [False] * count
+        self.removed = [False] * count
+        self.weights = [self._weight(i) for i in range(count)]
+        self.tree = FenwickTree(self.weights)
+        self._updates = 0
+        self._top: Optional[List[str]] = None  # Кеш топа до следующего изменения весов
+        self._top_n = 0
+
+    def __len__(self) -> int:
+        return len(self.position)
+
+    def __contains__(self, emote: str) -> bool:
+        return emote in self.position
+
+    def is_available(self, emote: str) -> bool:
+        """Смайлик есть в наборе и не лежит в "помойке" """
+        i = self.position.get(emote)
+        return i is not None and self.weights[i] > 0
+
+    def _weight(self, i: int) -> float:
+        if self.cooled[i] or self.removed[i]:
+            return 0.0
+        weight = 1.0
+        weight *= max(0.1, 1.0 / (self.usage[i] + 1))  # Штраф за частое использование
+        weight *= RECENT_PENALTY if self.recent[i] else 1.0  # Штраф за недавнее использование
+        if self.source_bonus[i] is not None:
+            weight *= self.source_bonus[i]
+        if len(self.emotes[i]) <= SHORT_EMOTE_LENGTH:
+            weight *= SHORT_EMOTE_BONUS
+        return weight
+
+    def _refresh(self, i: int):
+        weight = self._weight(i)
+        delta = weight - self.weights[i]
+        if delta:
+            self.weights[i] = weight
+            self._top = None
+            self._updates += 1
+            if self._updates >= REBUILD_EVERY:
+                self.tree = FenwickTree(self.weights)
+                self._updates = 0
+            else:
+                self.tree.add(i, delta)
+
+    def set_usage(self, emote: str, usage: int):
+        i = self.position.get(emote)
+        if i is not None:
+            self.usage[i] = usage
+            self._refresh(i)
+
+    def add_recent(self, emote: str, delta: int):
+        i = self.position.get(emote)
+        if i is not None:
+            self.recent[i] = max(0, self.recent[i] + delta)
+            self._refresh(i)
+
+    def set_cooled(self, emote: str, cooled: bool):
+        i = self.position.get(emote)
+        if i is not None and self.cooled[i] != cooled:
+            self.cooled[i] = cooled
+            self._refresh(i)
+
+    def add(self, emote: str, source: str):
+        """Смайлик, появившийся в наборе после загрузки"""
+        if emote in self.position:
+            return
+        i = len(self.emotes)
+        self.position[emote] = i
+        self.emotes.append(emote)
+        self.source_bonus.append(SOURCE_BONUS.get(source))
+        self.usage.append(0)
+        self.recent.append(0)
+        self.cooled.append(False)
+        self.removed.append(False)
+        self.weights.append(self._weight(i))
+        self.tree.append(self.weights[i])
+        self._top = None
+
+    def remove(self, emote: str):
+        i = self.position.pop(emote, None)
+        if i is not None:
+            self.removed[i] = True
+            self._refresh(i)
+
+    def rename(self, old: str, new: str):
+        """Переименование (в 7TV - смена алиаса): позиция, счётчики и источник сохраняются"""
+        i = self.position.get(old)
+        if i is None or new in self.position:
+            self.remove(old)
+            return
+        del self.position[old]
+        self.position[new] = i
+        self.emotes[i] = new
+        self._refresh(i)  # Вес зависит от длины имени
+
+    def top(self, n: int) -> List[str]:
+        """n смайликов с наибольшим весом (при равенстве - в порядке загрузки), без "помойки" """
+        if self._top is None or self._top_n < n:
+            best = heapq.nlargest(n, range(len(self.emotes)), key=self.weights.__getitem__)
+            self._top = [self.emotes[i] for i in best if self.weights[i] > 0]
+            self._top_n = n
+        return self._top[:n]
+
+    def sample(self, rng: random.Random, exclude: Iterable[str] = ()) -> Optional[str]:
+        """Случайный смайлик с вероятностью, пропорциональной весу"""
+        # Исключённые временно обнуляются в дереве (порядок фиксирован - суммы воспроизводимы)
+        excluded = [self.position[e] for e in dict.fromkeys(exclude) if e in self.position]
+        removed = [(i, self.weights[i]) for i in excluded if self.weights[i] > 0]
+        for i, weight in removed:
+            self.tree.add(i, -weight)
+        try:
+            total = self.tree.total
+            if total <= EMPTY_TOTAL:
+                return None  # Остаток округления после точечных обновлений, а не реальный вес
+            i = self.tree.find(rng.random() * total)
+            skip = {j for j, _ in removed}
+            if self.weights[i] <= 0 or i in skip:
+                # Погрешность округления у края указала на нулевой вес: ближайший допустимый,
+                # сначала назад, потом вперёд; если такого нет - выбирать не из чего
+                nearby = itertools.chain(range(i - 1, -1, -1), range(i + 1, len(self.emotes)))
+                i = next((j for j in nearby if self.weights[j] > 0 and j not in skip), None)
+                if i is None:
+                    return None
+            return self.emotes[i]
+        finally:
+            for i, weight in removed:
+                self.tree.add(i, weight)
@@ -2,13 +2,68 @@
 import logging
 import aiohttp
 import asyncio
-from typing import Dict, List, Set, Optional
+import heapq
+import sys
+import time
+from typing import Any, Dict, Iterable, List, Set, Optional, Tuple
 from datetime import datetime, timedelta
-from collections import defaultdict, deque
+from collections import Counter, defaultdict, deque
 import json
 
+import config
+import database
+from chat_emotes import ChatEmoteUsage
+from clock import clock
+from emote_index import EmoteIndex
+
 logger = logging.getLogger(__name__)
 
+HTTP_NOT_MODIFIED = 304
+HTTP_NOT_FOUND = 404
+
+# Базовые Twitch смайлики
+TWITCH_EMOTES = [
+    # Базовые
+    "Kappa", "KappaPride", "LUL", "LULW", "OMEGALUL",
+    "Pog", "PogU", "PogChamp", "Poggers", "KEKW",
+    # Эмоциональные
+    "monkaS", "monkaW", "PepeHands", "Sadge", "FeelsGoodMan",
+    "FeelsBadMan", "FeelsWeirdMan", "WeirdChamp", "AYAYA",
+    # Действия
+    "Clap", "PauseChamp", "ResidentSleeper", "BibleThump",
+    "SourPls", "NotLikeThis", "TriHard", "Jebaited",
+    # Реакции
+    "WutFace", "4Head", "DansGame", "SwiftRage", "FailFish",
+    "VoHiYo", "PJSalt", "CoolCat", "MrDestructoid",
+    # Современные
+    "gachiHYPER", "peepoClown", "Aware", "Clueless",
+    "GIGACHAD", "Chatting", "Copege", "Madge", "BatChest"
+]
+
+def _intern_names(names) -> List[str]:
+    """Имена смайликов из JSON - через общий пул строк: одинаковые имена в разных каналах хранятся один раз"""
+    return [sys.intern(name) for name in names]
+
+# Разбор ответов API: JSON -> имена смайликов в порядке сервиса
+
+def _parse_7tv(data: Dict) -> Iterable[str]:
+    """7TV: набор канала приходит в том же ответе, что и пользователь"""
+    emote_set = data.get('emote_set') or {}
+    return (emote['name'] for emote in emote_set.get('emotes', []))
+
+def _7tv_set_id(data: Dict) -> Optional[str]:
+    return (data.get('emote_set') or {}).get('id')
+
+def _parse_bttv(data: Dict) -> Iterable[str]:
+    """BTTV канала (глобальные - отдельным запросом, см. _get_global_emotes)"""
+    return (emote['code'] for key in ('channelEmotes', 'sharedEmotes') for emote in data.get(key, []))
+
+def _parse_bttv_global(data: List[Dict]) -> Iterable[str]:
+    return (emote['code'] for emote in data)
+
+def _parse_ffz(data: Dict) -> Iterable[str]:
+    return (emote['name'] for set_data in data.get('sets', {}).values() for emote in set_data.get('emoticons', []))
+
 class EmoteManager:
     """Управляет смайликами: загрузка, кеширование, система 'помойки'"""
     
@@ -17,55 +72,83 @@ class EmoteManager:
         self.channel_emotes: Dict[str, List[str]] = {}  # Смайлики по каналам
         self.emote_sources: Dict[str, Dict[str, List[str]]] = {}  # Источники по каналам
         self.emote_usage: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))  # Использование
-        self.emote_cooldown: Dict[str, Dict[str, datetime]] = {}  # Смайлики в "помойке"
+        self.emote_cooldown: Dict[str, Dict[str, datetime]] = {}  # Смайлики в "помойке" (когда попали)
+        self.cooldown_heap: Dict[str, List[Tuple[datetime, str]]] = {}  # (когда выходят, смайлик) по каналам
+        self.cooldown_time: Dict[str, float] = dict(config.EMOTE_COOLDOWN_BY_CHANNEL)  # Своё время "помойки"
         self.recent_emotes: Dict[str, deque] = {}  # Последние использованные смайлы
+        self.emote_index: Dict[str, EmoteIndex] = {}  # Веса для выбора (см. emote_index.py)
+        self.chat_usage: Dict[str, ChatEmoteUsage] = {}  # Что сейчас пишет чат (см. chat_emotes.py)
+        self.emote_set_ids: Dict[str, Dict[str, str]] = {}  # Канал -> источник -> id набора у сервиса
+        self.global_emotes: Dict[str, List[str]] = {}  # Глобальные наборы, общие для всех каналов
+        self._global_task: Optional[asyncio.Task] = None
+        self._global_loaded_at: Optional[float] = None
+        self.load_limit = asyncio.Semaphore(config.EMOTE_LOAD_CONCURRENCY)  # Одновременных загрузок каналов
+        self.cache_stats: Counter = Counter()  # Наборы: fresh (из БД), revalidated (304), fetched, stale
         
     async def initialize(self):
         """Инициализация сессии"""
         if not self.session:
-            self.session = aiohttp.ClientSession()
+            self.session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=config.EMOTE_HTTP_TIMEOUT))
     
     async def close(self):
         """Закрытие сессии"""
         if self.session:
             await self.session.close()
     
-    async def load_channel_emotes(self, channel_name: str) -> List[str]:
-        """Загружает все смайлики для канала (7TV, BTTV, FFZ, Twitch)"""
+    async def load_channel_emotes(self, channel_name: str, revalidate: bool = False) -> List[str]:
+        """
+        Загружает все смайлики для канала (7TV, BTTV, FFZ, Twitch). revalidate -
+        набор 7TV спрашивается у API даже при свежем кеше (события могли пропасть).
+        """
+        async with self.load_limit:
+            return await self._load_channel_emotes(channel_name, revalidate)
+    
+    async def _load_channel_emotes(self, channel_name: str, revalidate: bool = False) -> List[str]:
         logger.info(f"[{channel_name}] Загрузка смайликов...")
         
         all_emotes = []
         sources = {}
         
         try:
-            # Загружаем смайлики из разных источников
-            emotes_7tv = await self._load_7tv_emotes(channel_name)
-            emotes_bttv = await self._load_bttv_emotes(channel_name)
-            emotes_ffz = await self._load_ffz_emotes(channel_name)
+            # Загружаем смайлики из разных источников параллельно (свежие наборы - из БД без запросов)
+            cache = await asyncio.to_thread(database.load_emote_cache, channel_name)
+            global_emotes, emotes_7tv, emotes_bttv, emotes_ffz = await asyncio.gather(
+                self._get_global_emotes(),
+                self._load_source(channel_name, '7tv', f"https://7tv.io/v3/users/twitch/{channel_name}",
+                                  _parse_7tv, cache, _7tv_set_id, revalidate),
+                self._load_source(channel_name, 'bttv', f"https://api.betterttv.net/3/cached/users/twitch/{channel_name}",
+                                  _parse_bttv, cache),
+                self._load_source(channel_name, 'ffz', f"https://api.frankerfacez.com/v1/room/{channel_name}",
+                                  _parse_ffz, cache)
+            )
+            emotes_7tv, emotes_bttv, emotes_ffz = emotes_7tv or [], emotes_bttv or [], emotes_ffz or []
             emotes_twitch = self._get_twitch_emotes()
             
-            # Сохраняем по источникам
+            # Сохраняем по источникам (глобальные списки - общие объекты, не копии)
             sources = {
                 '7tv': emotes_7tv,
+                'bttv_global': global_emotes.get('bttv_global', []),
                 'bttv': emotes_bttv,
                 'ffz': emotes_ffz,
                 'twitch': emotes_twitch
             }
             
-            # Объединяем все смайлики (убираем дубликаты)
-            emotes_set = set()
+            # Объединяем все смайлики (убираем дубликаты, порядок стабилен между запусками)
+            emotes_unique = {}
             for source, emotes in sources.items():
-                emotes_set.update(emotes)
+                emotes_unique.update(dict.fromkeys(emotes))
             
-            all_emotes = list(emotes_set)
+            all_emotes = list(emotes_unique)
             self.channel_emotes[channel_name] = all_emotes
             self.emote_sources[channel_name] = sources
             self.recent_emotes[channel_name] = deque(maxlen=20)
             self.emote_cooldown[channel_name] = {}
+            self.cooldown_heap[channel_name] = []
+            self._build_index(channel_name)
             
             logger.info(f"[{channel_name}] Загружено смайликов: "
                        f"7TV: {len(emotes_7tv)}, "
-                       f"BTTV: {len(emotes_bttv)}, "
+                       f"BTTV: {len(sources['bttv_global']) + len(emotes_bttv)}, "
                        f"FFZ: {len(emotes_ffz)}, "
                        f"Twitch: {len(emotes_twitch)}, "
                        f"Всего: {len(all_emotes)}")
@@ -74,227 +157,361 @@ class EmoteManager:
             
         except Exception as e:
             logger.error(f"[{channel_name}] Ошибка загрузки смайликов: {e}")
-            # Возвращаем базовые твич смайлы
-            base_emotes = self._get_twitch_emotes()
+            # Перезагрузка не удалась - прежние списки и индекс остаются целиком
+            if channel_name in self.emote_sources and channel_name in self.emote_index:
+                return self.channel_emotes[channel_name]
+            # Первая загрузка - базовые твич смайлы
+            base_emotes = list(self._get_twitch_emotes())  # Копия: список канала меняют события 7TV
             self.channel_emotes[channel_name] = base_emotes
+            self.emote_sources[channel_name] = {'twitch': base_emotes}
+            self._build_index(channel_name)
             return base_emotes
     
-    async def _load_7tv_emotes(self, channel_name: str) -> List[str]:
-        """Загружает смайлики 7TV"""
+    def _build_index(self, channel_name: str):
+        """Индекс весов по загруженным смайликам; счётчики использования переживают перезагрузку"""
+        sources = self.emote_sources.get(channel_name) or {'twitch': self.channel_emotes[channel_name]}
+        index = EmoteIndex(sources)
+        for emote, count in self.emote_usage.get(channel_name, {}).items():
+            index.set_usage(emote, count)
+        for emote in self.recent_emotes.get(channel_name, ()):
+            index.add_recent(emote, 1)
+        for emote in self.emote_cooldown.get(channel_name, {}):
+            index.set_cooled(emote, True)
+        self.emote_index[channel_name] = index
+    
+    async def _get_json(self, url: str, cached: Optional[Dict] = None) -> Tuple[int, Any, Dict]:
+        """
+        GET с разбором JSON. Если набор уже есть в кеше, запрос условный
+        (If-None-Match / If-Modified-Since) и 304 приходит без тела.
+        Возвращает (статус, данные или None, ETag и Last-Modified ответа).
+        """
+        headers = {}
+        if cached:
+            if cached.get('etag'):
+                headers['If-None-Match'] = cached['etag']
+            if cached.get('last_modified'):
+                headers['If-Modified-Since'] = cached['last_modified']
+        async with self.session.get(url, headers=headers) as response:
+            validators = {
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
+            }
+            data = await response.json() if response.status == 200 else None
+            return response.status, data, validators
+    
+    async def _load_source(self, cache_key: str, source: str, url: str, parse,
+                           cache: Dict[str, Dict], set_id_of=None, revalidate: bool = False) -> Optional[List[str]]:
+        """
+        Набор смайликов одного источника. Пока сохранённый в БД набор свежий
+        (EMOTE_CACHE_TTL), запросов нет; потом - условный запрос: 304 продлевает
+        кеш, 200 перезаписывает его. Если API недоступен, отдаётся устаревший кеш.
+        None - ни ответа, ни кеша. set_id_of достаёт из ответа id набора у сервиса
+        (он попадает в emote_set_ids - на него подписываются события).
+        revalidate - запрос и при свежем кеше.
+        """
+        cached = cache.get(source)
+        if cached:
+            self._remember_set_id(cache_key, source, cached['set_id'])
+        if cached and not revalidate and time.time() - cached['fetched_at'] < cached['ttl']:
+            self.cache_stats['fresh'] += 1
+            return _intern_names(cached['emotes'])
+        
         try:
-            # Получаем ID канала
-            user_id = await self._get_7tv_user_id(channel_name)
-            if not user_id:
-                return []
-            
-            # Получаем смайлики канала
-            url = f"https://7tv.io/v3/users/twitch/{user_id}"
-            async with self.session.get(url) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    emotes = []
-                    
-                    # Получаем смайлики из разных мест
-                    if 'emote_set' in data and 'emotes' in data['emote_set']:
-                        for emote in data['emote_set']['emotes']:
-                            emotes.append(emote['name'])
-                    
-                    return emotes
+            status, data, validators = await self._get_json(url, cached)
+            if status == HTTP_NOT_MODIFIED and cached:
+                self.cache_stats['revalidated'] += 1
+                await asyncio.to_thread(database.touch_emote_cache, cache_key, source, **validators)
+                return _intern_names(cached['emotes'])
+            if status == 200 or status == HTTP_NOT_FOUND:
+                # 404 - у канала нет набора на этом сервисе: тоже запоминаем, чтобы не спрашивать снова
+                emotes = _intern_names(parse(data)) if data else []
+                set_id = set_id_of(data) if set_id_of and data else None
+                self._remember_set_id(cache_key, source, set_id)
+                self.cache_stats['fetched'] += 1
+                await asyncio.to_thread(database.save_emote_cache, cache_key, source, emotes, set_id, **validators)
+                return emotes
+            logger.debug(f"[{cache_key}] {source}: ответ {status}")
         except Exception as e:
-            logger.debug(f"[{channel_name}] Ошибка загрузки 7TV: {e}")
+            logger.debug(f"[{cache_key}] Ошибка загрузки {source}: {e}")
         
-        return []
+        if cached:
+            self.cache_stats['stale'] += 1
+            return _intern_names(cached['emotes'])
+        return None
     
-    async def _load_bttv_emotes(self, channel_name: str) -> List[str]:
-        """Загружает смайлики BTTV"""
-        try:
-            # Глобальные BTTV смайлики
-            url_global = "https://api.betterttv.net/3/cached/emotes/global"
-            # Смайлики канала
-            url_channel = f"https://api.betterttv.net/3/cached/users/twitch/{channel_name}"
-            
-            emotes = []
-            
-            # Глобальные
-            async with self.session.get(url_global) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    for emote in data:
-                        emotes.append(emote['code'])
-            
-            # Канальные
-            async with self.session.get(url_channel) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    if 'channelEmotes' in data:
-                        for emote in data['channelEmotes']:
-                            emotes.append(emote['code'])
-                    if 'sharedEmotes' in data:
-                        for emote in data['sharedEmotes']:
-                            emotes.append(emote['code'])
-            
-            return emotes
-        except Exception as e:
-            logger.debug(f"[{channel_name}] Ошибка загрузки BTTV: {e}")
-            return []
+    def _remember_set_id(self, channel_name: str, source: str, set_id: Optional[str]):
+        if set_id:
+            self.emote_set_ids.setdefault(channel_name, {})[source] = set_id
+        else:
+            self.emote_set_ids.get(channel_name, {}).pop(source, None)
     
-    async def _load_ffz_emotes(self, channel_name: str) -> List[str]:
-        """Загружает смайлики FFZ"""
-        try:
-            url = f"https://api.frankerfacez.com/v1/room/{channel_name}"
-            async with self.session.get(url) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    emotes = []
-                    
-                    if 'sets' in data:
-                        for set_id, set_data in data['sets'].items():
-                            if 'emoticons' in set_data:
-                                for emote in set_data['emoticons']:
-                                    emotes.append(emote['name'])
-                    
-                    return emotes
-        except Exception as e:
-            logger.debug(f"[{channel_name}] Ошибка загрузки FFZ: {e}")
-            return []
+    async def _get_global_emotes(self) -> Dict[str, List[str]]:
+        """
+        Глобальные наборы смайликов. Загружаются один раз за цикл обновления
+        (EMOTE_REFRESH_INTERVAL) на все каналы: одновременные загрузки каналов
+        ждут один и тот же запрос, а каналы хранят ссылку на общий список.
+        """
+        task = self._global_task
+        expired = (self._global_loaded_at is None
+                   or clock.monotonic() - self._global_loaded_at > config.EMOTE_REFRESH_INTERVAL)
+        if task is None or (task.done() and expired):
+            task = self._global_task = asyncio.get_running_loop().create_task(self._load_global_emotes())
+        return await asyncio.shield(task)
     
-    async def _get_7tv_user_id(self, channel_name: str) -> Optional[str]:
-        """Получает ID пользователя 7TV"""
-        try:
-            url = f"https://7tv.io/v3/users/twitch/{channel_name}"
-            async with self.session.get(url) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    return data['id']
-        except:
-            return None
+    async def _load_global_emotes(self) -> Dict[str, List[str]]:
+        cache = await asyncio.to_thread(database.load_emote_cache, config.EMOTE_GLOBAL_CACHE)
+        emotes = await self._load_source(config.EMOTE_GLOBAL_CACHE, 'bttv_global',
+                                         "https://api.betterttv.net/3/cached/emotes/global",
+                                         _parse_bttv_global, cache)
+        if emotes is not None:
+            self._global_loaded_at = clock.monotonic()
+            self.global_emotes = {'bttv_global': emotes}
+            logger.info(f"🌐 Глобальные смайлики BTTV: {len(emotes)}")
+        return self.global_emotes  # При ошибке - прошлый набор, следующая загрузка канала повторит запрос
     
     def _get_twitch_emotes(self) -> List[str]:
-        """Возвращает список базовых Twitch смайликов"""
-        return [
-            # Базовые
-            "Kappa", "KappaPride", "LUL", "LULW", "OMEGALUL",
-            "Pog", "PogU", "PogChamp", "Poggers", "KEKW",
-            # Эмоциональные
-            "monkaS", "monkaW", "PepeHands", "Sadge", "FeelsGoodMan",
-            "FeelsBadMan", "FeelsWeirdMan", "WeirdChamp", "AYAYA",
-            # Действия
-            "Clap", "PauseChamp", "ResidentSleeper", "BibleThump",
-            "SourPls", "NotLikeThis", "TriHard", "Jebaited",
-            # Реакции
-            "WutFace", "4Head", "DansGame", "SwiftRage", "FailFish",
-            "VoHiYo", "PJSalt", "CoolCat", "MrDestructoid",
-            # Современные
-            "gachiHYPER", "peepoClown", "Aware", "Clueless",
-            "GIGACHAD", "Chatting", "Copege", "Madge", "BatChest"
-        ]
+        """Возвращает список базовых Twitch смайликов (общий для всех каналов, не изменять)"""
+        return TWITCH_EMOTES
+    
+    def observe_chat_message(self, channel_name: str, text: str) -> Optional[List[str]]:
+        """
+        Учитывает сообщение зрителя в популярности смайликов чата.
+        Возвращает смайлики набора канала из сообщения (None - набор ещё не загружен).
+        """
+        index = self.emote_index.get(channel_name)
+        if index is None:
+            return None
+        usage = self.chat_usage.get(channel_name)
+        if usage is None:
+            usage = self.chat_usage[channel_name] = ChatEmoteUsage(config.EMOTE_CHAT_WINDOW,
+                                                                   config.EMOTE_CHAT_BUCKET)
+        return usage.observe(text, index.position)
+    
+    def _chat_top(self, channel_name: str, limit: int) -> List[str]:
+        usage = self.chat_usage.get(channel_name)
+        return usage.top(limit) if usage else []
     
     def get_available_emotes(self, channel_name: str, exclude_recent: int = 5) -> List[str]:
         """Получает доступные смайлики, исключая недавно использованные"""
         if channel_name not in self.channel_emotes:
             return self._get_twitch_emotes()
         
-        all_emotes = self.channel_emotes[channel_name]
-        recent = self.recent_emotes.get(channel_name, deque(maxlen=20))
-        
-        # Исключаем смайлики в "помойке"
-        cooldown_emotes = self.emote_cooldown.get(channel_name, {})
-        now = datetime.now()
-        
-        # Очищаем просроченные смайлы из "помойки"
-        expired = [e for e, t in cooldown_emotes.items() 
-                  if (now - t).total_seconds() > 300]  # 5 минут
-        for emote in expired:
-            del cooldown_emotes[emote]
-        
-        # Фильтруем доступные смайлы
-        available = []
-        for emote in all_emotes:
-            if emote in cooldown_emotes:
-                continue  # Пропускаем смайлы в "помойке"
-            
-            # Штрафуем недавно использованные
-            usage_count = self.emote_usage[channel_name].get(emote, 0)
-            recent_penalty = 1.0
-            
-            # Если использовался недавно - штраф
-            if emote in recent:
-                recent_penalty = 0.3
-            
-            # Добавляем с весом
-            weight = self._calculate_emote_weight(emote, channel_name, usage_count, recent_penalty)
-            available.append((emote, weight))
-        
-        # Сортируем по весу (убывание)
-        available.sort(key=lambda x: x[1], reverse=True)
+        self._expire_cooldowns(channel_name)
+        index = self.emote_index[channel_name]
         
-        # Возвращаем топ N смайликов
-        return [e for e, _ in available[:50]]
+        # Сначала то, что сейчас пишет чат (кроме "помойки"), затем топ N по весу
+        # (вес учитывает использование, недавние повторы, источник и длину)
+        popular = [e for e in self._chat_top(channel_name, 50) if index.is_available(e)]
+        return list(dict.fromkeys(popular + index.top(50)))[:50]
     
-    def _calculate_emote_weight(self, emote: str, channel: str, usage: int, recent_penalty: float) -> float:
-        """Рассчитывает вес смайлика для выбора"""
-        # Базовый вес
-        weight = 1.0
-        
-        # Штраф за частое использование
-        usage_penalty = max(0.1, 1.0 / (usage + 1))
-        weight *= usage_penalty
-        
-        # Штраф за недавнее использование
-        weight *= recent_penalty
-        
-        # Бонус за источник (7TV приоритетнее)
-        for source, emotes in self.emote_sources.get(channel, {}).items():
-            if emote in emotes:
-                if source == '7tv':
-                    weight *= 1.5
-                elif source == 'bttv':
-                    weight *= 1.3
-                elif source == 'ffz':
-                    weight *= 1.2
-                break
+    def get_popular_emotes(self, channel_name: str, limit: int = 30) -> List[str]:
+        """Смайлики канала для анализа чата: популярные сейчас, затем остальные в порядке набора"""
+        emotes = self.channel_emotes.get(channel_name) or self._get_twitch_emotes()
+        index = self.emote_index.get(channel_name)
+        popular = [e for e in self._chat_top(channel_name, limit) if index and e in index]
+        return list(dict.fromkeys(popular + emotes[:limit]))[:limit]
+    
+    def get_cooldown_time(self, channel_name: str) -> float:
+        return self.cooldown_time.get(channel_name, config.EMOTE_COOLDOWN_TIME)
+    
+    def set_cooldown_time(self, channel_name: str, seconds: float):
+        """Меняет время "помойки" канала; сроки уже лежащих там смайликов пересчитываются"""
+        self.cooldown_time[channel_name] = seconds
+        self._rebuild_cooldown_heap(channel_name)
+    
+    def _rebuild_cooldown_heap(self, channel_name: str):
+        duration = timedelta(seconds=self.get_cooldown_time(channel_name))
+        heap = [(t + duration, e) for e, t in self.emote_cooldown.get(channel_name, {}).items()]
+        heapq.heapify(heap)
+        self.cooldown_heap[channel_name] = heap
+    
+    def _expire_cooldowns(self, channel_name: str):
+        """Выпускает из "помойки" смайлики, чей срок вышел: O(log n) на каждый, остальные не трогаем"""
+        heap = self.cooldown_heap.get(channel_name)
+        if not heap:
+            return
         
-        # Бонус за длину (короткие смайлы чаще используются)
-        if len(emote) <= 6:
-            weight *= 1.2
+        cooldown_emotes = self.emote_cooldown[channel_name]
+        index = self.emote_index.get(channel_name)
+        duration = timedelta(seconds=self.get_cooldown_time(channel_name))
+        now = clock.now()
         
-        return weight
+        while heap and heap[0][0] < now:
+            expires_at, emote = heapq.heappop(heap)
+            started = cooldown_emotes.get(emote)
+            if started is None or started + duration != expires_at:
+                continue  # Запись устарела: смайлик снова попал в "помойку" позже
+            del cooldown_emotes[emote]
+            if index is not None:
+                index.set_cooled(emote, False)
+    
+    @property
+    def active_cooldowns(self) -> int:
+        """Сколько смайликов сейчас в "помойке" по всем каналам (истёкшие выпускаются перед подсчётом)"""
+        for channel_name in list(self.cooldown_heap):
+            self._expire_cooldowns(channel_name)
+        return sum(len(cooldown) for cooldown in self.emote_cooldown.values())
     
     def mark_emote_used(self, channel_name: str, emote: str):
         """Отмечает смайлик как использованный"""
+        index = self.emote_index.get(channel_name)
+        
         # Увеличиваем счетчик использования
         self.emote_usage[channel_name][emote] = self.emote_usage[channel_name].get(emote, 0) + 1
+        if index is not None:
+            index.set_usage(emote, self.emote_usage[channel_name][emote])
         
         # Добавляем в список недавно использованных
-        if channel_name in self.recent_emotes:
-            self.recent_emotes[channel_name].append(emote)
+        recent = self.recent_emotes.get(channel_name)
+        if recent is not None:
+            if index is not None:
+                if len(recent) == recent.maxlen:
+                    index.add_recent(recent[0], -1)  # Вытесняется самый старый
+                index.add_recent(emote, 1)
+            recent.append(emote)
         
         # Отправляем в "помойку" на некоторое время с вероятностью
-        import random
-        if random.random() < 0.3:  # 30% шанс отправить в "помойку"
-            self.emote_cooldown.setdefault(channel_name, {})[emote] = datetime.now()
+        if clock.rng.random() < 0.3:  # 30% шанс отправить в "помойку"
+            now = clock.now()
+            self.emote_cooldown.setdefault(channel_name, {})[emote] = now
+            heapq.heappush(
+                self.cooldown_heap.setdefault(channel_name, []),
+                (now + timedelta(seconds=self.get_cooldown_time(channel_name)), emote)
+            )
+            if index is not None:
+                index.set_cooled(emote, True)
             logger.debug(f"[{channel_name}] Смайлик {emote} отправлен в 'помойку'")
     
     def get_random_emote(self, channel_name: str, exclude: List[str] = None) -> Optional[str]:
-        """Выбирает случайный смайлик с учетом весов"""
-        available = self.get_available_emotes(channel_name)
+        """Выбирает случайный смайлик с вероятностью, пропорциональной весу"""
+        if channel_name not in self.emote_index:
+            available = [e for e in self._get_twitch_emotes() if not exclude or e not in exclude]
+            return clock.rng.choice(available) if available else None
         
-        if not available:
-            return None
+        self._expire_cooldowns(channel_name)
+        return self.emote_index[channel_name].sample(clock.rng, exclude or ())
+    
+    def export_channel(self, channel_name: str) -> Dict:
+        """Состояние смайликов канала для снимка (см. snapshot.py)"""
+        if channel_name not in self.channel_emotes:
+            return {}
+        return {
+            'emotes': self.channel_emotes[channel_name],
+            'sources': self.emote_sources.get(channel_name, {}),
+            'usage': dict(self.emote_usage.get(channel_name, {})),
+            'cooldown': {e: t.isoformat() for e, t in self.emote_cooldown.get(channel_name, {}).items()},
+            'recent': list(self.recent_emotes.get(channel_name, ())),
+            'set_ids': dict(self.emote_set_ids.get(channel_name, {})),
+        }
+    
+    def import_channel(self, channel_name: str, data: Dict) -> List[str]:
+        """Восстанавливает смайлики канала из снимка без запросов к API"""
+        self.channel_emotes[channel_name] = _intern_names(data['emotes'])
+        sources = {source: _intern_names(emotes) for source, emotes in data.get('sources', {}).items()}
+        for source, emotes in self.global_emotes.items():
+            if sources.get(source) == emotes:
+                sources[source] = emotes  # Снова общий список, а не копия из снимка
+        if sources.get('twitch') == TWITCH_EMOTES:
+            sources['twitch'] = TWITCH_EMOTES
+        self.emote_sources[channel_name] = sources
+        self.emote_usage[channel_name] = defaultdict(int, data.get('usage', {}))
+        self.emote_cooldown[channel_name] = {
+            e: datetime.fromisoformat(t) for e, t in data.get('cooldown', {}).items()
+        }
+        self.recent_emotes[channel_name] = deque(data.get('recent', []), maxlen=20)
+        self.emote_set_ids[channel_name] = dict(data.get('set_ids', {}))
+        self._rebuild_cooldown_heap(channel_name)
+        self._build_index(channel_name)
+        return self.channel_emotes[channel_name]
+    
+    def forget_channel(self, channel_name: str):
+        """Освобождает смайлики канала (канал отключён)"""
+        for storage in (self.channel_emotes, self.emote_sources, self.emote_usage,
+                        self.emote_cooldown, self.cooldown_heap, self.recent_emotes, self.emote_index,
+                        self.emote_set_ids, self.chat_usage):
+            storage.pop(channel_name, None)
+    
+    def apply_emote_changes(self, channel_name: str, source: str, added: Iterable[str] = (),
+                            removed: Iterable[str] = (), renamed: Iterable[Tuple[str, str]] = ()) -> bool:
+        """
+        Точечные изменения набора одного источника (события 7TV) без перезагрузки
+        канала: список источника, общий список канала и индекс весов правятся
+        на месте, в БД меняются только затронутые строки. При переименовании
+        счётчики (использование ботом, популярность в чате, usage_count в БД)
+        переходят к новому имени. False - смайлики канала ещё не загружены.
+        """
+        sources = self.emote_sources.get(channel_name)
+        index = self.emote_index.get(channel_name)
+        if sources is None or index is None:
+            return False
         
-        if exclude:
-            available = [e for e in available if e not in exclude]
+        emotes = sources.get(source)
+        if emotes is None or emotes is TWITCH_EMOTES or any(emotes is shared for shared in self.global_emotes.values()):
+            emotes = sources[source] = list(emotes or [])  # Общие списки не трогаем
+        channel_list = self.channel_emotes[channel_name]
+        usage = self.emote_usage.get(channel_name)
+        chat = self.chat_usage.get(channel_name)
         
-        if not available:
-            return None
+        def elsewhere(emote: str) -> bool:
+            """Смайлик есть и в другом источнике - тогда из канала он не уходит"""
+            return any(emote in names for other, names in sources.items() if other != source)
+        
+        applied_added, applied_removed, applied_renamed = [], [], []
+        
+        for emote in removed:
+            if emote not in emotes:
+                continue
+            emotes.remove(emote)
+            applied_removed.append(emote)
+            if not elsewhere(emote):
+                index.remove(emote)
+                channel_list.remove(emote)
+        
+        for old, new in renamed:
+            if old not in emotes:
+                continue
+            new = sys.intern(new)
+            if new in emotes:
+                emotes.remove(old)
+            else:
+                emotes[emotes.index(old)] = new
+            applied_renamed.append((old, new))
+            
+            new_known = new in index
+            if elsewhere(old):
+                index.add(new, source)
+                if not new_known:
+                    channel_list.append(new)
+                continue
+            
+            index.rename(old, new)
+            if new_known:
+                channel_list.remove(old)
+            else:
+                channel_list[channel_list.index(old)] = new
+            if usage and old in usage:
+                usage[new] = usage.get(new, 0) + usage.pop(old)
+            if chat is not None:
+                chat.rename(old, new)
+        
+        for emote in added:
+            emote = sys.intern(emote)
+            if emote in emotes:
+                continue
+            emotes.append(emote)
+            applied_added.append(emote)
+            if emote not in index:
+                index.add(emote, source)
+                channel_list.append(emote)
+        
+        if applied_renamed and channel_name in self.recent_emotes:
+            renames = dict(applied_renamed)
+            recent = self.recent_emotes[channel_name]
+            self.recent_emotes[channel_name] = deque((renames.get(e, e) for e in recent), maxlen=recent.maxlen)
         
-        import random
-        # Выбираем с учетом весов (первые в списке имеют больший вес)
-        if random.random() < 0.7:  # 70% шанс выбрать из топ-10
-            top_n = min(10, len(available))
-            return random.choice(available[:top_n])
-        else:  # 30% шанс выбрать случайный
-            return random.choice(available)
+        if applied_added or applied_removed or applied_renamed:
+            database.update_emote_cache(channel_name, source, applied_added, applied_removed, applied_renamed)
+        return True
     
     def should_add_emote(self, channel_name: str) -> bool:
         """Определяет, нужно ли добавить смайлик к сообщению"""
@@ -302,7 +519,6 @@ class EmoteManager:
             return False
         
         # Более часто добавляем смайлики в активных чатах
-        import random
         base_chance = 0.4  # 40% базовый шанс
         
         # Увеличиваем шанс если мало смайлов использовалось недавно
@@ -310,7 +526,7 @@ class EmoteManager:
         if len(recent) < 5:
             base_chance += 0.2
         
-        return random.random() < base_chance
+        return clock.rng.random() < base_chance
 
 # Глобальный экземпляр менеджера смайликов
 emote_manager = EmoteManager()
\ No newline at end of file
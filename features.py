@@ -0,0 +1,62 @@
+# features.py - Признаки сообщения, которые считаются один раз при приёме
+import re
+from dataclasses import dataclass, field
+from typing import List, Optional, Pattern
+
+from lemmatizer import lemmatizer
+from lexicon import lexicon
+
+URL_PATTERN = re.compile(r'https?://\S+|www\.\S+')
+WORD_PATTERN = re.compile(r'\w+')
+EMOTE_PATTERN = re.compile(r'\b[A-Z][a-z]+[A-Z][a-z]+\b|\b[A-Z]{3,}\b')  # CamelCase и UPPERCASE
+
+STOP_WORDS = {'и', 'в', 'не', 'на', 'я', 'с', 'что', 'он', 'по', 'это', 'но', 'как', 'а', 'то', 'ну'}
+
+@dataclass
+class MessageFeatures:
+    """
+    Всё, что разные части бота раньше вычисляли из текста сами
+    (lower, split, регулярки, лемматизация, словари) - для одного сообщения.
+    Дальше по конвейеру (БД, гейт ответа, тренды, промпт) передаётся этот объект.
+    """
+    text: str
+    normalized: str  # В нижнем регистре
+    tokens: List[str] = field(default_factory=list)  # Слова без ссылок и знаков
+    lemmas: List[str] = field(default_factory=list)  # Нормальные формы tokens
+    emote_tokens: List[str] = field(default_factory=list)
+    is_mentioned: bool = False
+    is_question: bool = False
+    has_url: bool = False
+    sentiment: int = 0
+    forbidden: List[str] = field(default_factory=list)
+
+    @property
+    def content_words(self) -> List[str]:
+        """Значимые нормальные формы: без стоп-слов, коротких слов и чисел (для трендов)"""
+        return [lemma for lemma in self.lemmas
+                if len(lemma) > 2 and lemma not in STOP_WORDS and not lemma.isdigit()]
+
+    @property
+    def topic_words(self) -> List[str]:
+        """Нормальные формы слов от трёх букв (для дрейфа темы)"""
+        return [lemma for token, lemma in zip(self.tokens, self.lemmas) if len(token) >= 3]
+
+def extract_features(text: str, mention_pattern: Optional[Pattern] = None) -> MessageFeatures:
+    """Разбирает сообщение один раз"""
+    normalized = text.lower()
+    has_url = URL_PATTERN.search(normalized) is not None
+    tokens = WORD_PATTERN.findall(URL_PATTERN.sub(' ', normalized) if has_url else normalized)
+    match = lexicon.scan(text, normalized)
+
+    return MessageFeatures(
+        text=text,
+        normalized=normalized,
+        tokens=tokens,
+        lemmas=lemmatizer.lemmatize(tokens),
+        emote_tokens=EMOTE_PATTERN.findall(text),
+        is_mentioned=bool(mention_pattern and mention_pattern.search(text)),
+        is_question=match.is_question,
+        has_url=has_url,
+        sentiment=match.sentiment,
+        forbidden=match.forbidden,
+    )
@@ -0,0 +1,118 @@
+# lemmatizer.py - Ленивая лемматизация (pymorphy2) с LRU кешем нормальных форм
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Set
+
+import config
+
+logger = logging.getLogger(__name__)
+
+class Lemmatizer:
+    """
+    Словари pymorphy2 грузятся долго и занимают память, поэтому анализатор
+    создаётся только в фоновом потоке (preload, либо первое обращение его
+    запускает). Пока загрузка идёт, слова возвращаются в нижнем регистре -
+    цикл событий никогда не ждёт словари. Скриптам, которым нужен
+    воспроизводимый результат с первого слова, - load(). Если pymorphy2
+    недоступен, лемматизация сводится к приведению к нижнему регистру.
+    Нормальные формы кешируются (LRU): в чате одни и те же слова повторяются.
+    """
+
+    def __init__(self, cache_size: int):
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[str, str]" = OrderedDict()
+        self._morph = None
+        self._failed = False
+        self._lock = threading.Lock()
+        self._loading = False
+
+        # Метрики
+        self.load_time: Optional[float] = None
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._morph is not None
+
+    def preload(self):
+        """Загружает словари в фоновом потоке"""
+        if self._morph is not None or self._failed or self._loading:
+            return
+        self._loading = True
+        threading.Thread(target=self._load, name="lemmatizer-preload", daemon=True).start()
+
+    def load(self) -> bool:
+        """Загружает словари синхронно (скрипты: симуляция, аналитика, бенчмарки - не цикл событий)"""
+        self._load()
+        return self.is_loaded
+
+    def _load(self):
+        with self._lock:
+            if self._morph is not None or self._failed:
+                return
+            started = time.perf_counter()
+            try:
+                import pymorphy2
+                self._morph = pymorphy2.MorphAnalyzer()
+                self.load_time = time.perf_counter() - started
+                logger.info(f"📚 Словари pymorphy2 загружены за {self.load_time:.2f}с")
+            except Exception as e:
+                self._failed = True
+                logger.warning(f"pymorphy2 недоступен, лемматизация отключена: {e}")
+            finally:
+                self._loading = False
+
+    def _analyzer(self):
+        if self._morph is None and not self._failed:
+            self.preload()  # Грузится в фоне - вызывающий не ждёт
+        return self._morph
+
+    def normal_form(self, word: str) -> str:
+        """Нормальная форма слова (в нижнем регистре)"""
+        word = word.lower()
+
+        lemma = self._cache.get(word)
+        if lemma is not None:
+            self.hits += 1
+            self._cache.move_to_end(word)
+            return lemma
+
+        morph = self._analyzer()
+        if morph is None:
+            return word
+
+        self.misses += 1
+        lemma = morph.parse(word)[0].normal_form
+        self._cache[word] = lemma
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return lemma
+
+    def lemmatize(self, tokens: Iterable[str]) -> List[str]:
+        """Нормальные формы списка слов"""
+        return [self.normal_form(token) for token in tokens]
+
+    def variants(self, word: str) -> Set[str]:
+        """Все словоформы слова ("злой" -> "злая", "злые", ...); без словарей - само слово"""
+        word = word.lower()
+        morph = self._analyzer()
+        if morph is None:
+            return {word}
+        forms = {form.word for form in morph.parse(word)[0].lexeme}
+        forms.add(word)
+        return forms
+
+    def get_stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            'loaded': self.is_loaded,
+            'load_time': round(self.load_time, 2) if self.load_time is not None else None,
+            'cache_size': len(self._cache),
+            'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+        }
+
+# Глобальный лемматизатор
+lemmatizer = Lemmatizer(cache_size=config.LEMMA_CACHE_SIZE)
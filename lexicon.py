@@ -0,0 +1,159 @@
+# lexicon.py - Словари тональности, вопросов и запрещённых слов в одном автомате Ахо-Корасик
+import logging
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+import config
+from lemmatizer import lemmatizer
+
+logger = logging.getLogger(__name__)
+
+POSITIVE_WORDS = ['хорошо', 'отлично', 'круто', 'класс', 'люблю', 'нравится', 'рад', 'смешно', 'lol', 'lul', 'pog']
+NEGATIVE_WORDS = ['плохо', 'ужасно', 'ненавижу', 'скучно', 'грустно', 'злой', 'злюсь', 'sad', 'bad', 'cringe']
+QUESTION_WORDS = ['кто', 'что', 'где', 'когда', 'почему', 'зачем', 'как', 'сколько', 'чей']
+
+# Категории словаря
+POSITIVE = 'positive'
+NEGATIVE = 'negative'
+QUESTION = 'question'
+FORBIDDEN = 'forbidden'
+
+# Тональность ищем по началу слова (pog -> pogchamp), вопросы и запрещённые слова - целым словом
+PREFIX_CATEGORIES = {POSITIVE, NEGATIVE}
+
+@dataclass
+class LexiconMatch:
+    """Результат одного прохода по тексту"""
+    sentiment: int = 0
+    is_question: bool = False
+    forbidden: List[str] = field(default_factory=list)
+
+class AhoCorasick:
+    """Автомат Ахо-Корасик: все вхождения всех шаблонов за один проход по тексту"""
+
+    def __init__(self, patterns: Dict[str, List[Tuple[str, str]]]):
+        # Узел: переходы, ссылка неудачи, (категория, исходное слово, длина шаблона) для найденных шаблонов
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.output: List[List[Tuple[str, str, int]]] = [[]]
+
+        for pattern, payloads in patterns.items():
+            node = 0
+            for char in pattern:
+                next_node = self.goto[node].get(char)
+                if next_node is None:
+                    next_node = len(self.goto)
+                    self.goto[node][char] = next_node
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append([])
+                node = next_node
+            self.output[node].extend((category, word, len(pattern)) for category, word in payloads)
+
+        # Ссылки неудачи обходом в ширину
+        queue = list(self.goto[0].values())
+        head = 0
+        while head < len(queue):
+            node = queue[head]
+            head += 1
+            for char, child in self.goto[node].items():
+                queue.append(child)
+                fallback = self.fail[node]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.goto[fallback].get(char, 0) if node else 0
+                self.output[child] = self.output[child] + self.output[self.fail[child]]
+
+    def iter_matches(self, text: str):
+        """(позиция начала, категория, исходное слово, длина) для каждого вхождения"""
+        goto, fail, output = self.goto, self.fail, self.output
+        node = 0
+        for index, char in enumerate(text):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            for category, word, length in output[node]:
+                yield index - length + 1, category, word, length
+
+class Lexicon:
+    """
+    Тональность, вопросительные слова и запрещённые слова в одном автомате.
+    Словоформы разворачиваются через pymorphy2 при сборке ("злой" -> "злые", "злая"...),
+    поэтому поиск - один линейный проход без лемматизации сообщения.
+    Автомат собирается при первом использовании и пересобирается один раз,
+    когда словари pymorphy2 догрузятся в фоне.
+    """
+
+    def __init__(self):
+        self._automaton: Optional[AhoCorasick] = None
+        self._built_with_morph = False
+
+    def _build(self):
+        categories = {
+            POSITIVE: POSITIVE_WORDS,
+            NEGATIVE: NEGATIVE_WORDS,
+            QUESTION: QUESTION_WORDS,
+            FORBIDDEN: config.FORBIDDEN_WORDS,
+        }
+
+        patterns: Dict[str, List[Tuple[str, str]]] = {}
+        for category, words in categories.items():
+            for word in words:
+                # Вопросительные слова не склоняем: "что" -> "чем" уже не вопрос в начале фразы
+                forms = {word} if category == QUESTION else lemmatizer.variants(word)
+                for form in forms:
+                    patterns.setdefault(form, []).append((category, word))
+
+        self._automaton = AhoCorasick(patterns)
+        self._built_with_morph = lemmatizer.is_loaded
+        logger.debug(f"Словарь собран: {len(patterns)} словоформ, {len(self._automaton.goto)} узлов")
+
+    def _get_automaton(self) -> AhoCorasick:
+        if self._automaton is None or (not self._built_with_morph and lemmatizer.is_loaded):
+            self._build()
+        return self._automaton
+
+    def scan(self, text: str, text_lower: Optional[str] = None) -> LexiconMatch:
+        """Тональность (-5..5), вопрос ли это и найденные запрещённые слова"""
+        if text_lower is None:
+            text_lower = text.lower()
+        result = LexiconMatch()
+        positive, negative, forbidden = set(), set(), set()
+
+        stripped = text_lower.lstrip()
+        first_word_start = len(text_lower) - len(stripped)
+
+        for start, category, word, length in self._get_automaton().iter_matches(text_lower):
+            if category in PREFIX_CATEGORIES:
+                if not _is_word_start(text_lower, start):
+                    continue
+            elif not _is_whole_word(text_lower, start, length):
+                continue
+            if category == POSITIVE:
+                positive.add(word)
+            elif category == NEGATIVE:
+                negative.add(word)
+            elif category == QUESTION:
+                if start == first_word_start:
+                    result.is_question = True
+            else:
+                forbidden.add(word)
+
+        result.sentiment = max(-5, min(5, len(positive) - len(negative)))
+        if stripped.rstrip().endswith('?'):
+            result.is_question = True
+        result.forbidden = sorted(forbidden)
+        return result
+
+def _is_word_char(char: str) -> bool:
+    return char.isalnum() or char in '-_'
+
+def _is_word_start(text: str, start: int) -> bool:
+    return start == 0 or not _is_word_char(text[start - 1])
+
+def _is_whole_word(text: str, start: int, length: int) -> bool:
+    end = start + length
+    return _is_word_start(text, start) and (end == len(text) or not _is_word_char(text[end]))
+
+# Глобальный словарь
+lexicon = Lexicon()
@@ -0,0 +1,193 @@
+# loop_monitor.py - Сторожевой таймер цикла событий и поиск блокирующих вызовов
+import asyncio
+import contextlib
+import datetime
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from typing import Dict, Optional, Tuple
+
+import config
+
+logger = logging.getLogger(__name__)
+
+class LoopMonitor:
+    """
+    Следит за задержкой планирования цикла событий.
+    Корутина-сторож регулярно засыпает и меряет, насколько позже она проснулась,
+    а отдельный поток-сэмплер замечает, что сторож давно не отмечался, и снимает
+    стек потока цикла - так видно, какой синхронный код (SQLite, pymorphy2,
+    очеловечивание текста) держит цикл и на каком этапе какого канала.
+    """
+
+    def __init__(self, check_interval: float, block_threshold: float, export_path: Optional[str]):
+        self.check_interval = check_interval
+        self.block_threshold = block_threshold
+        self.export_path = export_path
+
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._heartbeat = time.monotonic()
+        self._reported_heartbeat = None  # Чтобы не писать одну блокировку много раз
+        self._stages: Dict[asyncio.Task, Tuple[str, str]] = {}  # Текущий этап по задачам
+        self._task: Optional[asyncio.Task] = None
+        self._sampler: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+        # Статистика
+        self.lag_last = 0.0
+        self.lag_max = 0.0
+        self.lag_avg = 0.0
+        self.blocks_detected = 0
+        self.blocks_by_stage: Dict[str, int] = {}
+
+    @property
+    def is_running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        """Запускает сторожа в текущем цикле и поток-сэмплер"""
+        if self.is_running:
+            return
+
+        self.loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stop.clear()
+
+        self._task = self.loop.create_task(self._watchdog())
+        self._sampler = threading.Thread(target=self._sample_loop, name="loop-monitor", daemon=True)
+        self._sampler.start()
+
+        logger.info(f"🩺 Мониторинг цикла событий запущен "
+                   f"(интервал {self.check_interval}с, порог {self.block_threshold * 1000:.0f}мс)")
+
+    def stop(self):
+        """Останавливает мониторинг"""
+        self._stop.set()
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    @contextlib.contextmanager
+    def stage(self, channel: str, stage: str):
+        """Помечает текущую задачу этапом конвейера (виден в отчёте о блокировке)"""
+        try:
+            task = asyncio.current_task()
+        except RuntimeError:
+            task = None
+
+        if task is None:
+            yield
+            return
+
+        previous = self._stages.get(task)
+        self._stages[task] = (channel, stage)
+        try:
+            yield
+        finally:
+            if previous is None:
+                self._stages.pop(task, None)
+            else:
+                self._stages[task] = previous
+
+    async def _watchdog(self):
+        """Меряет, насколько позже запланированного просыпается цикл"""
+        while True:
+            expected = time.monotonic() + self.check_interval
+            await asyncio.sleep(self.check_interval)
+            now = time.monotonic()
+            self._heartbeat = now
+
+            lag = max(0.0, now - expected)
+            self.lag_last = lag
+            self.lag_max = max(self.lag_max, lag)
+            self.lag_avg = self.lag_avg * 0.9 + lag * 0.1
+
+            if lag > self.block_threshold:
+                logger.warning(f"⏱️ Цикл событий опоздал на {lag * 1000:.0f}мс")
+
+    def _sample_loop(self):
+        """Поток-сэмплер: ловит момент, когда цикл завис, и снимает его стек"""
+        poll_interval = max(0.01, self.block_threshold / 2)
+
+        while not self._stop.wait(poll_interval):
+            heartbeat = self._heartbeat
+            blocked_for = time.monotonic() - heartbeat - self.check_interval
+
+            if blocked_for < self.block_threshold or heartbeat == self._reported_heartbeat:
+                continue
+
+            self._reported_heartbeat = heartbeat
+            try:
+                self._report_block(blocked_for)
+            except Exception as e:
+                logger.debug(f"Ошибка снятия стека блокировки: {e}")
+
+    def _current_stage(self) -> Tuple[Optional[str], Optional[str], Optional[str]]:
+        """Возвращает (канал, этап, имя задачи), которая сейчас держит цикл"""
+        task = asyncio.current_task(self.loop) if self.loop else None
+        if task is None:
+            return None, None, None
+
+        channel, stage = self._stages.get(task, (None, None))
+        return channel, stage, task.get_name()
+
+    def _report_block(self, blocked_for: float):
+        """Пишет стек блокирующего вызова в лог и в файл экспорта"""
+        frame = sys._current_frames().get(self._loop_thread_id)
+        if frame is None:
+            return
+
+        stack = traceback.format_stack(frame)
+        channel, stage, task_name = self._current_stage()
+
+        self.blocks_detected += 1
+        stage_key = f"{channel or '-'}:{stage or '-'}"
+        self.blocks_by_stage[stage_key] = self.blocks_by_stage.get(stage_key, 0) + 1
+
+        logger.warning(f"[{channel or '-'}] 🧱 Цикл заблокирован уже {blocked_for * 1000:.0f}мс "
+                       f"(этап: {stage or 'неизвестен'}, задача: {task_name or '-'})\n"
+                       + "".join(stack[-8:]))
+
+        self._export({
+            'time': datetime.datetime.now().isoformat(),
+            'blocked_for': round(blocked_for, 3),
+            'channel': channel,
+            'stage': stage,
+            'task': task_name,
+            'stack': [line.rstrip() for line in stack],
+        })
+
+    def _export(self, record: Dict):
+        """Добавляет запись в JSONL файл"""
+        if not self.export_path:
+            return
+
+        directory = os.path.dirname(self.export_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        with open(self.export_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def get_stats(self) -> Dict:
+        """Сводка для статистики"""
+        return {
+            'lag_last_ms': round(self.lag_last * 1000, 1),
+            'lag_avg_ms': round(self.lag_avg * 1000, 1),
+            'lag_max_ms': round(self.lag_max * 1000, 1),
+            'blocks_detected': self.blocks_detected,
+            'top_stages': sorted(self.blocks_by_stage.items(), key=lambda x: x[1], reverse=True)[:5],
+        }
+
+# Глобальный экземпляр монитора
+loop_monitor = LoopMonitor(
+    check_interval=config.LOOP_LAG_CHECK_INTERVAL,
+    block_threshold=config.LOOP_BLOCK_THRESHOLD,
+    export_path=config.LOOP_BLOCK_EXPORT_PATH
+)
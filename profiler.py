@@ -0,0 +1,228 @@
+# profiler.py - Профилирование живого процесса: сэмплирующий CPU профайлер и снимки памяти
+import dataclasses
+import datetime
+import linecache
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter, deque
+from typing import List, Optional
+
+import config
+
+logger = logging.getLogger(__name__)
+
+def _timestamp() -> str:
+    """Для имён файлов: с миллисекундами, чтобы два дампа подряд не перезаписали друг друга"""
+    return datetime.datetime.now().strftime('%Y%m%d-%H%M%S-%f')[:-3]
+
+def deep_sizeof(obj, seen: Optional[set] = None) -> int:
+    """
+    Оценка памяти объекта вместе с содержимым. Обходит только контейнеры
+    и датаклассы - в произвольные объекты (сессии, задачи, цикл событий) не заходит.
+    """
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(k, seen) + deep_sizeof(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset, deque)):
+        size += sum(deep_sizeof(item, seen) for item in obj)
+    elif dataclasses.is_dataclass(obj) and not isinstance(obj, type):
+        size += sum(deep_sizeof(getattr(obj, f.name), seen) for f in dataclasses.fields(obj))
+    return size
+
+class SamplingProfiler:
+    """
+    Сэмплирующий профайлер: отдельный поток периодически снимает стеки всех
+    потоков через sys._current_frames() и считает одинаковые стеки.
+    Результат - folded-формат (flamegraph.pl, speedscope, inferno).
+    Накладные расходы зависят только от частоты сэмплов, а не от кода бота.
+    """
+
+    def __init__(self, interval: float, output_dir: str):
+        self.interval = interval
+        self.output_dir = output_dir
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.started_at: Optional[float] = None
+        self.duration: Optional[float] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.last_output: Optional[str] = None
+
+    @property
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, duration: Optional[float] = None):
+        """Запускает сэмплирование (на duration секунд или до stop)"""
+        if self.is_running:
+            raise RuntimeError("профайлер уже запущен")
+
+        self.stacks = Counter()
+        self.samples = 0
+        self.duration = duration
+        self.started_at = time.monotonic()
+        self._stop.clear()
+
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        logger.info(f"🔬 CPU профайлер запущен (интервал {self.interval * 1000:.0f}мс, "
+                   f"длительность {duration or '∞'}с)")
+
+    def stop(self) -> Optional[str]:
+        """Останавливает сэмплирование и пишет результат, возвращает путь к файлу"""
+        if not self._thread:
+            return self.last_output
+
+        self._stop.set()
+        if self._thread is not threading.current_thread():
+            self._thread.join()
+        self._thread = None
+
+        return self._write()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        names = {}
+
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                if thread_id not in names:
+                    names = {t.ident: t.name for t in threading.enumerate()}
+                self.stacks[self._fold(names.get(thread_id, str(thread_id)), frame)] += 1
+            self.samples += 1
+
+            if self.duration and time.monotonic() - self.started_at >= self.duration:
+                self._stop.set()
+                self.last_output = self._write()
+                self._thread = None
+                break
+
+    def _fold(self, thread_name: str, frame) -> str:
+        """Превращает стек в строку 'поток;корень;...;лист'"""
+        parts = []
+        while frame is not None:
+            code = frame.f_code
+            parts.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+            frame = frame.f_back
+        parts.append(thread_name)
+        return ";".join(reversed(parts))
+
+    def _write(self) -> str:
+        """Записывает folded-стеки в файл"""
+        os.makedirs(self.output_dir, exist_ok=True)
+        path = os.path.join(self.output_dir, f"cpu-{_timestamp()}.folded")
+
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+        self.last_output = path
+        logger.info(f"🔬 CPU профиль записан: {path} ({self.samples} сэмплов)")
+        return path
+
+    def status(self) -> str:
+        if not self.is_running:
+            return f"не запущен (последний профиль: {self.last_output or 'нет'})"
+        elapsed = time.monotonic() - self.started_at
+        return f"работает {elapsed:.0f}с, сэмплов: {self.samples}"
+
+class MemoryProfiler:
+    """Снимки tracemalloc и их сравнение"""
+
+    def __init__(self, frames: int, output_dir: str):
+        self.frames = frames
+        self.output_dir = output_dir
+        self.snapshots: List[tracemalloc.Snapshot] = []
+
+    @property
+    def is_tracing(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    def start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+            logger.info(f"🧠 tracemalloc запущен ({self.frames} кадров)")
+
+    def stop(self):
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+        self.snapshots.clear()
+        logger.info("🧠 tracemalloc остановлен")
+
+    def take_snapshot(self) -> str:
+        """
+        Делает снимок и сохраняет его на диск (можно открыть через tracemalloc.Snapshot.load).
+        Трассировка должна быть запущена заранее: снимок сразу после start() пустой.
+        Медленно на большом процессе - вызывать не из цикла событий.
+        """
+        if not tracemalloc.is_tracing():
+            raise RuntimeError("tracemalloc не запущен - сначала mem start")
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, linecache.__file__),
+        ))
+        self.snapshots.append(snapshot)
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        path = os.path.join(self.output_dir, f"mem-{_timestamp()}-{len(self.snapshots)}.snapshot")
+        snapshot.dump(path)
+
+        current, peak = tracemalloc.get_traced_memory()
+        logger.info(f"🧠 Снимок памяти #{len(self.snapshots)}: {current / 1024 / 1024:.1f}МБ "
+                   f"(пик {peak / 1024 / 1024:.1f}МБ) -> {path}")
+        return path
+
+    def top(self, limit: int = 15) -> List[str]:
+        """Самые большие места аллокаций в последнем снимке"""
+        if not self.snapshots:
+            return ["нет снимков"]
+        stats = self.snapshots[-1].statistics('lineno')
+        return [str(stat) for stat in stats[:limit]]
+
+    def diff(self, limit: int = 15) -> List[str]:
+        """Сравнивает два последних снимка - что выросло"""
+        if len(self.snapshots) < 2:
+            return ["нужно минимум два снимка"]
+        stats = self.snapshots[-1].compare_to(self.snapshots[-2], 'lineno')
+        return [str(stat) for stat in stats[:limit]]
+
+    def diff_folded(self) -> str:
+        """Рост памяти между двумя последними снимками в folded-формате (байты как вес)"""
+        if len(self.snapshots) < 2:
+            raise RuntimeError("нужно минимум два снимка")
+
+        stats = self.snapshots[-1].compare_to(self.snapshots[-2], 'traceback')
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        path = os.path.join(self.output_dir, f"mem-diff-{_timestamp()}.folded")
+
+        with open(path, 'w', encoding='utf-8') as f:
+            for stat in stats:
+                if stat.size_diff <= 0:
+                    continue
+                frames = [f"{os.path.basename(fr.filename)}:{fr.lineno}" for fr in stat.traceback]
+                f.write(f"{';'.join(frames)} {stat.size_diff}\n")
+
+        return path
+
+# Глобальные экземпляры
+cpu_profiler = SamplingProfiler(
+    interval=config.PROFILER_SAMPLE_INTERVAL,
+    output_dir=config.PROFILER_OUTPUT_DIR
+)
+memory_profiler = MemoryProfiler(
+    frames=config.TRACEMALLOC_FRAMES,
+    output_dir=config.PROFILER_OUTPUT_DIR
+)
@@ -1,10 +1,12 @@
 #!/usr/bin/env python3
 # run.py - Скрипт запуска бота
+import argparse
 import asyncio
 import logging
 import sys
 import signal
 
+import config
 from bot import HumanTwitchBot, main
 
 # Настройка логирования с цветами
@@ -52,15 +54,26 @@ def signal_handler(signum, frame):
     sys.exit(0)
 
 if __name__ == "__main__":
-    # Регистрация обработчиков сигналов
-    signal.signal(signal.SIGINT, signal_handler)
-    signal.signal(signal.SIGTERM, signal_handler)
-    
+    parser = argparse.ArgumentParser(description="Человечный Twitch бот")
+    parser.add_argument('--workers', type=int, default=config.BOT_WORKERS,
+                        help="Число процессов, между которыми делятся каналы")
+    args = parser.parse_args()
+
     print("=" * 80)
     print("🤖 ЗАПУСК ЧЕЛОВЕЧНОГО ТВИТЧ БОТА")
     print("=" * 80)
     
     try:
+        if args.workers > 1:
+            # Супервизор сам обрабатывает сигналы и останавливает воркеры
+            from supervisor import run_supervisor
+            run_supervisor(args.workers)
+            sys.exit(0)
+
+        # Регистрация обработчиков сигналов
+        signal.signal(signal.SIGINT, signal_handler)
+        signal.signal(signal.SIGTERM, signal_handler)
+
         # Запуск бота
         asyncio.run(main())
     except KeyboardInterrupt:
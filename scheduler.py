@@ -0,0 +1,182 @@
+# scheduler.py - Единый планировщик отложенных событий (куча дедлайнов)
+import asyncio
+import heapq
+import inspect
+import itertools
+import logging
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+from clock import clock
+
+logger = logging.getLogger(__name__)
+
+class _Entry:
+    __slots__ = ('deadline', 'seq', 'key', 'callback', 'cancelled')
+
+    def __init__(self, deadline: float, seq: int, key: Hashable, callback: Callable):
+        self.deadline = deadline
+        self.seq = seq
+        self.key = key
+        self.callback = callback
+        self.cancelled = False
+
+    def __lt__(self, other: '_Entry') -> bool:
+        return (self.deadline, self.seq) < (other.deadline, other.seq)
+
+class Scheduler:
+    """
+    Вместо нескольких циклов, которые каждые N секунд обходят все каналы,
+    события (возврат из АФК, второе сообщение, обновление энергии и смайликов,
+    фоновый анализ) регистрируются с точным дедлайном в одной куче.
+    Задача планировщика спит ровно до ближайшего дедлайна, поэтому каналы,
+    у которых ничего не запланировано, ничего не стоят.
+    Ключ события уникален: повторная регистрация заменяет старую.
+    """
+
+    def __init__(self):
+        self._heap: List[_Entry] = []
+        self._entries: Dict[Hashable, _Entry] = {}
+        self._seq = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._running_tasks: set = set()
+
+        # Метрики
+        self.fired = 0
+        self.failed = 0
+        self.max_late = 0.0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def schedule(self, key: Hashable, delay: float, callback: Callable[[], Any]):
+        """Регистрирует событие через delay секунд"""
+        self.schedule_at(key, clock.monotonic() + max(0.0, delay), callback)
+
+    def schedule_at(self, key: Hashable, deadline: float, callback: Callable[[], Any]):
+        """Регистрирует событие на момент deadline (по clock.monotonic)"""
+        self.cancel(key)
+
+        entry = _Entry(deadline, next(self._seq), key, callback)
+        self._entries[key] = entry
+        is_earliest = not self._heap or entry < self._heap[0]
+        heapq.heappush(self._heap, entry)
+
+        # Отменённые записи копятся в куче - иногда пересобираем её
+        if len(self._heap) > 2 * len(self._entries) + 64:
+            self._heap = [e for e in self._heap if not e.cancelled]
+            heapq.heapify(self._heap)
+
+        # Новый дедлайн раньше того, до которого спит планировщик - будим его
+        if is_earliest and self._wakeup is not None:
+            self._wakeup.set()
+
+    def cancel(self, key: Hashable) -> bool:
+        """Отменяет событие (ленивое удаление из кучи)"""
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return False
+        entry.cancelled = True
+        return True
+
+    def cancel_where(self, predicate: Callable[[Hashable], bool]) -> int:
+        """Отменяет все события, ключи которых подходят (например, все события канала)"""
+        keys = [key for key in self._entries if predicate(key)]
+        for key in keys:
+            self.cancel(key)
+        return len(keys)
+
+    def is_scheduled(self, key: Hashable) -> bool:
+        return key in self._entries
+
+    def time_until(self, key: Hashable) -> Optional[float]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        return entry.deadline - clock.monotonic()
+
+    def _next_entry(self) -> Optional[_Entry]:
+        while self._heap and self._heap[0].cancelled:
+            heapq.heappop(self._heap)
+        return self._heap[0] if self._heap else None
+
+    def _pop_due(self) -> List[_Entry]:
+        now = clock.monotonic()
+        due = []
+        while True:
+            entry = self._next_entry()
+            if entry is None or entry.deadline > now:
+                break
+            heapq.heappop(self._heap)
+            del self._entries[entry.key]
+            self.max_late = max(self.max_late, now - entry.deadline)
+            due.append(entry)
+        return due
+
+    async def run_due(self) -> int:
+        """Выполняет все наступившие события по порядку (используется в симуляции)"""
+        count = 0
+        while True:
+            due = self._pop_due()
+            if not due:
+                return count
+            for entry in due:
+                await self._execute(entry)
+                count += 1
+
+    async def _execute(self, entry: _Entry):
+        self.fired += 1
+        try:
+            result = entry.callback()
+            if inspect.isawaitable(result):
+                await result
+        except Exception as e:
+            self.failed += 1
+            logger.error(f"Ошибка события {entry.key}: {e}")
+
+    def start(self):
+        if self._task and not self._task.done():
+            return
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+        logger.info("⏰ Планировщик запущен")
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        for task in list(self._running_tasks):
+            task.cancel()
+
+    async def _run(self):
+        """Спит до ближайшего дедлайна, события выполняет отдельными задачами"""
+        while True:
+            entry = self._next_entry()
+            timeout = None if entry is None else max(0.0, entry.deadline - clock.monotonic())
+
+            self._wakeup.clear()
+            if timeout is None or timeout > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                    continue  # Появился более ранний дедлайн
+                except asyncio.TimeoutError:
+                    pass
+
+            for due in self._pop_due():
+                task = asyncio.get_running_loop().create_task(self._execute(due))
+                self._running_tasks.add(task)
+                task.add_done_callback(self._running_tasks.discard)
+
+    def get_stats(self) -> Dict:
+        entry = self._next_entry()
+        return {
+            'scheduled': len(self._entries),
+            'heap_size': len(self._heap),
+            'fired': self.fired,
+            'failed': self.failed,
+            'max_late_ms': round(self.max_late * 1000, 1),
+            'next_in': round(entry.deadline - clock.monotonic(), 1) if entry else None,
+        }
+
+# Глобальный планировщик
+scheduler = Scheduler()
@@ -0,0 +1,261 @@
+# send_queue.py - Общая очередь исходящих сообщений с лимитами Twitch и приоритетами
+import asyncio
+import heapq
+import itertools
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+import config
+from clock import clock
+
+logger = logging.getLogger(__name__)
+
+# Приоритеты: меньше - важнее
+PRIORITY_MENTION = 0  # Ответ на упоминание бота
+PRIORITY_REPLY = 1  # Обычный ответ
+PRIORITY_EXTRA = 2  # Второе сообщение, "вернулся", сообщения из одних смайликов
+
+PRIORITY_NAMES = {PRIORITY_MENTION: 'mention', PRIORITY_REPLY: 'reply', PRIORITY_EXTRA: 'extra'}
+
+@dataclass
+class OutgoingMessage:
+    """Сообщение, ждущее отправки в чат"""
+    channel: Any  # Объект канала twitchio (нужен только send)
+    channel_name: str
+    content: str
+    priority: int = PRIORITY_REPLY
+    ttl: float = 0.0  # Через сколько секунд сообщение теряет смысл, 0 - по приоритету
+    created_at: float = field(default_factory=clock.monotonic)
+    future: Optional[asyncio.Future] = None
+
+    @property
+    def expires_at(self) -> float:
+        return self.created_at + self.ttl
+
+class TokenBucket:
+    """Не больше capacity сообщений за window секунд, с равномерным восполнением"""
+
+    def __init__(self, capacity: int, window: float):
+        self.capacity = capacity
+        self.rate = capacity / window
+        self.tokens = float(capacity)
+        self.updated: Optional[float] = None  # Часы могут переключиться на виртуальные после импорта
+
+    def _refill(self):
+        now = clock.monotonic()
+        if self.updated is not None:
+            self.tokens = min(self.capacity, self.tokens + max(0.0, now - self.updated) * self.rate)
+        self.updated = now
+
+    def time_until_token(self) -> float:
+        self._refill()
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self):
+        self._refill()
+        self.tokens -= 1
+
+class SendQueue:
+    """
+    Все отправки в чат идут через одну очередь: общий лимит аккаунта (token bucket),
+    минимальный интервал между сообщениями в одном канале, приоритеты (упоминания
+    раньше обычных ответов, обычные раньше вторых сообщений и смайликов) и отброс
+    сообщений, которые простояли дольше своего TTL и уже неуместны.
+    Без запущенного диспетчера (симуляция) отправка выполняется сразу в вызывающей
+    задаче с теми же ожиданиями по виртуальным часам.
+    """
+
+    def __init__(self, rate_limit: int, rate_window: float, channel_interval: float, maxsize: int):
+        self.bucket = TokenBucket(rate_limit, rate_window)
+        self.channel_interval = channel_interval
+        self.maxsize = maxsize
+        self._heap: List[tuple] = []
+        self._seq = itertools.count()
+        self._last_sent: Dict[str, float] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+        # Метрики
+        self.sent = 0
+        self.expired = 0
+        self.overflow = 0
+        self.failed = 0
+        self.total_delay = 0.0
+        self.max_delay = 0.0
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    @property
+    def is_running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        if self.is_running:
+            return
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+        logger.info("📮 Очередь отправки запущена")
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        while self._heap:
+            _, _, item = heapq.heappop(self._heap)
+            self._resolve(item, False)
+
+    async def send(self, channel: Any, channel_name: str, content: str,
+                   priority: int = PRIORITY_REPLY, ttl: float = 0.0, wait: bool = True) -> bool:
+        """
+        Ставит сообщение в очередь. С wait=True ждёт результата:
+        True - отправлено, False - отброшено (устарело, переполнение, ошибка).
+        """
+        item = OutgoingMessage(
+            channel=channel,
+            channel_name=channel_name,
+            content=content,
+            priority=priority,
+            ttl=ttl or config.SEND_MESSAGE_TTL[priority]
+        )
+
+        if not self.is_running:
+            return await self._send_inline(item)
+
+        item.future = asyncio.get_running_loop().create_future()
+        self._push(item)
+        if not wait:
+            return True
+        return await item.future
+
+    def _push(self, item: OutgoingMessage):
+        if len(self._heap) >= self.maxsize:
+            # Вытесняем наименее важное и самое новое
+            worst = max(self._heap)
+            if item.priority >= worst[0]:
+                self.overflow += 1
+                self._resolve(item, False)
+                return
+            self._heap.remove(worst)
+            heapq.heapify(self._heap)
+            self.overflow += 1
+            self._resolve(worst[2], False)
+
+        heapq.heappush(self._heap, (item.priority, next(self._seq), item))
+        self._wakeup.set()
+
+    def _channel_wait(self, channel_name: str) -> float:
+        last = self._last_sent.get(channel_name)
+        if last is None:
+            return 0.0
+        return max(0.0, last + self.channel_interval - clock.monotonic())
+
+    def _pop_ready(self) -> tuple:
+        """
+        Самое важное сообщение, чей канал уже можно писать.
+        Возвращает (сообщение или None, сколько ждать до следующего готового).
+        """
+        now = clock.monotonic()
+        skipped = []
+        ready = None
+        wait = None
+
+        while self._heap:
+            entry = heapq.heappop(self._heap)
+            item = entry[2]
+            if now > item.expires_at:
+                self._expire(item)
+                continue
+            channel_wait = self._channel_wait(item.channel_name)
+            if channel_wait <= 0:
+                ready = item
+                break
+            wait = channel_wait if wait is None else min(wait, channel_wait)
+            skipped.append(entry)
+
+        for entry in skipped:
+            heapq.heappush(self._heap, entry)
+        return ready, wait
+
+    async def _run(self):
+        """Диспетчер: ждёт токен и свободный канал, отправляет по приоритету"""
+        while True:
+            token_wait = self.bucket.time_until_token()
+            if token_wait > 0:
+                await clock.sleep(token_wait)
+                continue
+
+            item, wait = self._pop_ready()
+            if item is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            await self._deliver(item)
+
+    async def _send_inline(self, item: OutgoingMessage) -> bool:
+        delay = max(self.bucket.time_until_token(), self._channel_wait(item.channel_name))
+        if delay > 0:
+            await clock.sleep(delay)
+        if clock.monotonic() > item.expires_at:
+            self._expire(item)
+            return False
+        return await self._deliver(item)
+
+    async def _deliver(self, item: OutgoingMessage) -> bool:
+        self.bucket.take()
+        self._last_sent[item.channel_name] = clock.monotonic()
+        try:
+            await item.channel.send(item.content)
+        except Exception as e:
+            self.failed += 1
+            logger.error(f"[{item.channel_name}] Ошибка отправки: {e}")
+            self._resolve(item, False)
+            return False
+
+        delay = clock.monotonic() - item.created_at
+        self.sent += 1
+        self.total_delay += delay
+        self.max_delay = max(self.max_delay, delay)
+        self._resolve(item, True)
+        return True
+
+    def _expire(self, item: OutgoingMessage):
+        self.expired += 1
+        logger.debug(f"[{item.channel_name}] ⌛ Сообщение устарело в очереди: {item.content}")
+        self._resolve(item, False)
+
+    @staticmethod
+    def _resolve(item: OutgoingMessage, result: bool):
+        if item.future is not None and not item.future.done():
+            item.future.set_result(result)
+
+    def get_stats(self) -> Dict:
+        depth = {name: 0 for name in PRIORITY_NAMES.values()}
+        for priority, _, _ in self._heap:
+            depth[PRIORITY_NAMES[priority]] += 1
+        return {
+            'depth': len(self._heap),
+            **{f'depth_{name}': count for name, count in depth.items()},
+            'sent': self.sent,
+            'expired': self.expired,
+            'overflow': self.overflow,
+            'failed': self.failed,
+            'avg_delay_ms': round(self.total_delay / self.sent * 1000, 1) if self.sent else 0.0,
+            'max_delay_ms': round(self.max_delay * 1000, 1),
+            'tokens': round(self.bucket.tokens, 1),
+        }
+
+# Глобальная очередь отправки
+send_queue = SendQueue(
+    rate_limit=config.SEND_RATE_LIMIT,
+    rate_window=config.SEND_RATE_WINDOW,
+    channel_interval=config.SEND_CHANNEL_MIN_INTERVAL,
+    maxsize=config.SEND_QUEUE_MAXSIZE
+)
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+# simulate.py - Детерминированный повтор логов чата с виртуальным временем
+"""
+Прогоняет записанный чат через бота без Twitch и без ожиданий:
+время виртуальное, random засеян, API анализатора и генератора отключены
+(используются их запасные ответы). Два прогона с одним seed дают одинаковый
+дайджест решений - удобно сравнивать производительность между версиями.
+
+    python simulate.py data/channel.db --seed 42
+    python simulate.py chat.jsonl --output decisions.jsonl
+
+Формат JSONL: {"channel": "...", "author": "...", "content": "...", "timestamp": "2025-01-01T12:00:00"}
+"""
+import argparse
+import asyncio
+import datetime
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+import config
+from clock import clock
+from lemmatizer import lemmatizer
+
+logger = logging.getLogger("simulate")
+
+class SimAuthor:
+    def __init__(self, name: str):
+        self.name = name
+
+class SimChannel:
+    """Канал, который вместо отправки в Twitch записывает решения бота"""
+
+    def __init__(self, name: str, decisions: List[Dict]):
+        self.name = name
+        self.decisions = decisions
+
+    async def send(self, content: str):
+        self.decisions.append({
+            'time': clock.now().isoformat(),
+            'channel': self.name,
+            'content': content,
+        })
+
+class SimMessage:
+    def __init__(self, content: str, author: SimAuthor, channel: SimChannel):
+        self.content = content
+        self.author = author
+        self.channel = channel
+        self.echo = False
+
+def _parse_timestamp(value) -> datetime.datetime:
+    if isinstance(value, datetime.datetime):
+        return value
+    return datetime.datetime.fromisoformat(str(value))
+
+def load_messages(path: str, channel: Optional[str] = None, limit: Optional[int] = None) -> List[Dict]:
+    """Загружает сообщения зрителей из БД канала или JSONL файла"""
+    messages = []
+
+    if path.endswith('.db'):
+        db_channel = channel or os.path.splitext(os.path.basename(path))[0]
+        with sqlite3.connect(path) as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT author, content, timestamp
+                FROM messages
+                WHERE is_bot = 0
+                ORDER BY timestamp ASC, id ASC
+            """)
+            for author, content, timestamp in cursor.fetchall():
+                messages.append({
+                    'channel': db_channel,
+                    'author': author,
+                    'content': content,
+                    'timestamp': _parse_timestamp(timestamp),
+                })
+    else:
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if channel and record['channel'] != channel:
+                    continue
+                record['timestamp'] = _parse_timestamp(record['timestamp'])
+                messages.append(record)
+        messages.sort(key=lambda m: m['timestamp'])
+
+    if limit:
+        messages = messages[:limit]
+
+    return messages
+
+async def run_simulation(messages: List[Dict], seed: int, data_dir: str) -> Dict:
+    """Прогоняет сообщения через бота, возвращает решения и итоговое состояние"""
+    clock.enable_simulation(start=messages[0]['timestamp'], seed=seed)
+
+    config.DATA_DIR = data_dir
+    config.TWITCH_TOKEN = config.TWITCH_TOKEN or "oauth:simulation"  # Подключения не будет
+    config.TWITCH_CHANNELS = sorted({m['channel'] for m in messages})
+    config.LOOP_MONITOR_ENABLED = False
+    config.ADMIN_ENABLED = False
+    config.SNAPSHOT_ENABLED = False  # Каждый прогон начинается с чистого состояния
+    config.EMOTE_REFRESH_INTERVAL = float('inf')  # Без сети: наборы смайликов не перезагружаются
+
+    # Импорт после настройки config: бот читает список каналов при создании
+    from bot import HumanTwitchBot
+    from context_analyzer import context_analyzer
+    from ai_service import response_generator
+    from scheduler import scheduler
+    from send_queue import send_queue
+
+    # Без сети: анализатор и генератор уходят в запасные ответы
+    context_analyzer.api_key = None
+    response_generator.gemini_api_key = None
+
+    bot = HumanTwitchBot()
+    bot.start_background_events()
+    decisions: List[Dict] = []
+    channels = {name: SimChannel(name, decisions) for name in config.TWITCH_CHANNELS}
+    authors: Dict[str, SimAuthor] = {}
+
+    try:
+        for record in messages:
+            clock.advance_to(record['timestamp'])
+            await scheduler.run_due()
+            author = authors.setdefault(record['author'], SimAuthor(record['author']))
+            await bot.event_message(SimMessage(record['content'], author, channels[record['channel']]))
+            await bot.drain_queue(record['channel'])
+    finally:
+        await bot.close_services()
+
+    final_state = {
+        name: {
+            'mood': state.mood,
+            'energy': round(state.energy, 6),
+            'messages_sent_today': state.messages_sent_today,
+        }
+        for name, state in sorted(bot.channel_states.items())
+    }
+
+    return {
+        'decisions': decisions,
+        'final_state': final_state,
+        'gate_stats': dict(bot.gate_stats),
+        'send_stats': send_queue.get_stats(),
+    }
+
+def digest(result: Dict) -> str:
+    payload = json.dumps({
+        'decisions': result['decisions'],
+        'final_state': result['final_state'],
+    }, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def main():
+    parser = argparse.ArgumentParser(description="Детерминированный повтор чата")
+    parser.add_argument('source', help="БД канала (data/<канал>.db) или JSONL с сообщениями")
+    parser.add_argument('--channel', help="Только этот канал")
+    parser.add_argument('--seed', type=int, default=config.SIMULATION_SEED)
+    parser.add_argument('--limit', type=int, help="Не больше N сообщений")
+    parser.add_argument('--output', help="Записать решения бота в JSONL")
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.DEBUG if args.verbose else logging.WARNING)
+
+    messages = load_messages(args.source, args.channel, args.limit)
+    if not messages:
+        print("Нет сообщений для повтора")
+        sys.exit(1)
+
+    # Словари до повтора: иначе первые сообщения разобрались бы без лемм, как повезёт с потоком
+    lemmatizer.load()
+
+    with tempfile.TemporaryDirectory(prefix="twitch-sim-") as data_dir:
+        started = time.perf_counter()
+        result = asyncio.run(run_simulation(messages, args.seed, data_dir))
+        wall_time = time.perf_counter() - started
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            for decision in result['decisions']:
+                f.write(json.dumps(decision, ensure_ascii=False) + "\n")
+
+    virtual_span = (messages[-1]['timestamp'] - messages[0]['timestamp']).total_seconds()
+
+    print("=" * 60)
+    print(f"Сообщений: {len(messages)}, ответов бота: {len(result['decisions'])}")
+    print(f"Виртуальное время: {virtual_span:.0f}с, реальное: {wall_time:.2f}с "
+          f"({len(messages) / wall_time:.0f} сообщ/с)")
+    print(f"Отсев по ступеням: {result['gate_stats']}")
+    print(f"Отправка: {result['send_stats']}")
+    print(f"Seed: {args.seed}")
+    print(f"Дайджест решений: {digest(result)}")
+    print("=" * 60)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+# snapshot.py - Снимки состояния каналов для тёплого перезапуска
+import json
+import logging
+import os
+import sqlite3
+import time
+from typing import Dict, List, Optional
+
+import config
+
+logger = logging.getLogger(__name__)
+
+class SnapshotStore:
+    """
+    Компактные снимки состояния по каналам в одной таблице SQLite (JSON на канал).
+    После перезапуска бот берёт отсюда настроение, энергию, память, смайлики
+    и время последнего анализа вместо того, чтобы начинать с нуля и заново
+    платить за загрузку смайликов и анализы.
+    Снимки уснувших каналов (hibernated) восстанавливаются без ограничения
+    возраста: канал может проспать всю ночь, а его состояние - только у нас.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self._path = path
+        self._initialized = False
+
+    @property
+    def path(self) -> str:
+        # DATA_DIR может поменяться после импорта (симуляция)
+        return self._path or os.path.join(config.DATA_DIR, "snapshots.db")
+
+    def _connect(self) -> sqlite3.Connection:
+        if not self._initialized:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with sqlite3.connect(self.path) as conn:
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS snapshots (
+                        channel TEXT PRIMARY KEY,
+                        data TEXT NOT NULL,
+                        saved_at REAL NOT NULL,
+                        hibernated INTEGER NOT NULL DEFAULT 0
+                    )
+                """)
+                columns = {row[1] for row in conn.execute("PRAGMA table_info(snapshots)")}
+                if 'hibernated' not in columns:  # Файл от прежней версии
+                    conn.execute("ALTER TABLE snapshots ADD COLUMN hibernated INTEGER NOT NULL DEFAULT 0")
+            self._initialized = True
+        return sqlite3.connect(self.path)
+
+    def save_many(self, snapshots: Dict[str, Dict], hibernated: bool = False):
+        """Сохраняет снимки нескольких каналов одной транзакцией (hibernated - каналы уснули)"""
+        if not snapshots:
+            return
+        now = time.time()
+        rows = [
+            (channel, json.dumps(data, ensure_ascii=False, separators=(',', ':')), now, int(hibernated))
+            for channel, data in snapshots.items()
+        ]
+        with self._connect() as conn:
+            conn.executemany("""
+                INSERT INTO snapshots (channel, data, saved_at, hibernated) VALUES (?, ?, ?, ?)
+                ON CONFLICT(channel) DO UPDATE SET data = excluded.data, saved_at = excluded.saved_at,
+                                                   hibernated = excluded.hibernated
+            """, rows)
+
+    def save(self, channel: str, data: Dict, hibernated: bool = False):
+        self.save_many({channel: data}, hibernated)
+
+    def load_many(self, channels: List[str], max_age: float) -> Dict[str, Dict]:
+        """Снимки каналов не старше max_age секунд; снимки уснувших каналов - любого возраста"""
+        if not channels or not os.path.exists(self.path):
+            return {}
+
+        placeholders = ",".join("?" * len(channels))
+        with self._connect() as conn:
+            rows = conn.execute(
+                f"SELECT channel, data FROM snapshots WHERE (saved_at >= ? OR hibernated) AND channel IN ({placeholders})",
+                (time.time() - max_age, *channels)
+            ).fetchall()
+
+        snapshots = {}
+        for channel, data in rows:
+            try:
+                snapshots[channel] = json.loads(data)
+            except ValueError as e:
+                logger.error(f"[{channel}] Повреждённый снимок состояния: {e}")
+        return snapshots
+
+    def load(self, channel: str, max_age: float) -> Optional[Dict]:
+        return self.load_many([channel], max_age).get(channel)
+
+    def delete(self, channel: str):
+        if not os.path.exists(self.path):
+            return
+        with self._connect() as conn:
+            conn.execute("DELETE FROM snapshots WHERE channel = ?", (channel,))
+
+# Глобальное хранилище снимков
+snapshot_store = SnapshotStore()
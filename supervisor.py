@@ -0,0 +1,263 @@
+# supervisor.py - Запуск бота в нескольких процессах с шардированием каналов
+import asyncio
+import logging
+import multiprocessing
+import queue
+import signal
+import time
+from typing import Dict, List, Optional
+
+import config
+
+logger = logging.getLogger(__name__)
+
+def worker_main(worker_id: int, channels: List[str], metrics_queue):
+    """Точка входа процесса-воркера: обычный бот на своей доле каналов"""
+    # Свой порт админ-интерфейса у каждого воркера
+    config.ADMIN_PORT = config.ADMIN_PORT + worker_id + 1
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Останавливает супервизор через SIGTERM
+
+    from bot import main
+    logger.info(f"[воркер {worker_id}] Каналы: {', '.join(channels)}")
+    asyncio.run(_run_worker(main, worker_id, channels, metrics_queue))
+
+async def _run_worker(main, worker_id: int, channels: List[str], metrics_queue):
+    """
+    SIGTERM отменяет задачу бота, а не убивает процесс: в finally у main()
+    сохраняются снимки, освобождаются аренды, сбрасываются тренды и БД,
+    а очередь метрик не остаётся недописанной.
+    """
+    task = asyncio.current_task()
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, task.cancel)
+    try:
+        await main(channels=channels, worker_id=worker_id, metrics_queue=metrics_queue)
+    except asyncio.CancelledError:
+        logger.info(f"[воркер {worker_id}] Остановлен по SIGTERM")
+
+class WorkerHandle:
+    """Процесс-воркер и всё, что супервизор о нём знает"""
+
+    def __init__(self, worker_id: int, channels: List[str]):
+        self.worker_id = worker_id
+        self.channels = channels
+        self.process: Optional[multiprocessing.Process] = None
+        self.started_at = 0.0
+        self.restarts = 0
+        self.restart_at: Optional[float] = None  # Когда перезапустить упавший процесс
+        self.last_report: Dict = {}
+
+    @property
+    def is_alive(self) -> bool:
+        return self.process is not None and self.process.is_alive()
+
+class Supervisor:
+    """
+    Делит TWITCH_CHANNELS между N процессами (у каждого своё подключение twitchio,
+    кеши и БД каналов), перезапускает упавшие процессы с нарастающей паузой,
+    собирает метрики и при перекосе нагрузки перераспределяет каналы.
+    """
+
+    def __init__(self, channels: List[str], num_workers: int):
+        self.channels = list(channels)
+        self.num_workers = max(1, min(num_workers, len(self.channels)))
+        self.ctx = multiprocessing.get_context('spawn')
+        self.metrics_queue = self.ctx.Queue()
+        self.workers: Dict[int, WorkerHandle] = {}
+        self.stopping = False
+
+        # Нагрузка по каналам: сглаженные сообщения в секунду
+        self.channel_load: Dict[str, float] = {channel: 0.0 for channel in self.channels}
+        self._last_counts: Dict[str, int] = {}
+        self._last_report_time: Dict[str, float] = {}
+        self._last_rebalance = time.monotonic()
+        self._last_summary = time.monotonic()
+
+    def run(self):
+        """Основной цикл супервизора (блокирующий)"""
+        signal.signal(signal.SIGTERM, self._handle_signal)
+        signal.signal(signal.SIGINT, self._handle_signal)
+
+        for worker_id, shard in enumerate(self._round_robin(self.channels)):
+            self.workers[worker_id] = WorkerHandle(worker_id, shard)
+            self._start_worker(self.workers[worker_id])
+
+        logger.info(f"🧭 Супервизор: {len(self.channels)} каналов на {self.num_workers} процессов")
+
+        try:
+            while not self.stopping:
+                self._drain_metrics(timeout=1.0)
+                self._check_workers()
+
+                now = time.monotonic()
+                if now - self._last_summary >= config.SUPERVISOR_REPORT_INTERVAL:
+                    self._last_summary = now
+                    self._log_summary()
+                if now - self._last_rebalance >= config.SUPERVISOR_REBALANCE_INTERVAL:
+                    self._last_rebalance = now
+                    self._maybe_rebalance()
+        finally:
+            self._stop_all()
+
+    def _handle_signal(self, signum, frame):
+        logger.info("🚨 Супервизор: получен сигнал завершения")
+        self.stopping = True
+
+    def _round_robin(self, channels: List[str]) -> List[List[str]]:
+        shards = [[] for _ in range(self.num_workers)]
+        for i, channel in enumerate(channels):
+            shards[i % self.num_workers].append(channel)
+        return shards
+
+    def _start_worker(self, worker: WorkerHandle):
+        worker.process = self.ctx.Process(
+            target=worker_main,
+            args=(worker.worker_id, worker.channels, self.metrics_queue),
+            name=f"bot-worker-{worker.worker_id}",
+            daemon=False
+        )
+        worker.process.start()
+        worker.started_at = time.monotonic()
+        worker.restart_at = None
+        logger.info(f"▶️ Воркер {worker.worker_id} запущен (pid {worker.process.pid}): "
+                   f"{len(worker.channels)} каналов")
+
+    def _stop_worker(self, worker: WorkerHandle, timeout: float = 10.0):
+        self._stop_workers([worker], timeout)
+
+    def _stop_workers(self, workers: List[WorkerHandle], timeout: float = 10.0):
+        """
+        SIGTERM всем сразу (воркер корректно закрывает сервисы), затем ждём;
+        kill - только для тех, кто не уложился в timeout
+        """
+        running = [worker for worker in workers if worker.process is not None and worker.process.is_alive()]
+        for worker in running:
+            worker.process.terminate()
+        deadline = time.monotonic() + timeout
+        for worker in running:
+            worker.process.join(max(0.0, deadline - time.monotonic()))
+            if worker.process.is_alive():
+                logger.warning(f"⚠️ Воркер {worker.worker_id} не завершился за {timeout:.0f}с, kill")
+                worker.process.kill()
+                worker.process.join()
+        for worker in workers:
+            worker.process = None
+
+    def _stop_all(self):
+        self._stop_workers(list(self.workers.values()))
+        logger.info("👋 Все воркеры остановлены")
+
+    def _check_workers(self):
+        """Перезапускает упавшие воркеры с экспоненциальной паузой"""
+        now = time.monotonic()
+
+        for worker in self.workers.values():
+            if worker.is_alive:
+                continue
+
+            if worker.restart_at is None:
+                exit_code = worker.process.exitcode if worker.process else None
+                # Проработал долго - считаем, что серия падений закончилась
+                if now - worker.started_at > config.SUPERVISOR_MAX_RESTART_DELAY:
+                    worker.restarts = 0
+                delay = min(config.SUPERVISOR_MAX_RESTART_DELAY, 2 ** worker.restarts)
+                worker.restarts += 1
+                worker.restart_at = now + delay
+                logger.error(f"💥 Воркер {worker.worker_id} упал (код {exit_code}), "
+                            f"перезапуск через {delay}с")
+            elif now >= worker.restart_at:
+                self._start_worker(worker)
+
+    def _drain_metrics(self, timeout: float):
+        """Забирает отчёты воркеров и обновляет нагрузку каналов"""
+        try:
+            report = self.metrics_queue.get(timeout=timeout)
+        except queue.Empty:
+            return
+
+        while report is not None:
+            self._apply_report(report)
+            try:
+                report = self.metrics_queue.get_nowait()
+            except queue.Empty:
+                report = None
+
+    def _apply_report(self, report: Dict):
+        worker = self.workers.get(report.get('worker_id'))
+        if worker is None:
+            return
+        worker.last_report = report
+
+        now = time.monotonic()
+        alpha = config.SUPERVISOR_LOAD_SMOOTHING
+        for channel, count in report.get('channels', {}).items():
+            previous = self._last_counts.get(channel)
+            previous_time = self._last_report_time.get(channel)
+            self._last_counts[channel] = count
+            self._last_report_time[channel] = now
+
+            # Счётчики накопительные; после перезапуска воркера начинаются с нуля
+            if previous is None or previous_time is None or count < previous:
+                continue
+            rate = (count - previous) / max(1e-6, now - previous_time)
+            self.channel_load[channel] = (1 - alpha) * self.channel_load.get(channel, 0.0) + alpha * rate
+
+    def _worker_load(self, channels: List[str]) -> float:
+        return sum(self.channel_load.get(channel, 0.0) for channel in channels)
+
+    def _maybe_rebalance(self):
+        """Перераспределяет каналы, если самый загруженный воркер заметно выше среднего"""
+        loads = [self._worker_load(worker.channels) for worker in self.workers.values()]
+        total = sum(loads)
+        if total <= 0:
+            return
+
+        average = total / len(loads)
+        if max(loads) <= average * config.SUPERVISOR_IMBALANCE_THRESHOLD:
+            return
+
+        # Жадное распределение: самые нагруженные каналы - в наименее загруженный воркер
+        shards = {worker_id: [] for worker_id in self.workers}
+        shard_load = {worker_id: 0.0 for worker_id in self.workers}
+        for channel in sorted(self.channels, key=lambda c: self.channel_load.get(c, 0.0), reverse=True):
+            target = min(shard_load, key=lambda worker_id: (shard_load[worker_id], len(shards[worker_id])))
+            shards[target].append(channel)
+            shard_load[target] += self.channel_load.get(channel, 0.0)
+
+        new_max = max(shard_load.values())
+        if new_max >= max(loads) * 0.9:
+            return  # Выигрыш слишком мал, чтобы переподключать каналы
+
+        logger.info(f"⚖️ Перебалансировка: макс. нагрузка {max(loads):.2f} -> {new_max:.2f} сообщ/с")
+
+        changed = [worker for worker_id, worker in self.workers.items()
+                   if sorted(shards[worker_id]) != sorted(worker.channels)]
+        # Сначала останавливаем всех затронутых: канал не должен оказаться сразу в двух процессах
+        self._stop_workers(changed)
+        for worker in changed:
+            worker.channels = shards[worker.worker_id]
+            worker.restarts = 0
+            self._start_worker(worker)
+
+    def _log_summary(self):
+        """Сводные метрики по всем воркерам"""
+        total_rate = sum(self.channel_load.values())
+        alive = sum(1 for worker in self.workers.values() if worker.is_alive)
+
+        logger.info("=" * 60)
+        logger.info(f"🧭 Воркеров: {alive}/{len(self.workers)}, нагрузка: {total_rate:.2f} сообщ/с")
+        for worker in self.workers.values():
+            report = worker.last_report
+            logger.info(f"[воркер {worker.worker_id}] каналов: {len(worker.channels)}, "
+                       f"нагрузка: {self._worker_load(worker.channels):.2f} сообщ/с, "
+                       f"обработано: {report.get('messages_processed', 0)}, "
+                       f"CPU: {report.get('cpu_time', 0):.0f}с, "
+                       f"очередь: {report.get('queue_depth', 0)}, "
+                       f"задержка цикла: {report.get('loop_lag_ms', 0)}мс, "
+                       f"перезапусков: {worker.restarts}")
+        logger.info("=" * 60)
+
+def run_supervisor(num_workers: int):
+    """Запускает супервизор на всех каналах из конфигурации"""
+    if not config.TWITCH_CHANNELS:
+        raise ValueError("TWITCH_CHANNEL не задан")
+    Supervisor(config.TWITCH_CHANNELS, num_workers).run()
@@ -0,0 +1,142 @@
+# work_queue.py - Ограниченные очереди кандидатов на ответ по каналам
+import asyncio
+import logging
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Callable, Deque, Dict, Optional
+
+import config
+from clock import clock
+from features import MessageFeatures
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class WorkItem:
+    """Сообщение, принятое из чата и ждущее обработки воркером канала"""
+    message: Any
+    author: str
+    content: str
+    features: MessageFeatures
+    received_at: float = field(default_factory=clock.monotonic)
+
+    @property
+    def is_mentioned(self) -> bool:
+        return self.features.is_mentioned
+
+class ChannelWorkQueue:
+    """
+    Очередь между приёмом сообщений из IRC и генерацией ответов.
+    Приём только кладёт сообщение сюда, воркер канала забирает по одному.
+    Политики при переполнении:
+      - 'coalesce': пока воркер занят ответом, держим только самого свежего кандидата
+        (упоминания бота не вытесняются обычными сообщениями);
+      - 'drop_oldest': выбрасываем самое старое обычное сообщение.
+    Кандидаты старше max_age отбрасываются при выдаче - отвечать на них уже поздно.
+    Каждый выброшенный кандидат (dropped, coalesced, expired) передаётся в
+    on_discard: воркер его не увидит, а дешёвый учёт состояния канала нужен и ему.
+    """
+
+    def __init__(self, channel: str, maxsize: int, policy: str, max_age: float,
+                 on_discard: Optional[Callable[[WorkItem], None]] = None):
+        self.channel = channel
+        self.maxsize = maxsize
+        self.policy = policy
+        self.max_age = max_age
+        self.on_discard = on_discard
+        self.items: Deque[WorkItem] = deque()
+        self.busy = False  # Воркер сейчас обрабатывает кандидата
+        self._has_items = asyncio.Event()
+
+        # Метрики
+        self.enqueued = 0
+        self.processed = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.expired = 0
+        self.max_depth = 0
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def put(self, item: WorkItem):
+        """Добавляет кандидата, применяя политику противодавления"""
+        self.enqueued += 1
+
+        if self.policy == 'coalesce' and self.busy:
+            self._evict(keep=0)
+        elif len(self.items) >= self.maxsize:
+            self._evict(keep=self.maxsize - 1)
+
+        if len(self.items) >= self.maxsize:
+            # Очередь целиком из упоминаний - вытесняем самое старое
+            self._discard(self.items.popleft())
+            self.dropped += 1
+
+        self.items.append(item)
+        self.max_depth = max(self.max_depth, len(self.items))
+        self._has_items.set()
+
+    def _evict(self, keep: int):
+        """Убирает обычные сообщения (не упоминания), начиная со старых, пока не останется keep"""
+        if len(self.items) <= keep:
+            return
+
+        kept: Deque[WorkItem] = deque()
+        to_remove = len(self.items) - keep
+        for item in self.items:
+            if to_remove > 0 and not item.is_mentioned:
+                to_remove -= 1
+                if self.policy == 'coalesce' and self.busy:
+                    self.coalesced += 1
+                else:
+                    self.dropped += 1
+                self._discard(item)
+                continue
+            kept.append(item)
+        self.items = kept
+
+    async def get(self) -> WorkItem:
+        """Ждёт и возвращает следующего актуального кандидата"""
+        while True:
+            item = self.get_nowait()
+            if item is not None:
+                return item
+            self._has_items.clear()
+            await self._has_items.wait()
+
+    def get_nowait(self) -> Optional[WorkItem]:
+        """Следующий актуальный кандидат или None"""
+        now = clock.monotonic()
+        while self.items:
+            item = self.items.popleft()
+            if not item.is_mentioned and now - item.received_at > self.max_age:
+                self.expired += 1
+                self._discard(item)
+                continue
+            return item
+        return None
+
+    def _discard(self, item: WorkItem):
+        if self.on_discard is not None:
+            self.on_discard(item)
+
+    def get_stats(self) -> Dict:
+        return {
+            'depth': len(self.items),
+            'max_depth': self.max_depth,
+            'enqueued': self.enqueued,
+            'processed': self.processed,
+            'dropped': self.dropped,
+            'coalesced': self.coalesced,
+            'expired': self.expired,
+        }
+
+def create_work_queue(channel: str, on_discard: Optional[Callable[[WorkItem], None]] = None) -> ChannelWorkQueue:
+    return ChannelWorkQueue(
+        channel=channel,
+        maxsize=config.WORK_QUEUE_MAXSIZE,
+        policy=config.WORK_QUEUE_POLICY,
+        max_age=config.WORK_QUEUE_MAX_AGE,
+        on_discard=on_discard
+    )